@@ -9,6 +9,8 @@ import logging
 from werkzeug.middleware.proxy_fix import ProxyFix
 from app.config import load_config
 from app.observability import register_observability
+from app.database import register_database
+from app.serialization import register_json
 
 load_dotenv()
 
@@ -19,6 +21,7 @@ socketio = SocketIO()
 def create_app():
     app = Flask(__name__, instance_relative_config=True)
     app.config.from_mapping(load_config(instance_path=app.instance_path))
+    register_json(app)
 
     if app.config.get("TRUST_PROXY_HEADERS"):
         app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_port=1, x_prefix=1)
@@ -27,21 +30,76 @@ def create_app():
 
     CORS(app, resources={r"/api/*": {"origins": app.config["CORS_ORIGINS"]}})
     db.init_app(app)
+    register_database(app, db)
     jwt.init_app(app)
-    socketio.init_app(app, cors_allowed_origins=app.config["SOCKETIO_CORS_ORIGINS"])
+    from app.services.socket_queue import message_queue_options
+    socketio.init_app(
+        app,
+        cors_allowed_origins=app.config["SOCKETIO_CORS_ORIGINS"],
+        async_mode=app.config["SOCKETIO_ASYNC_MODE"],
+        **message_queue_options(app.config),
+    )
 
     register_observability(app)
+
+    from app.services.marker_index import marker_index
+    from app.services.marker_clusters import marker_clusters
+    from app.services.route_cache import route_cache
+    from app.services.routing import routing_service
+    from app.services.chat_writer import chat_writer
+    from app.services.chat_history import chat_history
+    from app.services.presence import presence
+    from app.services.media_store import media_store
+    from app.services.admission import admission
+    from app.services.password_hasher import password_hasher
+    from app.services.user_cache import user_cache
+    from app.services.avatar_pipeline import avatar_pipeline
+    from app.services.lifecycle import lifecycle
+    from app.services.marker_sync import marker_sync
+    from app.services.marker_bulk import marker_bulk
+    from app.services.search import search_index
+    marker_index.init_app(app)
+    marker_clusters.init_app(app)
+    route_cache.init_app(app)
+    routing_service.init_app(app)
+    chat_writer.init_app(app)
+    chat_history.init_app(app)
+    presence.init_app(app)
+    media_store.init_app(app)
+    admission.init_app(app)
+    password_hasher.init_app(app)
+    user_cache.init_app(app)
+    avatar_pipeline.init_app(app)
+    lifecycle.init_app(app)
+    marker_sync.init_app(app)
+    marker_bulk.init_app(app)
+    search_index.init_app(app)
+
+    from app.metrics import register_metrics
+    from app.profiling import register_profiling
+    register_metrics(app, db)
+    register_profiling(app, db)
     
     from app.routes.auth import auth_bp
     from app.routes.map import map_bp
     from app.routes.chat import chat_bp
     from app.routes.profile import profile_bp
     from app.routes.health import health_bp
+    from app.routes.media import media_bp
+    from app.routes.metrics import metrics_bp
+    from app.routes.debug import debug_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(map_bp, url_prefix='/api/map')
     app.register_blueprint(chat_bp, url_prefix='/api/chat')
     app.register_blueprint(profile_bp, url_prefix='/api/profile')
+    app.register_blueprint(media_bp, url_prefix='/api/media')
+    app.register_blueprint(debug_bp, url_prefix='/api/debug')
     app.register_blueprint(health_bp)
+    app.register_blueprint(metrics_bp)
+    admission.check_costs()
+
+    from app.cli import register_cli
+    register_cli(app)
     
     return app
@@ -0,0 +1,132 @@
+import click
+from flask.cli import AppGroup
+from sqlalchemy import text
+
+from app import db
+
+media_cli = AppGroup('media', help='Chat media store maintenance.')
+db_cli = AppGroup('db', help='Database maintenance.')
+markers_cli = AppGroup('markers', help='Map marker maintenance.')
+search_cli = AppGroup('search', help='Full-text search index maintenance.')
+
+
+@db_cli.command('report')
+def db_report():
+    """Print the effective engine, pool and SQLite pragma settings."""
+    from app.database import database_report
+
+    for key, value in database_report(db).items():
+        click.echo(f'{key}: {value}')
+
+
+@media_cli.command('extract-inline')
+@click.option('--batch-size', default=200, show_default=True, help='Messages rewritten per transaction.')
+@click.option('--vacuum/--no-vacuum', default=False, help='VACUUM the SQLite file afterwards to reclaim space.')
+def extract_inline(batch_size, vacuum):
+    """Move base64 data URLs stored in chat messages into the media store."""
+    from app.models.chat_message import ChatMessage
+    from app.services.media_store import media_store, MediaError
+
+    last_id = 0
+    migrated = skipped = bytes_moved = 0
+    digests = set()
+    while True:
+        rows = (
+            ChatMessage.query
+            .filter(ChatMessage.id > last_id, ChatMessage.content.like('data:%'))
+            .order_by(ChatMessage.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        for message in rows:
+            last_id = message.id
+            inline_size = len(message.content)
+            try:
+                media = media_store.save_data_url(message.content)
+            except MediaError as exc:
+                click.echo(f'message {message.id}: {exc}', err=True)
+                media = None
+            if media is None:
+                skipped += 1
+                continue
+            message.content = media.url
+            digests.add(media.sha256)
+            migrated += 1
+            bytes_moved += inline_size
+        db.session.commit()
+        click.echo(f'... up to message {last_id}: {migrated} migrated')
+
+    click.echo(
+        f'Migrated {migrated} messages into {len(digests)} media files '
+        f'({bytes_moved / 1024 / 1024:.1f} MiB inline data removed), skipped {skipped}.'
+    )
+    if vacuum and migrated:
+        # VACUUM 不能在事务中执行
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text('VACUUM'))
+        click.echo('Database vacuumed.')
+
+
+@db_cli.command('upgrade')
+def db_upgrade():
+    """Create missing tables and apply pending schema migrations."""
+    from app.migrations import current_version, upgrade
+
+    db.create_all()
+    applied = upgrade(db.engine)
+    click.echo(f'Applied migrations: {applied or "none"}; schema version {current_version(db.engine)}.')
+
+
+@db_cli.command('current')
+def db_current():
+    """Show the applied schema version and any pending migrations."""
+    from app.migrations import current_version, pending_migrations
+
+    click.echo(f'Schema version: {current_version(db.engine)}')
+    for migration in pending_migrations(db.engine):
+        click.echo(f'pending: {migration.VERSION} {migration.DESCRIPTION}')
+
+
+@db_cli.command('check-indexes')
+def db_check_indexes():
+    """EXPLAIN the hot queries and fail if any of them misses its index."""
+    from app.migrations.explain import check_indexes
+
+    failed = False
+    for result in check_indexes(db.engine):
+        status = 'ok' if result['uses_index'] else 'MISSING'
+        failed = failed or not result['uses_index']
+        click.echo(f"[{status}] {result['check']} -> {result['index']}")
+        click.echo('    ' + result['plan'].replace('\n', '\n    '))
+    if failed:
+        raise SystemExit(1)
+
+
+@markers_cli.command('prune-tombstones')
+@click.option('--days', type=float, default=None, help='Keep tombstones younger than this (default MARKER_TOMBSTONE_DAYS).')
+def markers_prune_tombstones(days):
+    """Delete old marker tombstones; clients behind the pruned revision reload the full list."""
+    from app.services.marker_sync import marker_sync
+
+    removed = marker_sync.prune(days)
+    click.echo(f'Removed {removed} tombstones; current revision {marker_sync.current_revision()}.')
+
+
+@search_cli.command('rebuild')
+def search_rebuild():
+    """Rebuild the marker and chat full-text indexes from their tables."""
+    from app.services.search import search_index
+
+    if not search_index.rebuild():
+        click.echo('No FTS5 index on this database; searches use LIKE.')
+        return
+    click.echo('Search indexes rebuilt.')
+
+
+def register_cli(app):
+    app.cli.add_command(media_cli)
+    app.cli.add_command(db_cli)
+    app.cli.add_command(markers_cli)
+    app.cli.add_command(search_cli)
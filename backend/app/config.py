@@ -19,6 +19,15 @@ def _get_int(value: Optional[str], default: int) -> int:
         return default
 
 
+def _get_float(value: Optional[str], default: float) -> float:
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
 def _get_csv(value: Optional[str]) -> Union[List[str], str]:
     if value is None:
         return ["http://localhost:3000"]
@@ -29,6 +38,38 @@ def _get_csv(value: Optional[str]) -> Union[List[str], str]:
     return [v for v in items if v]
 
 
+def _sqlite_url(value: Optional[str], instance_dir: Path) -> Optional[str]:
+    prefix = "sqlite:///"
+    if not value or not value.startswith(prefix) or os.path.isabs(value[len(prefix):]):
+        return value
+    return prefix + (instance_dir / value[len(prefix):]).as_posix()
+
+
+def _database_url(value: Optional[str], instance_dir: Path) -> str:
+    if not value:
+        return f"sqlite:///{(instance_dir / 'app.db').as_posix()}"
+    # Heroku 等平台仍使用旧的 postgres:// 前缀
+    if value.startswith("postgres://"):
+        value = "postgresql://" + value[len("postgres://"):]
+    if value.startswith("sqlite:///") and value != "sqlite:///:memory:":
+        return _sqlite_url(value, instance_dir)
+    return value
+
+
+def _engine_options(database_url: str) -> dict:
+    if database_url.startswith("sqlite"):
+        # 等锁由 busy_timeout 控制，sqlite3 的 timeout 保持一致
+        busy_timeout_ms = _get_int(os.getenv("SQLITE_BUSY_TIMEOUT_MS"), default=5000)
+        return {"connect_args": {"timeout": busy_timeout_ms / 1000}}
+    return {
+        "pool_size": _get_int(os.getenv("DB_POOL_SIZE"), default=10),
+        "max_overflow": _get_int(os.getenv("DB_MAX_OVERFLOW"), default=20),
+        "pool_timeout": _get_int(os.getenv("DB_POOL_TIMEOUT"), default=30),
+        "pool_recycle": _get_int(os.getenv("DB_POOL_RECYCLE"), default=1800),
+        "pool_pre_ping": _get_bool(os.getenv("DB_POOL_PRE_PING"), default=True),
+    }
+
+
 def load_config(*, instance_path: str) -> dict:
     env = os.getenv("APP_ENV") or os.getenv("FLASK_ENV") or "development"
     debug = _get_bool(os.getenv("FLASK_DEBUG"), default=(env == "development"))
@@ -50,9 +91,30 @@ def load_config(*, instance_path: str) -> dict:
 
     instance_dir = Path(instance_path)
     instance_dir.mkdir(parents=True, exist_ok=True)
-    db_path = instance_dir / "app.db"
+    database_url = _database_url(os.getenv("DATABASE_URL") or None, instance_dir)
+
+    route_cache_path = os.getenv("ROUTE_CACHE_PATH") or None
+    if route_cache_path and not os.path.isabs(route_cache_path):
+        route_cache_path = (instance_dir / route_cache_path).as_posix()
+
+    campus_graph_path = os.getenv("CAMPUS_GRAPH_PATH") or None
+    if campus_graph_path and not os.path.isabs(campus_graph_path):
+        campus_graph_path = (instance_dir / campus_graph_path).as_posix()
+
+    # sqlite:/// 相对路径同样落在 instance 目录，供同机多进程共享
+    message_queue = _sqlite_url(os.getenv("SOCKETIO_MESSAGE_QUEUE") or None, instance_dir)
+    presence_url = _sqlite_url(os.getenv("PRESENCE_URL") or None, instance_dir)
+    if presence_url is None and message_queue and message_queue.startswith(("sqlite:///", "redis://", "rediss://")):
+        presence_url = message_queue
+
+    media_root = os.getenv("MEDIA_ROOT") or (instance_dir / "media").as_posix()
+    if not os.path.isabs(media_root):
+        media_root = (instance_dir / media_root).as_posix()
 
     max_upload_mb = _get_int(os.getenv("MAX_UPLOAD_MB"), default=5)
+    avatar_root = os.getenv("AVATAR_ROOT") or (instance_dir / "avatars").as_posix()
+    if not os.path.isabs(avatar_root):
+        avatar_root = (instance_dir / avatar_root).as_posix()
     access_token_days = _get_int(os.getenv("JWT_ACCESS_TOKEN_DAYS"), default=7)
 
     return {
@@ -60,11 +122,93 @@ def load_config(*, instance_path: str) -> dict:
         "DEBUG": debug,
         "SECRET_KEY": secret_key,
         "JWT_SECRET_KEY": jwt_secret_key,
-        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path.as_posix()}",
+        "SQLALCHEMY_DATABASE_URI": database_url,
+        "SQLALCHEMY_ENGINE_OPTIONS": _engine_options(database_url),
         "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        "SQLITE_JOURNAL_MODE": (os.getenv("SQLITE_JOURNAL_MODE") or "WAL").strip().upper(),
+        "SQLITE_SYNCHRONOUS": (os.getenv("SQLITE_SYNCHRONOUS") or "NORMAL").strip().upper(),
+        "SQLITE_BUSY_TIMEOUT_MS": _get_int(os.getenv("SQLITE_BUSY_TIMEOUT_MS"), default=5000),
+        "SQLITE_MMAP_SIZE": _get_int(os.getenv("SQLITE_MMAP_SIZE"), default=256 * 1024 * 1024),
+        "SQLITE_CACHE_SIZE_KB": _get_int(os.getenv("SQLITE_CACHE_SIZE_KB"), default=20000),
         "MAX_CONTENT_LENGTH": max_upload_mb * 1024 * 1024,
+        "MEDIA_ROOT": media_root,
+        "MEDIA_MAX_BYTES": max_upload_mb * 1024 * 1024,
+        "AVATAR_ROOT": avatar_root,
+        "AVATAR_MAX_BYTES": max_upload_mb * 1024 * 1024,
+        "AVATAR_WORKERS": _get_int(os.getenv("AVATAR_WORKERS"), default=2),
+        "AVATAR_FORMAT": (os.getenv("AVATAR_FORMAT") or "webp").strip().lower(),
+        "AVATAR_QUALITY": _get_int(os.getenv("AVATAR_QUALITY"), default=85),
         "JWT_ACCESS_TOKEN_EXPIRES": timedelta(days=access_token_days),
         "CORS_ORIGINS": _get_csv(os.getenv("CORS_ORIGINS")),
         "SOCKETIO_CORS_ORIGINS": _get_csv(os.getenv("SOCKETIO_CORS_ORIGINS") or os.getenv("CORS_ORIGINS")),
+        "SOCKETIO_ASYNC_MODE": (os.getenv("SOCKETIO_ASYNC_MODE") or "threading").strip().lower(),
+        "SOCKETIO_MESSAGE_QUEUE": message_queue,
+        "SOCKETIO_CHANNEL": os.getenv("SOCKETIO_CHANNEL") or "campus-explorer",
+        "SOCKETIO_QUEUE_POLL_MS": _get_int(os.getenv("SOCKETIO_QUEUE_POLL_MS"), default=20),
+        "PRESENCE_URL": presence_url,
+        "PRESENCE_TTL_SECONDS": _get_float(os.getenv("PRESENCE_TTL_SECONDS"), default=60.0),
+        "JSON_BACKEND": (os.getenv("JSON_BACKEND") or "auto").strip().lower(),
+        "SERVER_WORKERS": _get_int(os.getenv("SERVER_WORKERS"), default=1),
+        "SERVER_MAX_CONNECTIONS": _get_int(os.getenv("SERVER_MAX_CONNECTIONS"), default=1000),
+        "SERVER_BACKLOG": _get_int(os.getenv("SERVER_BACKLOG"), default=2048),
+        "SERVER_READINESS_GRACE_SECONDS": _get_float(os.getenv("SERVER_READINESS_GRACE_SECONDS"), default=5.0),
+        "SERVER_DRAIN_SECONDS": _get_float(os.getenv("SERVER_DRAIN_SECONDS"), default=30.0),
         "TRUST_PROXY_HEADERS": _get_bool(os.getenv("TRUST_PROXY_HEADERS"), default=False),
+        "MARKER_INDEX_CELL_DEG": _get_float(os.getenv("MARKER_INDEX_CELL_DEG"), default=0.002),
+        "CLUSTER_MAX_ZOOM": _get_int(os.getenv("CLUSTER_MAX_ZOOM"), default=18),
+        "MARKER_INDEX_SYNC_SECONDS": _get_float(os.getenv("MARKER_INDEX_SYNC_SECONDS"), default=0.5),
+        "MARKER_TOMBSTONE_DAYS": _get_float(os.getenv("MARKER_TOMBSTONE_DAYS"), default=30.0),
+        "MARKER_DELTA_MAX": _get_int(os.getenv("MARKER_DELTA_MAX"), default=5000),
+        "MARKER_BULK_CHUNK": _get_int(os.getenv("MARKER_BULK_CHUNK"), default=1000),
+        "MARKER_BULK_MAX": _get_int(os.getenv("MARKER_BULK_MAX"), default=5000),
+        "MARKER_IMPORT_MAX_BYTES": _get_int(os.getenv("MARKER_IMPORT_MAX_MB"), default=200) * 1024 * 1024,
+        "SEARCH_BACKEND": (os.getenv("SEARCH_BACKEND") or "auto").strip().lower(),
+        "SEARCH_RANK_WINDOW": _get_int(os.getenv("SEARCH_RANK_WINDOW"), default=1000),
+        "ROUTE_CACHE_MAX_ENTRIES": _get_int(os.getenv("ROUTE_CACHE_MAX_ENTRIES"), default=1024),
+        "ROUTE_CACHE_TTL_SECONDS": _get_int(os.getenv("ROUTE_CACHE_TTL_SECONDS"), default=21600),
+        "ROUTE_CACHE_PRECISION": _get_int(os.getenv("ROUTE_CACHE_PRECISION"), default=4),
+        "ROUTE_CACHE_PATH": route_cache_path,
+        "ROUTE_CACHE_DISK_MAX_ENTRIES": _get_int(os.getenv("ROUTE_CACHE_DISK_MAX_ENTRIES"), default=50000),
+        "ORS_API_KEY": os.getenv("ORS_API_KEY") or None,
+        "ORS_BASE_URL": os.getenv("ORS_BASE_URL") or "https://api.openrouteservice.org",
+        "ORS_POOL_SIZE": _get_int(os.getenv("ORS_POOL_SIZE"), default=10),
+        "ORS_MAX_CONCURRENCY": _get_int(os.getenv("ORS_MAX_CONCURRENCY"), default=10),
+        "ORS_TIMEOUT_SECONDS": _get_float(os.getenv("ORS_TIMEOUT_SECONDS"), default=10.0),
+        "ORS_RETRIES": _get_int(os.getenv("ORS_RETRIES"), default=1),
+        "ORS_BREAKER_FAILURES": _get_int(os.getenv("ORS_BREAKER_FAILURES"), default=5),
+        "ORS_BREAKER_RESET_SECONDS": _get_float(os.getenv("ORS_BREAKER_RESET_SECONDS"), default=30.0),
+        "ROUTING_BACKEND": (os.getenv("ROUTING_BACKEND") or "auto").strip().lower(),
+        "CAMPUS_GRAPH_PATH": campus_graph_path,
+        "CAMPUS_GRAPH_MAX_SNAP_M": _get_float(os.getenv("CAMPUS_GRAPH_MAX_SNAP_M"), default=300.0),
+        "ROUTE_PARALLELISM": _get_int(os.getenv("ROUTE_PARALLELISM"), default=4),
+        "PASSWORD_HASH_METHOD": os.getenv("PASSWORD_HASH_METHOD") or "pbkdf2:sha256:600000",
+        "PASSWORD_HASH_WORKERS": _get_int(os.getenv("PASSWORD_HASH_WORKERS"), default=2),
+        "PASSWORD_HASH_TIMEOUT_SECONDS": _get_float(os.getenv("PASSWORD_HASH_TIMEOUT_SECONDS"), default=10.0),
+        "USER_CACHE_MAX_ENTRIES": _get_int(os.getenv("USER_CACHE_MAX_ENTRIES"), default=4096),
+        "USER_CACHE_TTL_SECONDS": _get_float(os.getenv("USER_CACHE_TTL_SECONDS"), default=300.0),
+        "METRICS_ENABLED": _get_bool(os.getenv("METRICS_ENABLED"), default=True),
+        "METRICS_TOKEN": os.getenv("METRICS_TOKEN") or None,
+        "ADMIN_TOKEN": os.getenv("ADMIN_TOKEN") or None,
+        "SLOW_REQUEST_MS": _get_float(os.getenv("SLOW_REQUEST_MS"), default=1000.0),
+        "SLOW_REQUEST_BUFFER": _get_int(os.getenv("SLOW_REQUEST_BUFFER"), default=100),
+        "SLOW_REQUEST_MAX_STATEMENTS": _get_int(os.getenv("SLOW_REQUEST_MAX_STATEMENTS"), default=50),
+        "PROFILER_INTERVAL_MS": _get_float(os.getenv("PROFILER_INTERVAL_MS"), default=5.0),
+        "PROFILER_MAX_SECONDS": _get_float(os.getenv("PROFILER_MAX_SECONDS"), default=60.0),
+        "RATE_LIMIT_ENABLED": _get_bool(os.getenv("RATE_LIMIT_ENABLED"), default=True),
+        "CHAT_RATE_PER_SECOND": _get_float(os.getenv("CHAT_RATE_PER_SECOND"), default=5.0),
+        "CHAT_BURST": _get_float(os.getenv("CHAT_BURST"), default=10.0),
+        "CHAT_USER_RATE_PER_SECOND": _get_float(os.getenv("CHAT_USER_RATE_PER_SECOND"), default=8.0),
+        "CHAT_USER_BURST": _get_float(os.getenv("CHAT_USER_BURST"), default=20.0),
+        "CHAT_IP_RATE_PER_SECOND": _get_float(os.getenv("CHAT_IP_RATE_PER_SECOND"), default=20.0),
+        "CHAT_IP_BURST": _get_float(os.getenv("CHAT_IP_BURST"), default=50.0),
+        "API_RATE_PER_SECOND": _get_float(os.getenv("API_RATE_PER_SECOND"), default=10.0),
+        "API_BURST": _get_float(os.getenv("API_BURST"), default=30.0),
+        "CHAT_MAX_TEXT_CHARS": _get_int(os.getenv("CHAT_MAX_TEXT_CHARS"), default=2000),
+        "SOCKET_SLOW_QUEUE_DEPTH": _get_int(os.getenv("SOCKET_SLOW_QUEUE_DEPTH"), default=200),
+        "CHAT_HISTORY_BUFFER": _get_int(os.getenv("CHAT_HISTORY_BUFFER"), default=50),
+        "CHAT_WRITE_BEHIND": _get_bool(os.getenv("CHAT_WRITE_BEHIND"), default=True),
+        "CHAT_QUEUE_MAX": _get_int(os.getenv("CHAT_QUEUE_MAX"), default=10000),
+        "CHAT_FLUSH_BATCH": _get_int(os.getenv("CHAT_FLUSH_BATCH"), default=200),
+        "CHAT_FLUSH_INTERVAL_MS": _get_int(os.getenv("CHAT_FLUSH_INTERVAL_MS"), default=50),
+        "CHAT_QUEUE_PUT_TIMEOUT_MS": _get_int(os.getenv("CHAT_QUEUE_PUT_TIMEOUT_MS"), default=500),
     }
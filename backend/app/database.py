@@ -0,0 +1,80 @@
+import logging
+
+from sqlalchemy import event, text
+
+logger = logging.getLogger(__name__)
+
+SQLITE_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+SQLITE_SYNCHRONOUS_MODES = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+
+def _sqlite_pragmas(config) -> list:
+    journal_mode = config.get("SQLITE_JOURNAL_MODE", "WAL")
+    synchronous = config.get("SQLITE_SYNCHRONOUS", "NORMAL")
+    if journal_mode not in SQLITE_JOURNAL_MODES:
+        raise RuntimeError(f"Invalid SQLITE_JOURNAL_MODE: {journal_mode}")
+    if synchronous not in SQLITE_SYNCHRONOUS_MODES:
+        raise RuntimeError(f"Invalid SQLITE_SYNCHRONOUS: {synchronous}")
+    return [
+        f"PRAGMA journal_mode={journal_mode}",
+        f"PRAGMA synchronous={synchronous}",
+        f"PRAGMA busy_timeout={int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}",
+        f"PRAGMA mmap_size={int(config.get('SQLITE_MMAP_SIZE', 0))}",
+        # 负数表示以 KiB 为单位
+        f"PRAGMA cache_size=-{int(config.get('SQLITE_CACHE_SIZE_KB', 2000))}",
+    ]
+
+
+def register_database(app, db):
+    """Attach per-connection tuning to the app's engine.
+
+    SQLite pragmas are connection-scoped, so they are applied from the pool's
+    ``connect`` event and hold for every pooled connection.
+    """
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != "sqlite":
+        return
+
+    pragmas = _sqlite_pragmas(app.config)
+
+    @event.listens_for(engine, "connect")
+    def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def database_report(db) -> dict:
+    """Effective database settings, read back from a live connection."""
+    engine = db.engine
+    pool = engine.pool
+    report = {
+        "url": engine.url.render_as_string(hide_password=True),
+        "dialect": engine.dialect.name,
+        "driver": engine.dialect.driver,
+        "pool": type(pool).__name__,
+    }
+    for attr, key in (("size", "pool_size"), ("_max_overflow", "max_overflow"), ("_timeout", "pool_timeout"),
+                      ("_recycle", "pool_recycle"), ("_pre_ping", "pool_pre_ping")):
+        value = getattr(pool, attr, None)
+        if callable(value):
+            value = value()
+        if value is not None:
+            report[key] = value
+
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as conn:
+            for name in ("journal_mode", "synchronous", "busy_timeout", "mmap_size", "cache_size"):
+                report[name] = conn.execute(text(f"PRAGMA {name}")).scalar()
+    return report
+
+
+def log_database_report(app, db):
+    with app.app_context():
+        report = database_report(db)
+    app.logger.info("database_config: %s", ", ".join(f"{k}={v}" for k, v in report.items()))
+    return report
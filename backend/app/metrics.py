@@ -0,0 +1,371 @@
+import bisect
+import logging
+import threading
+import time
+from functools import wraps
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from app.profiling import record_slow_event, slow_requests
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', '_lock')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        # 按桶计数，输出时再累加，观测路径只有一次二分查找和一次加锁
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self) -> Tuple[list, float]:
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class _Family:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        self._default = None if self.labelnames else self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Child for one combination of label values (pass them as strings)."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects labels {self.labelnames}')
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _items(self):
+        with self._lock:
+            items = list(self._children.items())
+        return sorted(items, key=lambda item: item[0])
+
+    def header(self) -> list:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Family):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def render(self) -> list:
+        lines = self.header()
+        for values, child in self._items():
+            lines.append(f'{self.name}_total{_labels(self.labelnames, values)} {_number(child.value)}')
+        return lines
+
+
+class Gauge(_Family):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def render(self) -> list:
+        lines = self.header()
+        for values, child in self._items():
+            lines.append(f'{self.name}{_labels(self.labelnames, values)} {_number(child.value)}')
+        return lines
+
+
+class Histogram(_Family):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def render(self) -> list:
+        lines = self.header()
+        for values, child in self._items():
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, values)} {repr(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, values)} {cumulative}')
+        return lines
+
+
+class GaugeFunction(_Family):
+    """Gauge read at scrape time from ``fn``.
+
+    ``fn`` returns a number, or a dict mapping label-value tuples to numbers.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, fn: Callable, labelnames: Sequence[str] = ()):
+        self.fn = fn
+        super().__init__(name, documentation, labelnames)
+
+    def labels(self, *values):
+        return None
+
+    def render(self) -> list:
+        try:
+            value = self.fn()
+        except Exception:
+            logger.exception('metrics_gauge_failed', extra={'metric': self.name})
+            return []
+        lines = self.header()
+        if isinstance(value, dict):
+            for values, number in sorted(value.items()):
+                if number is not None:
+                    lines.append(f'{self.name}{_labels(self.labelnames, values)} {_number(number)}')
+        elif value is not None:
+            lines.append(f'{self.name} {_number(value)}')
+        return lines
+
+
+class MetricsRegistry:
+    """In-process metric families rendered in the Prometheus text format.
+
+    Every worker process keeps its own registry; scrape each worker (or sum
+    across them) when running several.
+    """
+
+    def __init__(self):
+        self._families: Dict[str, _Family] = {}
+        self._lock = threading.Lock()
+
+    def register(self, family: _Family) -> _Family:
+        with self._lock:
+            self._families[family.name] = family
+        return family
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_function(self, name, documentation, fn, labelnames=()) -> GaugeFunction:
+        return self.register(GaugeFunction(name, documentation, fn, labelnames))
+
+    def render(self) -> str:
+        with self._lock:
+            families = list(self._families.values())
+        lines = []
+        for family in families:
+            lines.extend(family.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+HTTP_LATENCY = registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route template.', ('method', 'route', 'status'))
+HTTP_IN_FLIGHT = registry.gauge('http_requests_in_flight', 'HTTP requests being served.')
+HTTP_DB_QUERIES = registry.histogram(
+    'http_request_db_queries', 'SQL statements executed per HTTP request.', ('route',), COUNT_BUCKETS)
+HTTP_DB_TIME = registry.histogram(
+    'http_request_db_seconds', 'Time spent in SQL statements per HTTP request.', ('route',), DB_BUCKETS)
+DB_QUERY_LATENCY = registry.histogram(
+    'db_query_duration_seconds', 'SQL statement latency by statement type.', ('statement',), DB_BUCKETS)
+SOCKET_LATENCY = registry.histogram(
+    'socketio_event_duration_seconds', 'Socket.IO handler latency by event.', ('event',))
+SOCKET_ERRORS = registry.counter(
+    'socketio_event_errors', 'Socket.IO handlers that raised.', ('event',))
+UPSTREAM_LATENCY = registry.histogram(
+    'upstream_request_duration_seconds', 'Upstream HTTP latency (e.g. ORS) by outcome.', ('upstream', 'outcome'))
+UPSTREAM_REJECTED = registry.counter(
+    'upstream_rejected', 'Upstream calls refused locally (circuit open or too many in flight).',
+    ('upstream', 'reason'))
+CHAT_MESSAGES_DROPPED = registry.counter(
+    'chat_messages_dropped', 'Chat messages that could not be saved, even on their own after a failed batch.')
+ADMISSION_EVENTS = registry.counter(
+    'admission_events', 'Admission rejections (chat_rate_limited, api_rate_limited, chat_payload_rejected) '
+    'and slow_consumer_skips.', ('event',))
+PROCESS_START = registry.gauge('process_start_time_seconds', 'Start time of the process since the epoch.')
+PROCESS_START.set(time.time())
+
+
+def route_label() -> str:
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def timed_event(name: str):
+    """Record the latency of a Socket.IO handler; place it below ``@socketio.on``."""
+    histogram = SOCKET_LATENCY.labels(name)
+    errors = SOCKET_ERRORS.labels(name)
+
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            slow_requests.start_request()
+            started = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                histogram.observe(elapsed)
+                record_slow_event(name, elapsed)
+        return wrapper
+    return decorator
+
+
+def _statement_type(statement: str) -> str:
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+    return keyword if keyword in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'PRAGMA') else 'OTHER'
+
+
+def _instrument_engine(engine):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_metrics_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        DB_QUERY_LATENCY.labels(_statement_type(statement)).observe(elapsed)
+        if has_request_context():
+            g.db_queries = g.get('db_queries', 0) + 1
+            g.db_seconds = g.get('db_seconds', 0.0) + elapsed
+
+
+def _register_gauges(db):
+    from app.services.admission import admission
+    from app.services.chat_writer import chat_writer
+    from app.services.presence import presence
+    from app.services.route_cache import route_cache
+    from app.services.upstream import upstream_stats
+    from app.services.user_cache import user_cache
+
+    def pool_checked_out():
+        checkedout = getattr(db.engine.pool, 'checkedout', None)
+        return checkedout() if checkedout else None
+
+    gauges = (
+        ('chat_online_users', 'Users online across all workers.', presence.count),
+        ('socketio_local_connections', 'Chat sockets attached to this worker.', presence.local_count),
+        ('chat_write_queue_depth', 'Chat messages waiting for the background writer.', chat_writer.depth),
+        ('chat_lagging_sockets', 'Sockets currently skipped by broadcasts as slow consumers.',
+         lambda: admission.stats()['lagging_sockets']),
+        ('route_cache_entries', 'Routes held in the in-memory route cache.', lambda: len(route_cache)),
+        ('user_cache_entries', 'Serialized users held in the user cache.', lambda: user_cache.stats()['size']),
+        ('db_pool_checked_out', 'Database connections currently checked out.', pool_checked_out),
+    )
+    for name, documentation, fn in gauges:
+        registry.gauge_function(name, documentation, fn)
+    registry.gauge_function(
+        'upstream_in_flight', 'Upstream calls in flight.',
+        lambda: {(name, ): stats['in_flight'] for name, stats in upstream_stats().items()}, ('upstream',))
+
+
+def register_metrics(app, db):
+    """Instrument the app's database engine and register the scrape-time gauges."""
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    with app.app_context():
+        _instrument_engine(db.engine)
+    _register_gauges(db)
+
+
+def request_db_stats() -> Optional[Tuple[int, float]]:
+    if not has_request_context():
+        return None
+    return g.get('db_queries', 0), g.get('db_seconds', 0.0)
@@ -0,0 +1,82 @@
+"""Versioned schema migrations.
+
+``db.create_all()`` only creates missing tables; anything that changes an
+existing database (indexes, columns, triggers) is a numbered migration in
+this package. Applied versions are recorded in ``schema_version``.
+"""
+import logging
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from . import m0001_marker_revisions, m0002_search_index
+
+logger = logging.getLogger(__name__)
+
+# 按版本号顺序追加，已发布的迁移不要修改
+MIGRATIONS = [
+    m0001_marker_revisions,
+    m0002_search_index,
+]
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_version ('
+        'version INTEGER PRIMARY KEY, description VARCHAR(200) NOT NULL, applied_at TIMESTAMP NOT NULL)'
+    ))
+
+
+def applied_versions(engine) -> List[int]:
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        return [row[0] for row in conn.execute(text('SELECT version FROM schema_version ORDER BY version'))]
+
+
+def current_version(engine) -> int:
+    versions = applied_versions(engine)
+    return versions[-1] if versions else 0
+
+
+def pending_migrations(engine) -> list:
+    applied = set(applied_versions(engine))
+    return [m for m in MIGRATIONS if m.VERSION not in applied]
+
+
+def upgrade(engine) -> List[int]:
+    """Apply every pending migration, each in its own transaction."""
+    done = []
+    for migration in pending_migrations(engine):
+        try:
+            with engine.begin() as conn:
+                migration.upgrade(conn)
+                conn.execute(
+                    text('INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, :t)'),
+                    {'v': migration.VERSION, 'd': migration.DESCRIPTION, 't': datetime.now()},
+                )
+        except IntegrityError:
+            # 另一个进程同时启动并已完成该迁移
+            logger.info('migration_already_applied', extra={'version': migration.VERSION})
+            continue
+        logger.info('migration_applied', extra={'version': migration.VERSION, 'description': migration.DESCRIPTION})
+        done.append(migration.VERSION)
+    return done
+
+
+def add_column(conn, table: str, name: str, ddl: str) -> bool:
+    """Add a column unless it exists (``create_all`` already made it on new databases)."""
+    existing = {column['name'] for column in inspect(conn).get_columns(table)}
+    if name in existing:
+        return False
+    conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}'))
+    return True
+
+
+def create_index(conn, name: str, table: str, columns: List[str]):
+    """Create an index unless one with the same name already exists."""
+    existing = {index['name'] for index in inspect(conn).get_indexes(table)}
+    if name not in existing:
+        conn.execute(text(f'CREATE INDEX {name} ON {table} ({", ".join(columns)})'))
+
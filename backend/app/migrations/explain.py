@@ -0,0 +1,75 @@
+"""EXPLAIN-based checks that the hot queries are answered from an index."""
+from typing import Dict, List, Optional, Union
+
+from sqlalchemy import text
+
+# (名称, SQL, 期望在查询计划中出现的索引)；按方言区分的索引名写成字典，未列出的方言跳过
+# SQL 与列出的调用处实际发出的查询保持一致
+INDEX_CHECKS = [
+    (
+        'chat history page (chat_history.history_page)',
+        'SELECT id, msg_type, username, content, timestamp, avatar_url FROM chat_message '
+        'WHERE id < :before_id ORDER BY id DESC LIMIT 50',
+        {'sqlite': 'INTEGER PRIMARY KEY', 'postgresql': 'chat_message_pkey'},
+    ),
+    (
+        'marker changes since a revision (marker_sync.changes_since)',
+        'SELECT id, title, description, latitude, longitude, user_id, created_at, revision FROM map_marker '
+        'WHERE revision > :revision ORDER BY revision LIMIT 5001',
+        'ix_map_marker_revision',
+    ),
+    (
+        'marker deletes since a revision (marker_sync.changes_since)',
+        'SELECT marker_id FROM marker_tombstone WHERE revision > :revision ORDER BY revision LIMIT 5001',
+        'ix_marker_tombstone_revision',
+    ),
+    (
+        'markers of a bulk chunk (marker_bulk._insert_chunk)',
+        'SELECT id, title, description, latitude, longitude, user_id, created_at, revision FROM map_marker '
+        'WHERE revision = :revision ORDER BY id',
+        'ix_map_marker_revision',
+    ),
+    (
+        'login by username (auth.login, auth.register)',
+        'SELECT id FROM "user" WHERE username = :username',
+        {'sqlite': 'sqlite_autoindex_user_1', 'postgresql': 'user_username_key'},
+    ),
+    (
+        'register by email (auth.register)',
+        'SELECT id FROM "user" WHERE email = :email',
+        {'sqlite': 'sqlite_autoindex_user_2', 'postgresql': 'user_email_key'},
+    ),
+]
+
+PARAMS = {'before_id': 1000, 'revision': 0, 'username': 'nobody', 'email': 'nobody@example.com'}
+
+
+def _expected_index(index: Union[str, Dict[str, str]], dialect: str) -> Optional[str]:
+    return index.get(dialect) if isinstance(index, dict) else index
+
+
+def _plan(conn, sql: str) -> str:
+    dialect = conn.dialect.name
+    if dialect == 'sqlite':
+        rows = conn.execute(text(f'EXPLAIN QUERY PLAN {sql}'), PARAMS).fetchall()
+        return '\n'.join(str(row[-1]) for row in rows)
+    rows = conn.execute(text(f'EXPLAIN {sql}'), PARAMS).fetchall()
+    return '\n'.join(' '.join(str(col) for col in row) for row in rows)
+
+
+def check_indexes(engine) -> List[Dict]:
+    """Run each check query through EXPLAIN and report whether its index is used.
+
+    Only SQLite's planner is deterministic on small tables; on server
+    databases a sequential scan of a tiny table is a valid plan, so the
+    result is informational there.
+    """
+    results = []
+    with engine.connect() as conn:
+        for name, sql, index in INDEX_CHECKS:
+            index = _expected_index(index, conn.dialect.name)
+            if index is None:
+                continue
+            plan = _plan(conn, sql)
+            results.append({'check': name, 'index': index, 'uses_index': index in plan, 'plan': plan})
+    return results
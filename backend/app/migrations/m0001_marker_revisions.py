@@ -0,0 +1,22 @@
+"""Marker revisions, tombstones and the revision counter for incremental sync."""
+VERSION = 1
+DESCRIPTION = 'marker revisions and tombstones'
+
+
+def upgrade(conn):
+    from sqlalchemy import text
+
+    from app.models.marker_revision import MarkerRevision, MarkerTombstone
+    from . import add_column, create_index
+
+    if add_column(conn, 'map_marker', 'revision', 'INTEGER NOT NULL DEFAULT 0'):
+        # 已有标记按 id 顺序编号，计数器从最大值继续
+        conn.execute(text('UPDATE map_marker SET revision = id'))
+    create_index(conn, 'ix_map_marker_revision', 'map_marker', ['revision'])
+    MarkerTombstone.__table__.create(conn, checkfirst=True)
+    MarkerRevision.__table__.create(conn, checkfirst=True)
+    conn.execute(text(
+        'INSERT INTO marker_revision (id, revision, pruned_revision) '
+        'SELECT 1, COALESCE(MAX(revision), 0), 0 FROM map_marker '
+        'WHERE NOT EXISTS (SELECT 1 FROM marker_revision WHERE id = 1)'
+    ))
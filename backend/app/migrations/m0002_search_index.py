@@ -0,0 +1,60 @@
+"""Full-text search over marker titles/descriptions and chat text (SQLite FTS5)."""
+import logging
+
+VERSION = 2
+DESCRIPTION = 'full-text search index'
+
+logger = logging.getLogger(__name__)
+
+# trigram 按三字符子串建索引，中文等不以空格分词的文本也能按子串命中，与 LIKE 回退一致
+TOKENIZE = "tokenize='trigram'"
+# trigram 分词器自 SQLite 3.34 起提供
+MIN_SQLITE_VERSION = (3, 34, 0)
+
+# 外部内容表：FTS 只保存倒排索引，正文仍在原表，由触发器随增删改同步
+STATEMENTS = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS marker_fts USING fts5("
+    f"title, description, content='map_marker', content_rowid='id', {TOKENIZE})",
+    "CREATE TRIGGER IF NOT EXISTS map_marker_fts_insert AFTER INSERT ON map_marker BEGIN "
+    "INSERT INTO marker_fts (rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS map_marker_fts_delete AFTER DELETE ON map_marker BEGIN "
+    "INSERT INTO marker_fts (marker_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS map_marker_fts_update AFTER UPDATE OF title, description ON map_marker BEGIN "
+    "INSERT INTO marker_fts (marker_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO marker_fts (rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "INSERT INTO marker_fts (marker_fts) VALUES ('rebuild')",
+
+    # 只索引文字消息；图片、语音的 content 是媒体 URL
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS chat_message_fts USING fts5("
+    f"content, content='chat_message', content_rowid='id', {TOKENIZE})",
+    "CREATE TRIGGER IF NOT EXISTS chat_message_fts_insert AFTER INSERT ON chat_message "
+    "WHEN new.msg_type = 'text' BEGIN "
+    "INSERT INTO chat_message_fts (rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS chat_message_fts_delete AFTER DELETE ON chat_message "
+    "WHEN old.msg_type = 'text' BEGIN "
+    "INSERT INTO chat_message_fts (chat_message_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS chat_message_fts_update AFTER UPDATE OF msg_type, content ON chat_message BEGIN "
+    "INSERT INTO chat_message_fts (chat_message_fts, rowid, content) "
+    "SELECT 'delete', old.id, old.content WHERE old.msg_type = 'text'; "
+    "INSERT INTO chat_message_fts (rowid, content) SELECT new.id, new.content WHERE new.msg_type = 'text'; END",
+    "INSERT INTO chat_message_fts (chat_message_fts) VALUES ('delete-all')",
+    "INSERT INTO chat_message_fts (rowid, content) SELECT id, content FROM chat_message WHERE msg_type = 'text'",
+]
+
+
+def upgrade(conn):
+    from sqlalchemy import text
+
+    if (
+        conn.dialect.name != 'sqlite'
+        or not conn.execute(text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar()
+        or tuple(int(part) for part in conn.execute(text("SELECT sqlite_version()")).scalar().split('.'))
+        < MIN_SQLITE_VERSION
+    ):
+        # 其他数据库（或未编译 FTS5、版本过旧的 SQLite）由搜索服务退回 LIKE 查询
+        logger.info('search_index_skipped', extra={'dialect': conn.dialect.name})
+        return
+    for statement in STATEMENTS:
+        conn.execute(text(statement))
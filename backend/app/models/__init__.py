@@ -1,5 +1,7 @@
 from .user import User
 from .map_marker import MapMarker
 from .chat_message import ChatMessage
+from .media_object import MediaObject
+from .marker_revision import MarkerRevision, MarkerTombstone
 
-__all__ = ['User', 'MapMarker', 'ChatMessage']
+__all__ = ['User', 'MapMarker', 'ChatMessage', 'MediaObject', 'MarkerRevision', 'MarkerTombstone']
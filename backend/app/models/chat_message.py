@@ -11,6 +11,7 @@ class ChatMessage(db.Model):
 
     def to_dict(self):
         return {
+            "id": self.id,
             "type": self.msg_type,
             "username": self.username,
             "content": self.content,
@@ -8,6 +8,8 @@ class MapMarker(db.Model):
     longitude = db.Column(db.Float, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    # 增量同步用的修订号，取自 MarkerRevision 计数器
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
     
     user = db.relationship('User', backref='markers')
     
@@ -19,5 +21,6 @@ class MapMarker(db.Model):
             'latitude': self.latitude,
             'longitude': self.longitude,
             'user_id': self.user_id,
-            'created_at': self.created_at.isoformat()
+            'created_at': self.created_at.isoformat(),
+            'revision': self.revision,
         }
\ No newline at end of file
@@ -0,0 +1,22 @@
+from app import db
+
+
+class MarkerRevision(db.Model):
+    """Single-row counter behind the marker change feed.
+
+    Every marker insert or delete takes the next value, so revisions are
+    committed in order; ``pruned_revision`` is the newest tombstone revision
+    that has been pruned, below which deltas can no longer be answered.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    revision = db.Column(db.Integer, nullable=False, default=0)
+    pruned_revision = db.Column(db.Integer, nullable=False, default=0)
+
+
+class MarkerTombstone(db.Model):
+    """Records a deleted marker so delta queries can report the delete."""
+
+    marker_id = db.Column(db.Integer, primary_key=True)
+    revision = db.Column(db.Integer, nullable=False, index=True)
+    deleted_at = db.Column(db.DateTime, default=db.func.current_timestamp())
@@ -0,0 +1,22 @@
+from app import db
+
+
+class MediaObject(db.Model):
+    """A file in the content-addressed media store, keyed by its SHA-256."""
+
+    sha256 = db.Column(db.String(64), primary_key=True)
+    mime_type = db.Column(db.String(100), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+    @property
+    def url(self):
+        return f'/api/media/{self.sha256}'
+
+    def to_dict(self):
+        return {
+            'id': self.sha256,
+            'url': self.url,
+            'mime_type': self.mime_type,
+            'size': self.size,
+        }
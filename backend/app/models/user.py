@@ -1,5 +1,4 @@
 from app import db
-from werkzeug.security import generate_password_hash, check_password_hash
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -19,12 +18,19 @@ class User(db.Model):
     avatar_url = db.Column(db.String(255))
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        from app.services.password_hasher import password_hasher
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        from app.services.password_hasher import password_hasher
+        return password_hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        from app.services.password_hasher import password_hasher
+        return password_hasher.needs_rehash(self.password_hash)
     
     def to_dict(self):
+        from app.services.avatar_pipeline import avatar_variants
         return {
             'id': self.id,
             'username': self.username,
@@ -38,9 +44,11 @@ class User(db.Model):
             'phone': self.phone,
             'location': self.location,
             'avatar_url': self.avatar_url,
+            'avatar_urls': avatar_variants(self.avatar_url),
         }
 
     def to_dict_public(self):
+        from app.services.avatar_pipeline import avatar_variants
         return {
             'id': self.id,
             'username': self.username,
@@ -52,4 +60,5 @@ class User(db.Model):
             'location': self.location,
             'bio': self.bio,
             'avatar_url': self.avatar_url,
+            'avatar_urls': avatar_variants(self.avatar_url),
         }
\ No newline at end of file
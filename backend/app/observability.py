@@ -2,13 +2,29 @@ import time
 import uuid
 from flask import g, request, jsonify
 from werkzeug.exceptions import HTTPException
+from app.metrics import HTTP_DB_QUERIES, HTTP_DB_TIME, HTTP_IN_FLIGHT, HTTP_LATENCY, request_db_stats, route_label
+from app.profiling import profiler, slow_requests
 
 
 def register_observability(app):
+    metrics_enabled = app.config.get("METRICS_ENABLED", True)
+
     @app.before_request
     def _start_request():
-        g.request_start_time = time.time()
+        g.request_start_time = time.perf_counter()
         g.request_id = request.headers.get("X-Request-Id") or uuid.uuid4().hex
+        if metrics_enabled:
+            HTTP_IN_FLIGHT.inc()
+            g.metrics_in_flight = True
+        slow_requests.start_request()
+        profiler.start_request()
+
+    @app.teardown_request
+    def _finish_request(exc):
+        # after_request 在未处理异常时不会执行，计数放在 teardown 中
+        if g.pop("metrics_in_flight", False):
+            HTTP_IN_FLIGHT.dec()
+        profiler.finish_request()
 
     @app.after_request
     def _end_request(response):
@@ -16,11 +32,33 @@ def register_observability(app):
         if request_id:
             response.headers["X-Request-Id"] = request_id
 
+        start = getattr(g, "request_start_time", None)
+        elapsed = time.perf_counter() - start if start is not None else None
+        db_queries, db_seconds = request_db_stats() or (0, 0.0)
+        if metrics_enabled and elapsed is not None:
+            route = route_label()
+            HTTP_LATENCY.labels(request.method, route, str(response.status_code)).observe(elapsed)
+            HTTP_DB_QUERIES.labels(route).observe(db_queries)
+            HTTP_DB_TIME.labels(route).observe(db_seconds)
+
+        # 带 X-Profile 的管理员请求无论快慢都记录，并附带采样栈
+        stacks = profiler.finish_request()
+        if elapsed is not None and (stacks is not None or elapsed >= slow_requests.threshold_seconds):
+            slow_requests.record(
+                "http", route_label(), elapsed,
+                request_id=request_id, method=request.method, path=request.path,
+                status=response.status_code, db_queries=db_queries, stacks=stacks,
+            )
+            if stacks is not None:
+                response.headers["X-Profile-Id"] = request_id
+            else:
+                app.logger.warning(
+                    "slow_request",
+                    extra={"request_id": request_id, "path": request.path, "duration_ms": round(elapsed * 1000, 2)},
+                )
+
         if request.path.startswith("/api"):
-            start = getattr(g, "request_start_time", None)
-            duration_ms = None
-            if start is not None:
-                duration_ms = round((time.time() - start) * 1000, 2)
+            duration_ms = round(elapsed * 1000, 2) if elapsed is not None else None
 
             app.logger.info(
                 "request",
@@ -30,6 +68,8 @@ def register_observability(app):
                     "path": request.path,
                     "status": response.status_code,
                     "duration_ms": duration_ms,
+                    "db_queries": db_queries,
+                    "db_ms": round(db_seconds * 1000, 2),
                     "remote_addr": request.headers.get("X-Forwarded-For", request.remote_addr),
                 },
             )
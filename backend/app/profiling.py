@@ -0,0 +1,343 @@
+import hmac
+import logging
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Dict, Iterable, List, Optional
+
+from flask import current_app, g, has_request_context, jsonify, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+ADMIN_HEADER = 'X-Admin-Token'
+PROFILE_HEADER = 'X-Profile'
+MAX_STACK_DEPTH = 64
+MAX_STATEMENT_CHARS = 500
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{code.co_name}"
+
+
+def green_mode() -> Optional[str]:
+    """``'eventlet'`` or ``'gevent'`` when that library has monkey-patched threading, else ``None``."""
+    if 'eventlet' in sys.modules:
+        from eventlet import patcher
+
+        if patcher.is_monkey_patched('thread'):
+            return 'eventlet'
+    if 'gevent' in sys.modules:
+        from gevent import monkey
+
+        if monkey.is_module_patched('threading'):
+            return 'gevent'
+    return None
+
+
+def _native_thread_api():
+    """Unpatched ``(start_new_thread, get_ident, sleep)``.
+
+    Under eventlet/gevent the patched versions create and sleep greenlets:
+    a sampler running as a greenlet only ever sees its own stack and is
+    starved by CPU-bound handlers.
+    """
+    import _thread
+
+    mode = green_mode()
+    if mode == 'eventlet':
+        from eventlet import patcher
+
+        native_thread, native_time = patcher.original('_thread'), patcher.original('time')
+        return native_thread.start_new_thread, native_thread.get_ident, native_time.sleep
+    if mode == 'gevent':
+        from gevent import monkey
+
+        return (monkey.get_original('_thread', 'start_new_thread'), monkey.get_original('_thread', 'get_ident'),
+                monkey.get_original('time', 'sleep'))
+    return _thread.start_new_thread, _thread.get_ident, time.sleep
+
+
+class StackSampler:
+    """Samples Python stacks from a background OS thread.
+
+    Every ``interval`` seconds it walks ``sys._current_frames()`` and counts
+    each stack in the collapsed format used by flamegraph.pl / speedscope
+    (``outer;inner;leaf count``). ``thread_ids`` restricts sampling to given
+    threads (native ids). Under eventlet/gevent all greenlets share one OS
+    thread, so a single request is followed by its ``greenlet`` instead: the
+    OS thread's stack while it runs, its saved frame while it waits.
+    """
+
+    def __init__(self, interval: float = 0.005, thread_ids: Optional[Iterable[int]] = None,
+                 max_seconds: float = 60.0, greenlet=None):
+        self.interval = interval
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.greenlet = greenlet
+        self.max_seconds = max_seconds
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self._start_thread, self._get_ident, self._sleep = _native_thread_api()
+        self._stop_requested = False
+        self._thread_id: Optional[int] = None
+        self._finished = False
+        self._green = green_mode() is not None
+        # 运行协程的系统线程，由创建采样器的线程决定
+        self._hub_thread = self._get_ident()
+
+    @classmethod
+    def for_current(cls, interval: float, max_seconds: float) -> 'StackSampler':
+        """Sampler restricted to the calling thread, or to the calling greenlet when patched."""
+        if green_mode():
+            import greenlet
+
+            return cls(interval, max_seconds=max_seconds, greenlet=greenlet.getcurrent())
+        return cls(interval, thread_ids=[threading.get_ident()], max_seconds=max_seconds)
+
+    @property
+    def running(self) -> bool:
+        return self._thread_id is not None and not self._finished
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread_id = self._start_thread(self._run, ())
+        return self
+
+    def stop(self):
+        self._stop_requested = True
+        if self._thread_id is not None and self._thread_id != self._get_ident():
+            # 等采样线程退出后再读结果；time.sleep 在协程模式下会让出 hub
+            deadline = time.monotonic() + 1.0
+            while not self._finished and time.monotonic() < deadline:
+                time.sleep(self.interval / 2)
+        return self
+
+    def _run(self):
+        own = self._get_ident()
+        deadline = time.monotonic() + self.max_seconds
+        try:
+            while not self._stop_requested and time.monotonic() < deadline:
+                self._sleep(self.interval)
+                if self._stop_requested:
+                    break
+                if self.greenlet is not None:
+                    self._sample_greenlet()
+                else:
+                    self._sample(own)
+        except Exception:
+            logger.exception('stack_sampler_failed')
+        finally:
+            self.stopped_at = time.time()
+            self._finished = True
+
+    def _count(self, frame, root: str):
+        stack = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            stack.append(_frame_name(frame))
+            frame = frame.f_back
+        stack.append(root)
+        self.stacks[';'.join(reversed(stack))] += 1
+
+    def _sample(self, own: int):
+        # 协程模式下 threading.enumerate() 列出的是协程，不用它取线程名
+        names = {} if self._green else {t.ident: t.name for t in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                continue
+            self._count(frame, names.get(thread_id, f'thread-{thread_id}'))
+        self.samples += 1
+
+    def _sample_greenlet(self):
+        target = self.greenlet
+        if target.dead:
+            return
+        frame = target.gr_frame
+        if frame is None:
+            # 正在运行的协程没有保存的帧，它的栈就是 hub 所在系统线程的当前栈
+            frame = sys._current_frames().get(self._hub_thread)
+        if frame is not None:
+            self._count(frame, 'greenlet')
+        self.samples += 1
+
+    def collapsed(self) -> str:
+        # 采样线程可能仍在写入，先整体复制
+        stacks = Counter(dict(self.stacks))
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+    def status(self) -> Dict:
+        return {
+            'running': self.running,
+            'interval_ms': round(self.interval * 1000, 3),
+            'samples': self.samples,
+            'distinct_stacks': len(self.stacks),
+            'started_at': self.started_at,
+            'stopped_at': self.stopped_at,
+        }
+
+
+class SlowRequestLog:
+    """Bounded ring buffer of requests and socket events slower than a threshold.
+
+    While the threshold is set, each request collects its SQL statements and
+    timings (capped per request) so a captured entry shows where the
+    database time went.
+    """
+
+    def __init__(self, threshold_ms: float = 1000.0, max_entries: int = 100, max_statements: int = 50):
+        self.threshold_ms = threshold_ms
+        self.max_statements = max_statements
+        self._entries: deque = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.threshold_ms = app.config.get('SLOW_REQUEST_MS', self.threshold_ms)
+        self.max_statements = app.config.get('SLOW_REQUEST_MAX_STATEMENTS', self.max_statements)
+        with self._lock:
+            self._entries = deque(maxlen=app.config.get('SLOW_REQUEST_BUFFER', self._entries.maxlen))
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+
+    @property
+    def threshold_seconds(self) -> float:
+        # 关闭时返回无穷大，调用方只需一次比较
+        return self.threshold_ms / 1000 if self.enabled else float('inf')
+
+    def start_request(self):
+        if self.enabled and has_request_context():
+            g.sql_log = []
+
+    def record_statement(self, statement: str, elapsed: float):
+        if not has_request_context():
+            return
+        log = g.get('sql_log')
+        if log is None:
+            return
+        if len(log) < self.max_statements:
+            log.append({'sql': statement[:MAX_STATEMENT_CHARS], 'ms': round(elapsed * 1000, 3)})
+        else:
+            g.sql_log_dropped = g.get('sql_log_dropped', 0) + 1
+
+    def record(self, kind: str, name: str, elapsed: float, **fields) -> Dict:
+        entry = {
+            'kind': kind,
+            'name': name,
+            'duration_ms': round(elapsed * 1000, 2),
+            'at': datetime.now(timezone.utc).isoformat(),
+        }
+        entry.update(fields)
+        if has_request_context():
+            entry['statements'] = g.get('sql_log') or []
+            entry['statements_dropped'] = g.get('sql_log_dropped', 0)
+        with self._lock:
+            self._entries.append(entry)
+        return entry
+
+    def entries(self, limit: Optional[int] = None) -> List[Dict]:
+        with self._lock:
+            entries = list(self._entries)
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class Profiler:
+    """Process-wide on-demand profiler plus per-request profiling."""
+
+    def __init__(self):
+        self.admin_token: Optional[str] = None
+        self.interval = 0.005
+        self.max_seconds = 60.0
+        self.sampler: Optional[StackSampler] = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.admin_token = app.config.get('ADMIN_TOKEN')
+        self.interval = app.config.get('PROFILER_INTERVAL_MS', 5) / 1000
+        self.max_seconds = app.config.get('PROFILER_MAX_SECONDS', self.max_seconds)
+        self.stop()
+
+    def is_admin(self) -> bool:
+        if not self.admin_token:
+            return False
+        supplied = request.headers.get(ADMIN_HEADER, '')
+        return hmac.compare_digest(supplied.encode(), self.admin_token.encode())
+
+    def start(self, interval: Optional[float] = None, seconds: Optional[float] = None) -> Dict:
+        with self._lock:
+            if self.sampler is not None and self.sampler.running:
+                return self.sampler.status()
+            self.sampler = StackSampler(interval or self.interval,
+                                        max_seconds=min(seconds or self.max_seconds, self.max_seconds)).start()
+            return self.sampler.status()
+
+    def stop(self) -> Optional[StackSampler]:
+        with self._lock:
+            sampler = self.sampler
+        if sampler is not None:
+            sampler.stop()
+        return sampler
+
+    def start_request(self):
+        if self.admin_token and PROFILE_HEADER in request.headers and self.is_admin():
+            g.request_sampler = StackSampler.for_current(self.interval, self.max_seconds).start()
+
+    def finish_request(self) -> Optional[str]:
+        sampler = g.pop('request_sampler', None)
+        if sampler is None:
+            return None
+        return sampler.stop().collapsed()
+
+
+slow_requests = SlowRequestLog()
+profiler = Profiler()
+
+
+def admin_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # 未配置 ADMIN_TOKEN 时调试接口整体不可见
+        if not profiler.admin_token:
+            return jsonify({'error': 'Not Found'}), 404
+        if not profiler.is_admin():
+            return jsonify({'error': 'Unauthorized'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def register_profiling(app, db):
+    """Configure the profiler and slow-request log; record SQL only while capture is on."""
+    slow_requests.init_app(app)
+    profiler.init_app(app)
+    if not slow_requests.enabled:
+        return
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._slow_log_started = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_slow_log_started', None)
+        if started is not None:
+            slow_requests.record_statement(statement, time.perf_counter() - started)
+
+
+def record_slow_event(name: str, elapsed: float):
+    """Capture a slow Socket.IO handler (called from ``timed_event``)."""
+    if elapsed >= slow_requests.threshold_seconds:
+        slow_requests.record('socket', name, elapsed, sid=getattr(request, 'sid', None))
+        current_app.logger.warning('slow_socket_event', extra={'event': name, 'duration_ms': round(elapsed * 1000, 2)})
@@ -1,11 +1,14 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
 from app.models.user import User
+from app.services.admission import rate_limited
+from app.services.user_cache import user_cache
 from app import db
 
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/register', methods=['POST'])
+@rate_limited()
 def register():
     data = request.get_json()
     
@@ -27,6 +30,7 @@ def register():
     return jsonify({'message': 'User created successfully', 'user': user.to_dict()}), 201
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limited()
 def login():
     data = request.get_json()
     
@@ -37,22 +41,42 @@ def login():
     
     if not user or not user.check_password(data['password']):
         return jsonify({'error': 'Invalid credentials'}), 401
+
+    # 哈希参数调整后，在登录成功时用新参数重新计算
+    if user.password_needs_rehash():
+        user.set_password(data['password'])
+        db.session.commit()
     
-    access_token = create_access_token(identity=user.id)
+    # 令牌携带不会变化的身份字段，/whoami 无需查库
+    access_token = create_access_token(identity=user.id, additional_claims={'username': user.username})
+    views = user_cache.put(user)
     
     return jsonify({
         'message': 'Login successful',
         'access_token': access_token,
-        'user': user.to_dict()
+        'user': views['private']
     }), 200
 
 @auth_bp.route('/profile', methods=['GET'])
 @jwt_required()
 def profile():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = user_cache.get_private(get_jwt_identity())
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    return jsonify({'user': user.to_dict()}), 200
\ No newline at end of file
+    return jsonify({'user': user}), 200
+
+@auth_bp.route('/whoami', methods=['GET'])
+@jwt_required()
+def whoami():
+    """Identity from the token claims alone, without touching the database"""
+    claims = get_jwt()
+    username = claims.get('username')
+    if username is None:
+        # 旧令牌没有 username 声明，退回缓存
+        user = user_cache.get_public(get_jwt_identity())
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        username = user['username']
+    return jsonify({'id': get_jwt_identity(), 'username': username}), 200
\ No newline at end of file
@@ -1,75 +1,165 @@
-from flask import Blueprint, request, current_app
-from app import socketio, db
+from flask import Blueprint, request, current_app, jsonify
+from app import socketio
 from flask_socketio import join_room, emit
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import PyJWTError
 from datetime import datetime
 from app.models.chat_message import ChatMessage
+from app.services.chat_writer import chat_writer
+from app.services.chat_history import chat_history, history_page
+from app.services.presence import presence
+from app.services.media_store import media_store, MediaError
+from app.services.admission import admission, declare_cost, rate_limited
+from app.services.search import search_index, search_args
+from app.services.lifecycle import lifecycle
+from app.metrics import timed_event
 
 chat_bp = Blueprint('chat', __name__)
 
-# 存储在线用户和消息历史
-online_users = {}
+MEDIA_MESSAGE_TYPES = {'image', 'voice'}
+DEFAULT_HISTORY_PAGE = 50
+MAX_HISTORY_PAGE = 200
+# 每个事件消耗的令牌数，启动时校验不超过聊天令牌桶的 burst
+EVENT_COST = declare_cost('chat', 'join/message', 1)
+HISTORY_EVENT_COST = declare_cost('chat', 'history', 2)
+
+def _record_message(row):
+    """写入最近消息缓冲并交给写队列异步落库，返回序列化后的消息"""
+    message_data = ChatMessage(**row).to_dict()
+    chat_history.append(message_data)
+    chat_writer.enqueue(row, message_data)
+    return message_data
+
+
+def _system_message(content):
+    return _record_message({
+        'msg_type': 'system',
+        'username': 'System',
+        'content': content,
+        'avatar_url': None,
+        'timestamp': datetime.now(),
+    })
+
+
+def _announce_left(username):
+    """广播用户离开；在线人数取自共享的 presence，多进程下同样准确"""
+    online = presence.count()
+    socketio.emit('user_left', {'username': username, 'online_users': online})
+    _system_message(f"{username} has left the chat")
+    socketio.emit('online_users', online)
+
+
+@presence.on_expire
+def _announce_expired(usernames):
+    # 所属进程已退出、心跳过期的连接
+    for username in usernames:
+        _announce_left(username)
+
+
+def _admit(cost=EVENT_COST):
+    """按 sid/用户/IP 令牌桶限流，超限时通知发送方并返回 False"""
+    wait = admission.check_chat_event(request.sid, request.remote_addr, cost)
+    if wait:
+        emit('chat_error', {'error': 'Too many messages', 'reason': 'rate_limited', 'retry_after': round(wait, 2)})
+        return False
+    return True
+
+
+def _history_args(before_id, limit):
+    """校验分页参数，返回 (before_id, limit) 或 None"""
+    try:
+        before_id = int(before_id) if before_id not in (None, '') else None
+        limit = int(limit) if limit not in (None, '') else DEFAULT_HISTORY_PAGE
+    except (TypeError, ValueError):
+        return None
+    if limit <= 0:
+        return None
+    return before_id, min(limit, MAX_HISTORY_PAGE)
+
+
+@chat_bp.route('/history', methods=['GET'])
+def get_history():
+    """按 id 倒序的游标分页历史消息"""
+    args = _history_args(request.args.get('before_id'), request.args.get('limit'))
+    if args is None:
+        return jsonify({'error': 'Invalid before_id or limit'}), 400
+    return jsonify(history_page(*args)), 200
+
+
+@chat_bp.route('/search', methods=['GET'])
+@rate_limited()
+def search_history():
+    """全文搜索文字消息；写队列中尚未落库的消息要等刷盘后才能搜到"""
+    params, error = search_args(request.args, search_index.rank_window)
+    if error:
+        return jsonify({'error': error}), 400
+    return jsonify(search_index.messages(params)), 200
+
+
+@chat_bp.route('/stats', methods=['GET'])
+def chat_stats():
+    return jsonify({
+        'online_users': presence.count(),
+        'presence': presence.stats(),
+        'write_queue': chat_writer.stats(),
+        'admission': admission.stats(),
+    }), 200
 
 @socketio.on('connect')
-def handle_connect():
+@timed_event('connect')
+def handle_connect(auth=None):
+    # 按用户限流只认连接时校验过的 JWT，事件里的 username 可以伪造
+    token = auth.get('token') if isinstance(auth, dict) else None
+    if token:
+        try:
+            admission.bind_identity(request.sid, decode_token(token)['sub'])
+        except (PyJWTError, JWTExtendedException):
+            current_app.logger.info("socket_token_rejected", extra={"sid": request.sid})
     current_app.logger.info("socket_connected", extra={"sid": request.sid})
 
 @socketio.on('disconnect')
+@timed_event('disconnect')
 def handle_disconnect():
-    # 移除断开连接的用户
-    for username, sid in list(online_users.items()):
-        if sid == request.sid:
-            del online_users[username]
-            emit('user_left', {
-                'username': username,
-                'online_users': len(online_users)
-            }, broadcast=True)
-            
-            # 添加系统消息
-            system_msg = ChatMessage(
-                msg_type="system",
-                username="System",
-                content=f"{username} has left the chat",
-            )
-            db.session.add(system_msg)
-            db.session.commit()
-            
-            emit('online_users', len(online_users), broadcast=True)
-            break
+    admission.forget_sid(request.sid)
+    # 按 sid 直接移除断开连接的用户
+    username = presence.leave(request.sid)
+    # 排空时客户端会重连到其他进程，不广播离开
+    if username and not lifecycle.draining:
+        _announce_left(username)
 
 @socketio.on('join')
+@timed_event('join')
 def handle_join(data):
     username = data.get('username')
-    if username:
-        online_users[username] = request.sid
+    if username and _admit():
+        presence.join(request.sid, username)
         join_room('chat_room')
+        online = presence.count()
         
         # 发送当前在线用户数
-        emit('online_users', len(online_users))
-        
-        # 发送加入消息给所有用户
-        emit('user_joined', {
-            'username': username,
-            'online_users': len(online_users)
-        }, broadcast=True)
+        emit('online_users', online)
         
-        # 添加系统消息到历史
-        system_msg = ChatMessage(
-            msg_type="system",
-            username="System",
-            content=f"{username} has joined the chat",
-        )
-        db.session.add(system_msg)
-        db.session.commit()
+        # 断线重连（如服务端排空后）只同步在线人数，不重复广播加入
+        if data.get('rejoin'):
+            emit('online_users', online, broadcast=True)
+        else:
+            # 发送加入消息给所有用户
+            emit('user_joined', {
+                'username': username,
+                'online_users': online
+            }, broadcast=True)
+
+            # 添加系统消息到历史
+            _system_message(f"{username} has joined the chat")
         
-        # 发送历史消息给新用户
-        recent = (
-            ChatMessage.query.order_by(ChatMessage.id.desc()).limit(50).all()
-        )
-        emit('previous_messages', [m.to_dict() for m in reversed(recent)])
+        # 发送历史消息给新用户，直接取内存中的最近消息
+        emit('previous_messages', chat_history.recent())
 
-        current_app.logger.info("user_joined_chat", extra={"username": username, "online_users": len(online_users)})
+        current_app.logger.info("user_joined_chat", extra={"username": username, "online_users": online})
 
 @socketio.on('message')
+@timed_event('message')
 def handle_message(data):
     username = data.get('username')
     content = data.get('content')
@@ -77,17 +167,44 @@ def handle_message(data):
     avatar_url = data.get('avatar_url')
     
     if username and content:
-        msg = ChatMessage(
-            msg_type=msg_type,
-            username=username,
-            content=content,
-            avatar_url=avatar_url,
-            timestamp=datetime.now(),
-        )
-        db.session.add(msg)
-        db.session.commit()
-        message_data = msg.to_dict()
+        if not _admit():
+            return
+        rejected = admission.check_payload(msg_type, content)
+        if rejected:
+            emit('chat_error', {'error': rejected, 'reason': 'payload_rejected'})
+            return
+
+        # 旧客户端仍会内联 base64，入库前转存到媒体库，只保留 URL
+        if msg_type in MEDIA_MESSAGE_TYPES:
+            try:
+                media = media_store.save_data_url(content)
+            except MediaError as exc:
+                emit('chat_error', {'error': str(exc)})
+                return
+            if media is not None:
+                content = media.url
+
+        row = {
+            'msg_type': msg_type,
+            'username': username,
+            'content': content,
+            'avatar_url': avatar_url,
+            'timestamp': datetime.now(),
+        }
+        message_data = _record_message(row)
         
-        # 广播消息给所有用户
-        emit('message', message_data, broadcast=True)
+        # 广播消息给所有用户（跳过发送队列积压的慢连接），落库由写队列异步完成
+        emit('message', message_data, broadcast=True, skip_sid=admission.broadcast_skip(socketio.server) or None)
         current_app.logger.info("chat_message", extra={"username": username, "type": msg_type})
+
+@socketio.on('history')
+@timed_event('history')
+def handle_history(data):
+    data = data or {}
+    if not _admit(HISTORY_EVENT_COST):
+        return
+    args = _history_args(data.get('before_id'), data.get('limit'))
+    if args is None:
+        emit('history', {'error': 'Invalid before_id or limit'})
+        return
+    emit('history', history_page(*args))
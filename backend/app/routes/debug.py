@@ -0,0 +1,78 @@
+from flask import Blueprint, Response, jsonify, request
+from app.profiling import admin_required, profiler, slow_requests
+
+debug_bp = Blueprint('debug', __name__)
+
+COLLAPSED_TYPE = 'text/plain; charset=utf-8'
+
+
+def _summary(entry):
+    # 列表中不展开采样栈，按 request_id 单独获取
+    summary = {key: value for key, value in entry.items() if key != 'stacks'}
+    summary['has_profile'] = entry.get('stacks') is not None
+    return summary
+
+
+@debug_bp.route('/slow-requests', methods=['GET'])
+@admin_required
+def list_slow_requests():
+    """Captured slow requests and socket events, newest first"""
+    limit = request.args.get('limit', type=int)
+    kind = request.args.get('kind')
+    entries = [e for e in slow_requests.entries() if not kind or e['kind'] == kind]
+    if limit:
+        entries = entries[:limit]
+    return jsonify({
+        'threshold_ms': slow_requests.threshold_ms,
+        'entries': [_summary(e) for e in entries],
+    }), 200
+
+
+@debug_bp.route('/slow-requests', methods=['DELETE'])
+@admin_required
+def clear_slow_requests():
+    slow_requests.clear()
+    return jsonify({'message': 'Cleared'}), 200
+
+
+@debug_bp.route('/profiles/<request_id>', methods=['GET'])
+@admin_required
+def get_request_profile(request_id):
+    """Collapsed stacks of a request sent with ``X-Profile: 1``"""
+    for entry in slow_requests.entries():
+        if entry.get('request_id') == request_id and entry.get('stacks') is not None:
+            return Response(entry['stacks'], content_type=COLLAPSED_TYPE)
+    return jsonify({'error': 'Profile not found'}), 404
+
+
+@debug_bp.route('/profiler', methods=['GET'])
+@admin_required
+def profiler_status():
+    """Profiler status, or its current samples with ``?format=collapsed``"""
+    sampler = profiler.sampler
+    if request.args.get('format') == 'collapsed':
+        return Response(sampler.collapsed() if sampler else '', content_type=COLLAPSED_TYPE)
+    return jsonify({'profiler': sampler.status() if sampler else None}), 200
+
+
+@debug_bp.route('/profiler/start', methods=['POST'])
+@admin_required
+def start_profiler():
+    data = request.get_json(silent=True) or {}
+    try:
+        interval_ms = float(data.get('interval_ms') or 0)
+        seconds = float(data.get('seconds') or 0)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid interval_ms or seconds'}), 400
+    status = profiler.start(interval_ms / 1000 if interval_ms > 0 else None, seconds if seconds > 0 else None)
+    return jsonify({'profiler': status}), 200
+
+
+@debug_bp.route('/profiler/stop', methods=['POST'])
+@admin_required
+def stop_profiler():
+    """Stop sampling and return the collapsed stacks (flamegraph.pl / speedscope input)"""
+    sampler = profiler.stop()
+    if sampler is None:
+        return jsonify({'error': 'Profiler was not started'}), 404
+    return Response(sampler.collapsed(), content_type=COLLAPSED_TYPE)
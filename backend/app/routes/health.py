@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify
 from sqlalchemy import text
 from app import db
+from app.services.lifecycle import lifecycle
 
 
 health_bp = Blueprint("health", __name__)
@@ -13,6 +14,8 @@ def healthz():
 
 @health_bp.route("/readyz", methods=["GET"])
 def readyz():
+    if lifecycle.draining:
+        return jsonify({"status": "draining"}), 503
     try:
         db.session.execute(text("SELECT 1"))
         return jsonify({"status": "ok"}), 200
@@ -1,49 +1,152 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_socketio import join_room, leave_room
 from app.models.map_marker import MapMarker
-from app import db
+from app.services.marker_index import marker_index
+from app.services.marker_clusters import marker_clusters
+from app.services.route_cache import route_cache
+from app.services.routing import routing_service, RouteServiceError, marker_locations
+from app.services.upstream import upstream_stats
+from app.services.admission import rate_limited
+from app.services.marker_sync import marker_sync, MAP_NAMESPACE, MAP_ROOM
+from app.services.search import search_index, search_args
+from app.services.marker_bulk import (
+    marker_bulk, MarkerImportError, marker_row, marker_feature, valid_coordinate, iter_items, iter_lines, load_document,
+)
+from app.serialization import MARKER_FIELDS, fetch_dicts, iter_batches, marker_select, stream_list
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.wsgi import get_input_stream
+from app.metrics import timed_event
+from app import db, socketio
 import requests
-import os
-import time
 
 map_bp = Blueprint('map', __name__)
 
-# OpenRouteService API配置
-ORS_API_KEY = os.getenv('ORS_API_KEY')
-ORS_BASE_URL = 'https://api.openrouteservice.org'
+ROUTE_PROFILES = {'driving-car', 'foot-walking', 'cycling-regular', 'wheelchair'}
+DEFAULT_ROUTE_PROFILE = 'driving-car'
+MAX_ROUTE_LOCATIONS = 50
+
+DEFAULT_MARKER_PAGE = 500
+MAX_MARKER_PAGE = 2000
+
+# 导入格式：按行流式解析，或整体解析一个 JSON 文档
+IMPORT_MIMETYPES = {
+    'application/x-ndjson': 'ndjson',
+    'application/geo+json-seq': 'ndjson',
+    'application/json-seq': 'ndjson',
+    'application/geo+json': 'geojson',
+    'application/json': 'geojson',
+}
+
+
+def _parse_bbox(raw):
+    """解析 minLat,minLon,maxLat,maxLon 格式的视野范围"""
+    try:
+        min_lat, min_lon, max_lat, max_lon = (float(v) for v in raw.split(','))
+    except ValueError:
+        return None
+    if min_lat > max_lat or min_lon > max_lon:
+        return None
+    if not (-90 <= min_lat <= 90 and -90 <= max_lat <= 90 and -180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        return None
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def _index_marker(marker):
+    marker_index.add(marker.id, marker.latitude, marker.longitude, marker.revision)
+    marker_clusters.add(marker.id, marker.latitude, marker.longitude, marker.revision)
+
+
+def _unindex_marker(marker_id, revision):
+    marker_index.remove(marker_id, revision)
+    marker_clusters.remove(marker_id, revision)
+
 
 @map_bp.route('/markers', methods=['GET'])
 def get_markers():
-    markers = MapMarker.query.all()
-    return jsonify({'markers': [marker.to_dict() for marker in markers]}), 200
+    if 'since' in request.args:
+        since = request.args.get('since', type=int)
+        if since is None or since < 0:
+            return jsonify({'error': 'Invalid since revision'}), 400
+        # 只返回该修订号之后的新增与删除；reset 为 true 时客户端需重新全量加载
+        return jsonify(marker_sync.changes_since(since)), 200
+
+    bbox_arg = request.args.get('bbox')
+    if not bbox_arg:
+        # 全量列表按批流式输出，响应体不会整体驻留内存；修订号在查询前读取
+        revision = marker_sync.current_revision()
+        response = stream_list('markers', iter_batches(MARKER_FIELDS, marker_select().order_by(MapMarker.id)),
+                               revision=revision)
+        response.headers['X-Marker-Revision'] = str(revision)
+        return response
+
+    bbox = _parse_bbox(bbox_arg)
+    if bbox is None:
+        return jsonify({'error': 'Invalid bbox, expected minLat,minLon,maxLat,maxLon'}), 400
+
+    limit = request.args.get('limit', DEFAULT_MARKER_PAGE, type=int)
+    cursor = request.args.get('cursor', type=int)
+    if limit is None or limit <= 0:
+        return jsonify({'error': 'Invalid limit'}), 400
+    limit = min(limit, MAX_MARKER_PAGE)
+
+    # 多取一个用于判断是否还有下一页
+    ids = marker_index.query(*bbox, after_id=cursor, limit=limit + 1)
+    next_cursor = ids[limit - 1] if len(ids) > limit else None
+    ids = ids[:limit]
+
+    markers = []
+    if ids:
+        markers = fetch_dicts(MARKER_FIELDS, marker_select().where(MapMarker.id.in_(ids)).order_by(MapMarker.id))
+    return jsonify({
+        'markers': markers,
+        'next_cursor': next_cursor,
+    }), 200
+
+@map_bp.route('/markers/search', methods=['GET'])
+@rate_limited()
+def search_markers():
+    """按标题和描述全文搜索标记，支持前缀匹配；rank 按相关度，recent 按时间倒序"""
+    params, error = search_args(request.args, search_index.rank_window)
+    if error:
+        return jsonify({'error': error}), 400
+    return jsonify(search_index.markers(params)), 200
+
+@map_bp.route('/clusters', methods=['GET'])
+def get_clusters():
+    zoom = request.args.get('z', type=int)
+    if zoom is None:
+        return jsonify({'error': 'Missing or invalid zoom level'}), 400
+
+    bbox = None
+    if request.args.get('bbox'):
+        bbox = _parse_bbox(request.args['bbox'])
+        if bbox is None:
+            return jsonify({'error': 'Invalid bbox, expected minLat,minLon,maxLat,maxLon'}), 400
+
+    clusters = marker_clusters.query(zoom, bbox)
+    return jsonify({'zoom': max(0, min(zoom, marker_clusters.max_zoom)), 'clusters': clusters}), 200
 
 @map_bp.route('/markers', methods=['POST'])
 @jwt_required()
+@rate_limited()
 def create_marker():
     data = request.get_json()
     user_id = get_jwt_identity()
-    
-    if (
-        not data
-        or not isinstance(data.get("title"), str)
-        or not data.get("title").strip()
-        or data.get("latitude") is None
-        or data.get("longitude") is None
-    ):
-        return jsonify({'error': 'Missing required fields'}), 400
-    
-    marker = MapMarker(
-        title=data['title'],
-        description=data.get('description', ''),
-        latitude=data['latitude'],
-        longitude=data['longitude'],
-        user_id=user_id
-    )
+
+    row, error = marker_row(data, user_id)
+    if error:
+        return jsonify({'error': error}), 400
+
+    marker = MapMarker(**row, revision=marker_sync.next_revision())
     
     db.session.add(marker)
     db.session.commit()
+    _index_marker(marker)
+    marker_data = marker.to_dict()
+    marker_sync.publish(marker.revision, markers=[marker_data])
     
-    return jsonify({'message': 'Marker created successfully', 'marker': marker.to_dict()}), 201
+    return jsonify({'message': 'Marker created successfully', 'marker': marker_data}), 201
 
 @map_bp.route('/markers/<int:marker_id>', methods=['DELETE'])
 @jwt_required()
@@ -57,12 +160,112 @@ def delete_marker(marker_id):
     if marker.user_id != user_id:
         return jsonify({'error': 'Unauthorized'}), 403
     
+    revision = marker_sync.next_revision()
+    marker_sync.record_deletes([marker_id], revision)
     db.session.delete(marker)
     db.session.commit()
+    _unindex_marker(marker_id, revision)
+    marker_sync.publish(revision, deleted=[marker_id])
     
-    return jsonify({'message': 'Marker deleted successfully'}), 200
+    return jsonify({'message': 'Marker deleted successfully', 'revision': revision}), 200
+
+
+def _bulk_response(result, status):
+    if 'error' in result:
+        status = result.pop('status_code')
+    return jsonify(result), status
+
+
+@map_bp.route('/markers/bulk', methods=['POST'])
+@jwt_required()
+@rate_limited(cost=5)
+def create_markers_bulk():
+    """批量创建标记：逐项校验，合法的按批写入，非法项在 errors 中返回"""
+    data = request.get_json(silent=True)
+    markers = data.get('markers') if isinstance(data, dict) else None
+    if not isinstance(markers, list) or not markers:
+        return jsonify({'error': 'Missing markers'}), 400
+    if len(markers) > marker_bulk.max_items:
+        return jsonify({'error': f'At most {marker_bulk.max_items} markers per request'}), 400
+
+    result = marker_bulk.create(iter_items(markers), get_jwt_identity(), collect=True)
+    return _bulk_response(result, 201 if result['created'] else 400)
+
+
+@map_bp.route('/markers/bulk-delete', methods=['POST'])
+@jwt_required()
+@rate_limited(cost=5)
+def delete_markers_bulk():
+    """批量删除自己的标记；他人的与不存在的 id 分别在 forbidden / not_found 中返回"""
+    data = request.get_json(silent=True)
+    ids = data.get('ids') if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not ids or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return jsonify({'error': 'Invalid marker IDs'}), 400
+    if len(ids) > marker_bulk.max_items:
+        return jsonify({'error': f'At most {marker_bulk.max_items} ids per request'}), 400
+
+    return _bulk_response(marker_bulk.delete(ids, get_jwt_identity()), 200)
+
+
+@map_bp.route('/markers/import', methods=['POST'])
+@jwt_required()
+@rate_limited(cost=20)
+def import_markers():
+    """导入 NDJSON / GeoJSON 文本序列（逐行流式处理）或 GeoJSON FeatureCollection"""
+    fmt = request.args.get('format') or IMPORT_MIMETYPES.get(request.mimetype)
+    if fmt not in ('ndjson', 'geojson'):
+        return jsonify({'error': 'Unsupported import format, expected ndjson or geojson'}), 415
+
+    try:
+        # 导入体积上限独立于 MAX_CONTENT_LENGTH
+        stream = get_input_stream(request.environ, max_content_length=marker_bulk.import_max_bytes)
+        items = iter_lines(stream) if fmt == 'ndjson' else load_document(stream)
+    except RequestEntityTooLarge:
+        return jsonify({'error': 'File too large'}), 413
+    except MarkerImportError as exc:
+        return jsonify({'error': str(exc)}), exc.status_code
+
+    result = marker_bulk.create(items, get_jwt_identity())
+    if not result['created'] and not result['failed'] and 'error' not in result:
+        return jsonify({'error': 'No markers to import'}), 400
+    return _bulk_response(result, 201 if result['created'] else 400)
+
+
+@map_bp.route('/markers/export', methods=['GET'])
+def export_markers():
+    """按批流式导出全部标记：GeoJSON FeatureCollection 或 NDJSON（每行一个 Feature）"""
+    revision = marker_sync.current_revision()
+    batches = iter_batches(MARKER_FIELDS, marker_select().order_by(MapMarker.id))
+    features = ([marker_feature(marker) for marker in batch] for batch in batches)
+    response = stream_list('features', features, type='FeatureCollection')
+    if response.mimetype == 'application/json':
+        response.mimetype = 'application/geo+json'
+    response.headers['X-Marker-Revision'] = str(revision)
+    return response
+
+
+@socketio.on('subscribe', namespace=MAP_NAMESPACE)
+@timed_event('map_subscribe')
+def handle_map_subscribe(data=None):
+    """订阅标记变更推送；客户端随后用 since 补齐订阅前错过的变更"""
+    join_room(MAP_ROOM)
+    return {'revision': marker_sync.current_revision()}
+
+
+@socketio.on('unsubscribe', namespace=MAP_NAMESPACE)
+@timed_event('map_unsubscribe')
+def handle_map_unsubscribe(data=None):
+    leave_room(MAP_ROOM)
+
+def _valid_point(point):
+    return (
+        isinstance(point, list) and len(point) == 2
+        and valid_coordinate(point[0], 90) and valid_coordinate(point[1], 180)
+    )
+
 
 @map_bp.route('/route', methods=['POST'])
+@rate_limited()
 def get_route():
     """获取两点之间的路径"""
     data = request.get_json()
@@ -70,90 +273,169 @@ def get_route():
     if not data or not data.get('start') or not data.get('end'):
         return jsonify({'error': 'Missing start or end coordinates'}), 400
 
-    if not ORS_API_KEY:
-        return jsonify({'error': 'Route service not configured'}), 503
+    profile = data.get('profile', DEFAULT_ROUTE_PROFILE)
+    if profile not in ROUTE_PROFILES:
+        return jsonify({'error': 'Unsupported route profile'}), 400
+
+    backend_error = routing_service.backend_error(profile)
+    if backend_error is not None:
+        return jsonify({'error': backend_error.message}), backend_error.status_code
     
     try:
         start = data['start']
         end = data['end']
         
         # 验证坐标格式
-        if (not isinstance(start, list) or len(start) != 2 or
-            not isinstance(end, list) or len(end) != 2):
+        if not _valid_point(start) or not _valid_point(end):
             return jsonify({'error': 'Invalid coordinates format'}), 400
         
-        # OpenRouteService API调用
-        headers = {
-            'Authorization': ORS_API_KEY,
-            'Content-Type': 'application/json'
-        }
-        
-        payload = {
-            'coordinates': [[start[1], start[0]], [end[1], end[0]]],  # ORS使用[longitude, latitude]格式
-            'format': 'geojson',
-            'geometry': 'true',
-            'instructions': 'true'
-        }
-        
-        request_started = time.time()
-        response = requests.post(
-            f'{ORS_BASE_URL}/v2/directions/driving-car/geojson',
-            headers=headers,
-            json=payload,
-            timeout=10
-        )
-        
-        elapsed_ms = round((time.time() - request_started) * 1000, 2)
-        current_app.logger.info("ors_response", extra={"status": response.status_code, "duration_ms": elapsed_ms})
+        # 相近的起终点共享同一条缓存，并发的相同请求只会计算一次
+        route_info = routing_service.route(start, end, profile)
 
-        if response.status_code == 200:
-            route_data = response.json()
-            
-            # 提取路径信息
-            route_info = {
-                'coordinates': route_data['features'][0]['geometry']['coordinates'],
-                'distance': route_data['features'][0]['properties']['segments'][0]['distance'],
-                'duration': route_data['features'][0]['properties']['segments'][0]['duration'],
-                'instructions': route_data['features'][0]['properties']['segments'][0]['steps']
-            }
-            
-            return jsonify({
-                'route': route_info,
-                'message': 'Route calculated successfully'
-            }), 200
-        else:
-            return jsonify({'error': 'Failed to calculate route'}), response.status_code
+        return jsonify({
+            'route': route_info,
+            'message': 'Route calculated successfully'
+        }), 200
             
+    except RouteServiceError as e:
+        return jsonify({'error': e.message}), e.status_code
     except requests.exceptions.RequestException as e:
         return jsonify({'error': 'Service unavailable'}), 503
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
+def _resolve_locations(data):
+    """从 locations 坐标列表或 marker_ids 中解析出途经点，返回 (locations, error)"""
+    if data.get('marker_ids') is not None:
+        marker_ids = data['marker_ids']
+        if not isinstance(marker_ids, list) or not all(isinstance(i, int) for i in marker_ids):
+            return None, (jsonify({'error': 'Invalid marker IDs'}), 400)
+        by_id = marker_locations(set(marker_ids))
+        if len(by_id) != len(set(marker_ids)):
+            return None, (jsonify({'error': 'One or more markers not found'}), 404)
+        locations = [by_id[i] for i in marker_ids]
+    else:
+        locations = data.get('locations')
+        if not isinstance(locations, list) or not all(_valid_point(p) for p in locations):
+            return None, (jsonify({'error': 'Invalid coordinates format'}), 400)
+
+    if len(locations) < 2:
+        return None, (jsonify({'error': 'At least two locations are required'}), 400)
+    if len(locations) > MAX_ROUTE_LOCATIONS:
+        return None, (jsonify({'error': f'At most {MAX_ROUTE_LOCATIONS} locations are allowed'}), 400)
+    return locations, None
+
+
+def _batch_route_request(handler):
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': 'Missing request body'}), 400
+
+    profile = data.get('profile', DEFAULT_ROUTE_PROFILE)
+    if profile not in ROUTE_PROFILES:
+        return jsonify({'error': 'Unsupported route profile'}), 400
+
+    locations, error = _resolve_locations(data)
+    if error:
+        return error
+
+    try:
+        return handler(data, locations, profile)
+    except RouteServiceError as e:
+        return jsonify({'error': e.message}), e.status_code
+    except requests.exceptions.RequestException:
+        return jsonify({'error': 'Service unavailable'}), 503
+    except Exception:
+        current_app.logger.exception("batch_route_failed")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@map_bp.route('/route/matrix', methods=['POST'])
+@rate_limited(cost=3)
+def get_route_matrix():
+    """多点之间的距离/时间矩阵"""
+    def handler(data, locations, profile):
+        matrix = routing_service.matrix(locations, profile)
+        return jsonify({'locations': locations, **matrix}), 200
+
+    return _batch_route_request(handler)
+
+@map_bp.route('/route/tour', methods=['POST'])
+@rate_limited(cost=3)
+def get_route_tour():
+    """多点游览路线：计算最优访问顺序并返回完整路径"""
+    def handler(data, locations, profile):
+        tour = routing_service.tour(
+            locations,
+            profile,
+            roundtrip=bool(data.get('roundtrip', False)),
+            optimize=bool(data.get('optimize', True)),
+        )
+        tour['locations'] = [locations[i] for i in tour['order']]
+        if data.get('marker_ids') is not None:
+            tour['marker_ids'] = [data['marker_ids'][i] for i in tour['order']]
+        return jsonify({'tour': tour, 'message': 'Tour calculated successfully'}), 200
+
+    return _batch_route_request(handler)
+
+@map_bp.route('/route/stats', methods=['GET'])
+def get_route_stats():
+    """路径服务缓存统计"""
+    return jsonify({
+        'cache': route_cache.stats(),
+        'upstreams': upstream_stats(),
+        'backends': {
+            'mode': routing_service.mode,
+            'ors': routing_service.ors.available,
+            'local': routing_service.local.available,
+        },
+    }), 200
+
 @map_bp.route('/route/marker-to-marker', methods=['POST'])
+@rate_limited()
 def get_route_between_markers():
-    """获取两个标记之间的路径"""
-    data = request.get_json()
-    
-    if not data or not data.get('start_marker_id') or not data.get('end_marker_id'):
+    """获取标记之间的路径，支持通过 pairs 批量查询"""
+    data = request.get_json(silent=True)
+
+    if not data:
         return jsonify({'error': 'Missing marker IDs'}), 400
-    
+
+    profile = data.get('profile', DEFAULT_ROUTE_PROFILE)
+    if profile not in ROUTE_PROFILES:
+        return jsonify({'error': 'Unsupported route profile'}), 400
+
+    bulk = 'pairs' in data
+    if bulk:
+        pairs = data['pairs']
+        if (
+            not isinstance(pairs, list) or not pairs or len(pairs) > MAX_ROUTE_LOCATIONS
+            or not all(isinstance(p, list) and len(p) == 2 and all(isinstance(i, int) for i in p) for p in pairs)
+        ):
+            return jsonify({'error': 'Invalid marker pairs'}), 400
+    else:
+        if not data.get('start_marker_id') or not data.get('end_marker_id'):
+            return jsonify({'error': 'Missing marker IDs'}), 400
+        pairs = [[data['start_marker_id'], data['end_marker_id']]]
+
+    backend_error = routing_service.backend_error(profile)
+    if backend_error is not None:
+        return jsonify({'error': backend_error.message}), backend_error.status_code
+
     try:
-        start_marker = MapMarker.query.get(data['start_marker_id'])
-        end_marker = MapMarker.query.get(data['end_marker_id'])
-        
-        if not start_marker or not end_marker:
-            return jsonify({'error': 'One or both markers not found'}), 404
-        
-        # 使用标记坐标调用路径查找
-        route_data = {
-            'start': [start_marker.latitude, start_marker.longitude],
-            'end': [end_marker.latitude, end_marker.longitude]
-        }
-        
-        # 调用内部路径查找函数
-        from flask import current_app
-        with current_app.test_request_context('/api/map/route', json=route_data, method='POST'):
-            return get_route()
-            
-    except Exception as e:
+        results = routing_service.route_marker_pairs([tuple(p) for p in pairs], profile)
+    except requests.exceptions.RequestException:
+        return jsonify({'error': 'Service unavailable'}), 503
+    except Exception:
+        current_app.logger.exception("marker_route_failed")
         return jsonify({'error': 'Failed to calculate route between markers'}), 500
+
+    if bulk:
+        return jsonify({'routes': results}), 200
+
+    result = results[0]
+    if 'error' in result:
+        return jsonify({'error': result['error']}), result['status_code']
+    return jsonify({
+        'route': result['route'],
+        'message': 'Route calculated successfully'
+    }), 200
@@ -0,0 +1,47 @@
+from flask import Blueprint, request, jsonify, send_file, abort
+from flask_jwt_extended import jwt_required
+from app.services.media_store import media_store, MediaError
+from app.services.admission import rate_limited
+
+media_bp = Blueprint('media', __name__)
+
+# 内容寻址：同一 URL 的内容永不改变，可以长期缓存
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+@media_bp.route('', methods=['POST'])
+@jwt_required()
+@rate_limited()
+def upload_media():
+    """Upload one file, either as the raw request body or as multipart ``file``."""
+    if 'file' in request.files:
+        upload = request.files['file']
+        stream, mime_type = upload.stream, upload.mimetype
+    else:
+        stream, mime_type = request.stream, request.mimetype
+
+    try:
+        media = media_store.save_stream(stream, mime_type)
+    except MediaError as exc:
+        return jsonify({'error': str(exc)}), exc.status_code
+
+    return jsonify(media.to_dict()), 201
+
+
+@media_bp.route('/<digest>', methods=['GET'])
+def get_media(digest):
+    media = media_store.get(digest)
+    if media is None:
+        abort(404)
+
+    # send_file 处理 If-None-Match 与 Range（音频拖动进度条需要）
+    response = send_file(
+        media_store.path_for(media.sha256),
+        mimetype=media.mime_type,
+        etag=media.sha256,
+        conditional=True,
+        max_age=IMMUTABLE_MAX_AGE,
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
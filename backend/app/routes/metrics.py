@@ -0,0 +1,18 @@
+import hmac
+from flask import Blueprint, Response, current_app, jsonify, request
+from app.metrics import CONTENT_TYPE, registry
+
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics():
+    if not current_app.config.get("METRICS_ENABLED", True):
+        return jsonify({"error": "Not Found"}), 404
+    token = current_app.config.get("METRICS_TOKEN")
+    if token:
+        supplied = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+            return jsonify({"error": "Unauthorized"}), 401
+    return Response(registry.render(), mimetype=None, content_type=CONTENT_TYPE)
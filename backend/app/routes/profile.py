@@ -1,29 +1,40 @@
 import os
-from flask import Blueprint, request, jsonify, current_app
+from functools import partial
+from flask import Blueprint, request, jsonify, current_app, send_file, abort
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from werkzeug.utils import secure_filename
 from app.models.user import User
+from app.services.user_cache import user_cache
+from app.services.avatar_pipeline import avatar_pipeline, AvatarError
 from app import db
 
 profile_bp = Blueprint('profile', __name__)
 
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+# 文件名含内容哈希与处理参数，同一 URL 的内容永不改变
+AVATAR_MAX_AGE = 365 * 24 * 3600
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def _restore_avatar(user_id, previous_url, failed_url):
+    """Roll back to the previous avatar when background processing failed."""
+    user = db.session.get(User, user_id)
+    if user is not None and user.avatar_url == failed_url:
+        user.avatar_url = previous_url
+        db.session.commit()
+        user_cache.invalidate(user_id)
+
 @profile_bp.route('/profile', methods=['GET'])
 @jwt_required()
 def get_profile():
     """Get current user's profile"""
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = user_cache.get_private(get_jwt_identity())
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    return jsonify({'user': user.to_dict()}), 200
+    return jsonify({'user': user}), 200
 
 @profile_bp.route('/profile', methods=['PUT'])
 @jwt_required()
@@ -35,26 +46,21 @@ def update_profile():
     if not user:
         return jsonify({'error': 'User not found'}), 404
 
+    staged = None
     # Handle multipart/form-data for file uploads
     if 'avatar' in request.files:
         data = request.form
         file = request.files['avatar']
         
         if file and allowed_file(file.filename):
-            filename = secure_filename(f"{user_id}_{file.filename}")
-            upload_folder = os.path.join(current_app.root_path, 'static', 'avatars')
-            os.makedirs(upload_folder, exist_ok=True)
-            
-            # Delete old avatar if it exists and is a local file
-            if user.avatar_url and not user.avatar_url.startswith('http'):
-                old_avatar_path = os.path.join(current_app.root_path, 'static', user.avatar_url.lstrip('/'))
-                if os.path.exists(old_avatar_path):
-                    os.remove(old_avatar_path)
-
-            file_path = os.path.join(upload_folder, filename)
-            file.save(file_path)
-            # Ensure the URL path includes the static folder prefix
-            user.avatar_url = f'/static/avatars/{filename}'
+            ext = file.filename.rsplit('.', 1)[1].lower().replace('jpeg', 'jpg')
+            previous_url = user.avatar_url
+            # 请求内只落盘并计算哈希，缩放在提交后于后台完成
+            try:
+                staged = avatar_pipeline.stage(file.stream, ext)
+            except AvatarError as e:
+                return jsonify({'error': str(e)}), e.status_code
+            user.avatar_url = staged.url
     else:
         # Handle regular JSON data
         data = request.get_json(silent=True)
@@ -73,6 +79,8 @@ def update_profile():
             try:
                 user.age = int(data.get('age'))
             except (TypeError, ValueError):
+                if staged:
+                    avatar_pipeline.discard(staged)
                 return jsonify({'error': 'Invalid age'}), 400
     user.gender = data.get('gender', user.gender)
     user.bio = data.get('bio', user.bio)
@@ -81,24 +89,51 @@ def update_profile():
 
     try:
         db.session.commit()
-        return jsonify({
-            'message': 'Profile updated successfully',
-            'user': user.to_dict()
-        }), 200
     except Exception as e:
         db.session.rollback()
+        if staged:
+            avatar_pipeline.discard(staged)
         current_app.logger.error(f"Failed to update profile: {e}")
         return jsonify({'error': 'Failed to update profile'}), 500
 
+    # 先写缓存再排队，后台失败回滚时的失效不会被覆盖
+    views = user_cache.put(user)
+    if staged:
+        avatar_pipeline.process(staged, on_failure=partial(_restore_avatar, user.id, previous_url))
+        if previous_url != staged.url:
+            avatar_pipeline.discard_legacy(os.path.join(current_app.root_path, 'static'), previous_url)
+    return jsonify({
+        'message': 'Profile updated successfully',
+        'user': views['private']
+    }), 200
+
+@profile_bp.route('/avatars/<filename>', methods=['GET'])
+def get_avatar(filename):
+    """Serve one avatar variant; waits briefly if it is still being produced"""
+    path = avatar_pipeline.path_for(filename)
+    if path is None:
+        abort(404)
+    try:
+        avatar_pipeline.wait(filename)
+    except Exception:
+        current_app.logger.warning(f"Avatar {filename} not ready")
+    if not os.path.exists(path):
+        abort(404)
+
+    response = send_file(path, etag=filename, conditional=True, max_age=AVATAR_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
 @profile_bp.route('/profile/<int:user_id>', methods=['GET'])
 def get_public_profile(user_id):
     """Get public profile of any user"""
-    user = User.query.get(user_id)
+    user = user_cache.get_public(user_id)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    return jsonify({'user': user.to_dict_public()}), 200
+    return jsonify({'user': user}), 200
 
 @profile_bp.route('/profile/change-password', methods=['POST'])
 @jwt_required()
@@ -124,6 +159,7 @@ def change_password():
     
     try:
         db.session.commit()
+        user_cache.invalidate(user.id)
         return jsonify({'message': 'Password changed successfully'}), 200
     except Exception as e:
         db.session.rollback()
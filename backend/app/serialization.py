@@ -0,0 +1,177 @@
+import datetime
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from flask import current_app, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson 未安装时退回标准库 json
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+STREAM_BATCH = 1000
+
+# 列表接口只查询这些列，按元组取回后直接组装 dict，不经过 ORM 对象
+MARKER_FIELDS = ('id', 'title', 'description', 'latitude', 'longitude', 'user_id', 'created_at', 'revision')
+CHAT_MESSAGE_FIELDS = ('id', 'type', 'username', 'content', 'timestamp', 'avatar_url')
+
+_ORJSON_KWARGS = {'indent', 'separators', 'ensure_ascii', 'sort_keys'}
+
+
+def _default(o):
+    # 与 to_dict() 中的 isoformat() 保持一致，而不是 Flask 默认的 HTTP 日期
+    if isinstance(o, (datetime.datetime, datetime.date, datetime.time)):
+        return o.isoformat()
+    return DefaultJSONProvider.default(o)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider that encodes with orjson when it is installed.
+
+    Datetimes become ISO 8601 strings, the same as the models' ``to_dict``,
+    so column tuples can be encoded without a per-row ``isoformat()``. Keys
+    keep insertion order and non-ASCII text is written as UTF-8. Arguments
+    orjson cannot honour (``cls``, ``indent`` other than 2, ...) fall back to
+    the stdlib encoder.
+    """
+
+    sort_keys = False
+    ensure_ascii = False
+    default = staticmethod(_default)
+
+    def __init__(self, app, use_orjson: bool = True):
+        super().__init__(app)
+        self.use_orjson = use_orjson and orjson is not None
+
+    @property
+    def backend(self) -> str:
+        return 'orjson' if self.use_orjson else 'json'
+
+    def _orjson_option(self, kwargs) -> Optional[int]:
+        if not self.use_orjson or not set(kwargs) <= _ORJSON_KWARGS or kwargs.get('indent') not in (None, 2):
+            return None
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps_bytes(self, obj, **kwargs) -> bytes:
+        option = self._orjson_option(kwargs)
+        if option is None:
+            return self.dumps(obj, **kwargs).encode()
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def dumps(self, obj, **kwargs) -> str:
+        option = self._orjson_option(kwargs)
+        if option is None:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        if self.use_orjson and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        dump_args = {}
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            dump_args['indent'] = 2
+        return self._app.response_class(self.dumps_bytes(obj, **dump_args) + b'\n', mimetype=self.mimetype)
+
+
+def register_json(app):
+    """Install ``FastJSONProvider`` according to ``JSON_BACKEND`` (auto/orjson/stdlib)."""
+    backend = app.config.get('JSON_BACKEND', 'auto')
+    if backend == 'orjson' and orjson is None:
+        logger.warning('JSON_BACKEND=orjson but orjson is not installed, using the stdlib encoder')
+    app.json = FastJSONProvider(app, use_orjson=backend != 'stdlib')
+
+
+def as_dicts(fields: Sequence[str], rows: Iterable[Sequence]) -> List[Dict]:
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def marker_select():
+    """``SELECT`` of the marker columns in ``MARKER_FIELDS`` order."""
+    from app import db
+    from app.models.map_marker import MapMarker
+
+    return db.select(*(getattr(MapMarker, field) for field in MARKER_FIELDS))
+
+
+def chat_message_select():
+    from app import db
+    from app.models.chat_message import ChatMessage
+
+    return db.select(ChatMessage.id, ChatMessage.msg_type, ChatMessage.username, ChatMessage.content,
+                     ChatMessage.timestamp, ChatMessage.avatar_url)
+
+
+def chat_message_dicts(rows: Iterable[Sequence]) -> List[Dict]:
+    # 聊天消息还会经 Socket.IO 的标准库 json 发送，时间戳需先转成字符串
+    return [
+        {'id': id_, 'type': type_, 'username': username, 'content': content,
+         'timestamp': timestamp.isoformat(), 'avatar_url': avatar_url}
+        for id_, type_, username, content, timestamp, avatar_url in rows
+    ]
+
+
+def fetch_dicts(fields: Sequence[str], statement) -> List[Dict]:
+    from app import db
+
+    return as_dicts(fields, db.session.execute(statement))
+
+
+def iter_batches(fields: Sequence[str], statement, size: int = STREAM_BATCH) -> Iterator[List[Dict]]:
+    """Run ``statement`` with a server-side cursor and yield rows as dicts, ``size`` at a time."""
+    from app import db
+
+    result = db.session.execute(statement.execution_options(yield_per=size))
+    for partition in result.partitions():
+        yield as_dicts(fields, partition)
+
+
+def wants_ndjson() -> bool:
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def stream_list(key: str, batches: Iterable[List[Dict]], **extra):
+    """Stream ``batches`` as ``{key: [...], **extra}`` or, if requested, NDJSON.
+
+    Each batch is encoded in one call and sent as one chunk, so the full body
+    never exists in memory. NDJSON responses carry one item per line and
+    drop ``extra``.
+    """
+    encode = current_app.json.dumps_bytes
+
+    if wants_ndjson():
+        def generate():
+            for batch in batches:
+                if batch:
+                    yield b'\n'.join(encode(item) for item in batch) + b'\n'
+
+        return current_app.response_class(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+    def generate():
+        yield b'{' + encode(key) + b':['
+        first = True
+        for batch in batches:
+            if not batch:
+                continue
+            # 去掉批次数组的方括号后直接拼接
+            body = encode(batch)[1:-1]
+            yield body if first else b',' + body
+            first = False
+        tail = encode(extra)[1:-1] if extra else b''
+        yield b']' + (b',' + tail if tail else b'') + b'}\n'
+
+    return current_app.response_class(stream_with_context(generate()), mimetype=current_app.json.mimetype)
@@ -0,0 +1,40 @@
+from .marker_index import MarkerGridIndex, marker_index
+from .marker_clusters import MarkerClusterIndex, marker_clusters
+from .route_cache import RouteCache, route_cache
+from .campus_graph import CampusGraph
+from .upstream import UpstreamClient, CircuitBreaker, upstream_stats
+from .chat_writer import ChatWriteBehind, chat_writer
+from .chat_history import ChatHistoryBuffer, chat_history, history_page
+from .presence import PresenceRegistry, presence
+from .socket_queue import SQLitePubSubManager, message_queue_options
+from .media_store import MediaStore, MediaError, media_store
+from .admission import AdmissionControl, RateLimiter, admission, rate_limited
+from .password_hasher import PasswordHasher, PasswordHasherBusy, password_hasher
+from .user_cache import UserCache, user_cache
+from .avatar_pipeline import AvatarPipeline, AvatarError, avatar_pipeline, avatar_variants
+from .routing import RoutingService, RouteServiceError, routing_service, marker_locations
+from .marker_sync import MarkerSync, marker_sync
+from .marker_bulk import MarkerBulk, MarkerImportError, marker_bulk
+from .search import SearchIndex, search_index
+from .lifecycle import Lifecycle, lifecycle
+
+__all__ = [
+    'MarkerGridIndex', 'marker_index',
+    'MarkerClusterIndex', 'marker_clusters',
+    'RouteCache', 'route_cache',
+    'UpstreamClient', 'CircuitBreaker', 'upstream_stats',
+    'ChatWriteBehind', 'chat_writer',
+    'ChatHistoryBuffer', 'chat_history', 'history_page',
+    'PresenceRegistry', 'presence',
+    'SQLitePubSubManager', 'message_queue_options',
+    'MediaStore', 'MediaError', 'media_store',
+    'AdmissionControl', 'RateLimiter', 'admission', 'rate_limited',
+    'PasswordHasher', 'PasswordHasherBusy', 'password_hasher',
+    'UserCache', 'user_cache',
+    'AvatarPipeline', 'AvatarError', 'avatar_pipeline', 'avatar_variants',
+    'CampusGraph', 'RoutingService', 'RouteServiceError', 'routing_service', 'marker_locations',
+    'MarkerSync', 'marker_sync',
+    'MarkerBulk', 'MarkerImportError', 'marker_bulk',
+    'SearchIndex', 'search_index',
+    'Lifecycle', 'lifecycle',
+]
@@ -0,0 +1,306 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import ExitStack
+from functools import wraps
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from flask import jsonify, request
+
+from app.metrics import ADMISSION_EVENTS
+
+CHAT_MESSAGE_TYPES = ('text', 'sticker', 'image', 'voice')
+SLOW_SCAN_INTERVAL = 0.1
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+
+
+class RateLimiter:
+    """Token buckets keyed by an arbitrary string (sid, username, IP).
+
+    Buckets refill at ``rate`` tokens per second up to ``burst``. The number
+    of tracked keys is capped; the least recently used bucket is dropped,
+    which at worst hands an idle client a fresh burst.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _refill(self, key: str, now: float) -> TokenBucket:
+        # 调用方需持有 self._lock
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.burst, now)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        return bucket
+
+    @staticmethod
+    def charge_all(buckets: Sequence[Tuple["RateLimiter", str]], cost: float = 1.0) -> float:
+        """Spend ``cost`` from every ``(limiter, key)`` bucket, or from none of them.
+
+        Returns 0 if admitted, else the longest wait in seconds. The limiter
+        locks are taken in the order given, which callers keep fixed. A cost
+        above a limiter's burst never fits; ``AdmissionControl.check_costs``
+        refuses such configurations at startup.
+        """
+        buckets = [(limiter, key) for limiter, key in buckets if limiter.rate > 0]
+        now = time.monotonic()
+        with ExitStack() as stack:
+            for limiter, _ in buckets:
+                stack.enter_context(limiter._lock)
+            charged = [(limiter, limiter._refill(key, now)) for limiter, key in buckets]
+            wait = max(((cost - bucket.tokens) / limiter.rate for limiter, bucket in charged), default=0.0)
+            if wait > 0:
+                return wait
+            for _, bucket in charged:
+                bucket.tokens -= cost
+        return 0.0
+
+    def forget(self, key: str):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class AdmissionControl:
+    """Admission checks for chat socket events and hot REST routes.
+
+    Chat events are charged against per-sid, per-user and per-IP buckets. The
+    user bucket is keyed on the JWT identity verified when the socket
+    connected, never on a username from the event payload; anonymous sockets
+    are only charged per sid and IP.
+    and checked against per-type payload limits before anything is written or
+    broadcast. Sockets whose outgoing engine.io queue has backed up are left
+    out of broadcasts; once they drain they get a single ``resync`` event with
+    the number of messages they missed instead of the whole backlog.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.sid_limiter = RateLimiter(5, 10)
+        self.user_limiter = RateLimiter(8, 20)
+        self.ip_limiter = RateLimiter(20, 50)
+        self.api_limiter = RateLimiter(10, 30)
+        self.max_text_chars = 2000
+        self.max_media_ref_chars = 512
+        self.max_inline_media_chars = 7 * 1024 * 1024
+        self.slow_queue_depth = 200
+        self._counters: Dict[str, int] = {}
+        self._lagging: Dict[str, int] = {}
+        self._identities: Dict[str, str] = {}
+        self._slow: List[str] = []
+        self._slow_scanned = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get('RATE_LIMIT_ENABLED', True)
+        self.sid_limiter = RateLimiter(config.get('CHAT_RATE_PER_SECOND', 5), config.get('CHAT_BURST', 10))
+        self.user_limiter = RateLimiter(config.get('CHAT_USER_RATE_PER_SECOND', 8), config.get('CHAT_USER_BURST', 20))
+        self.ip_limiter = RateLimiter(config.get('CHAT_IP_RATE_PER_SECOND', 20), config.get('CHAT_IP_BURST', 50))
+        self.api_limiter = RateLimiter(config.get('API_RATE_PER_SECOND', 10), config.get('API_BURST', 30))
+        self.max_text_chars = config.get('CHAT_MAX_TEXT_CHARS', self.max_text_chars)
+        # base64 内联媒体约为原始大小的 4/3
+        self.max_inline_media_chars = config.get('MEDIA_MAX_BYTES', 5 * 1024 * 1024) * 4 // 3 + 256
+        self.slow_queue_depth = config.get('SOCKET_SLOW_QUEUE_DEPTH', self.slow_queue_depth)
+        with self._lock:
+            self._counters = {}
+            self._lagging = {}
+            self._identities = {}
+            self._slow = []
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+        ADMISSION_EVENTS.labels(key).inc(amount)
+
+    def _charge(self, scope: str, buckets: Tuple[Tuple[RateLimiter, Optional[str]], ...],
+                cost: float = 1.0) -> float:
+        if not self.enabled:
+            return 0.0
+        wait = RateLimiter.charge_all([(limiter, key) for limiter, key in buckets if key is not None], cost)
+        if wait:
+            self._count(f'{scope}_rate_limited')
+        return wait
+
+    def check_costs(self):
+        """Refuse to start when a declared cost exceeds the burst of a bucket it is charged to."""
+        if not self.enabled:
+            return
+        limiters = {
+            'api': (('API_BURST', self.api_limiter),),
+            'chat': (('CHAT_BURST', self.sid_limiter), ('CHAT_USER_BURST', self.user_limiter),
+                     ('CHAT_IP_BURST', self.ip_limiter)),
+        }
+        for (scope, name), cost in sorted(_declared_costs.items()):
+            for setting, limiter in limiters[scope]:
+                if limiter.rate > 0 and cost > limiter.burst:
+                    raise ValueError(
+                        f'{setting}={limiter.burst:g} is below the cost of {name} ({cost:g}); '
+                        f'raise {setting} to at least {cost:g}'
+                    )
+
+    def bind_identity(self, sid: str, identity):
+        """Remember the authenticated user behind ``sid`` for the per-user bucket."""
+        with self._lock:
+            self._identities[sid] = f'user:{identity}'
+
+    def check_chat_event(self, sid: str, ip: Optional[str], cost: float = 1.0) -> float:
+        """Charge one socket event; returns 0 if admitted, else a retry-after in seconds."""
+        with self._lock:
+            identity = self._identities.get(sid)
+        return self._charge('chat', (
+            (self.sid_limiter, sid),
+            (self.user_limiter, identity),
+            (self.ip_limiter, ip),
+        ), cost)
+
+    def check_payload(self, msg_type: str, content) -> Optional[str]:
+        """Reason the message body is rejected, or ``None`` if it is acceptable."""
+        if msg_type not in CHAT_MESSAGE_TYPES:
+            reason = 'Unsupported message type'
+        elif not isinstance(content, str):
+            reason = 'Invalid message content'
+        elif msg_type == 'text' and len(content) > self.max_text_chars:
+            reason = f'Message longer than {self.max_text_chars} characters'
+        elif msg_type == 'sticker' and len(content) > 32:
+            reason = 'Invalid sticker'
+        elif msg_type in ('image', 'voice'):
+            inline = content.startswith('data:')
+            limit = self.max_inline_media_chars if inline else self.max_media_ref_chars
+            reason = 'Media payload too large' if len(content) > limit else None
+        else:
+            reason = None
+        if reason:
+            self._count('chat_payload_rejected')
+        return reason
+
+    def forget_sid(self, sid: str):
+        self.sid_limiter.forget(sid)
+        with self._lock:
+            self._lagging.pop(sid, None)
+            self._identities.pop(sid, None)
+
+    def _queue_depths(self, server) -> List[Tuple[str, int]]:
+        depths = []
+        for eio_sid, eio_socket in list(server.eio.sockets.items()):
+            queue = getattr(eio_socket, 'queue', None)
+            if queue is None:
+                continue
+            sid = server.manager.sid_from_eio_sid(eio_sid, '/')
+            if sid is not None:
+                depths.append((sid, queue.qsize()))
+        return depths
+
+    def broadcast_skip(self, server) -> List[str]:
+        """Sids to leave out of the next broadcast because they cannot keep up.
+
+        Queue depths are sampled at most every ``SLOW_SCAN_INTERVAL`` seconds,
+        so the scan over all sockets is not repeated for every message.
+        """
+        if self.slow_queue_depth <= 0:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            rescan = now - self._slow_scanned >= SLOW_SCAN_INTERVAL
+            if rescan:
+                self._slow_scanned = now
+        if rescan:
+            depths = self._queue_depths(server)
+            slow = [sid for sid, depth in depths if depth >= self.slow_queue_depth]
+            slow_set = set(slow)
+        recovered = {}
+        with self._lock:
+            if rescan:
+                self._slow = slow
+                recovered = {sid: n for sid, n in self._lagging.items() if sid not in slow_set}
+                for sid in recovered:
+                    del self._lagging[sid]
+            slow = self._slow
+            for sid in slow:
+                self._lagging[sid] = self._lagging.get(sid, 0) + 1
+            self._counters['slow_consumer_skips'] = self._counters.get('slow_consumer_skips', 0) + len(slow)
+        if slow:
+            ADMISSION_EVENTS.labels('slow_consumer_skips').inc(len(slow))
+
+        # 已恢复的慢连接只收到一条汇总事件，由客户端按需拉取历史
+        for sid, missed in recovered.items():
+            server.emit('resync', {'missed': missed}, to=sid)
+        return slow
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats['lagging_sockets'] = len(self._lagging)
+        stats['enabled'] = self.enabled
+        stats['tracked_buckets'] = {
+            'sid': len(self.sid_limiter),
+            'user': len(self.user_limiter),
+            'ip': len(self.ip_limiter),
+            'api': len(self.api_limiter),
+        }
+        return stats
+
+
+admission = AdmissionControl()
+
+# 各路由/聊天事件声明的开销，启动时与对应令牌桶的 burst 对照
+_declared_costs: Dict[Tuple[str, str], float] = {}
+
+
+def declare_cost(scope: str, name: str, cost: float) -> float:
+    """Record what ``name`` charges in ``scope`` (``api`` or ``chat``) for ``check_costs``."""
+    _declared_costs[(scope, name)] = cost
+    return cost
+
+
+def _api_key() -> str:
+    # 已认证的请求按用户计，否则按客户端 IP
+    try:
+        from flask_jwt_extended import get_jwt_identity
+
+        identity = get_jwt_identity()
+    except RuntimeError:
+        identity = None
+    if identity is not None:
+        return f'user:{identity}'
+    return f'ip:{request.remote_addr}'
+
+
+def rate_limited(cost: float = 1.0):
+    """Charge the wrapped REST route against the shared per-client API bucket.
+
+    Place it below ``@jwt_required()`` so authenticated callers are keyed by
+    user id rather than IP.
+    """
+    def decorator(view):
+        declare_cost('api', f'{view.__module__}.{view.__name__}', cost)
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            wait = admission._charge('api', ((admission.api_limiter, _api_key()),), cost)
+            if wait:
+                response = jsonify({'error': 'Too many requests', 'retry_after': round(wait, 2)})
+                response.headers['Retry-After'] = str(max(1, int(wait + 0.999)))
+                return response, 429
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,236 @@
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Dict, NamedTuple, Optional
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow 未安装时只保存原图
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+AVATAR_URL_PREFIX = '/api/profile/avatars/'
+# 方形裁剪后的边长：聊天列表 / 导航栏与卡片 / 个人主页
+AVATAR_VARIANTS = {'thumb': 96, 'small': 192, 'large': 512}
+DEFAULT_VARIANT = 'large'
+# 支持的输出格式及其扩展名；_VARIANT_IN_URL 与文件服务都只认这两种
+AVATAR_FORMATS = {'webp': 'webp', 'jpeg': 'jpg'}
+CHUNK_SIZE = 64 * 1024
+
+_FILENAME = re.compile(r'^[0-9a-f]{20}-(thumb|small|large|orig)\.(webp|jpg|png|gif)$')
+_VARIANT_IN_URL = re.compile(r'-(thumb|small|large)\.(webp|jpg)$')
+
+
+class AvatarError(ValueError):
+    """Avatar upload rejected: not an image, empty or too large."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class StagedAvatar(NamedTuple):
+    key: str
+    source: str
+    ext: str
+    url: str
+
+
+def avatar_variants(avatar_url: Optional[str]) -> Optional[Dict[str, str]]:
+    """URL of every variant for a stored ``avatar_url``.
+
+    Pipeline URLs differ only in the variant name; legacy and external URLs
+    map every variant to themselves.
+    """
+    if not avatar_url:
+        return None
+    if avatar_url.startswith(AVATAR_URL_PREFIX) and _VARIANT_IN_URL.search(avatar_url):
+        return {name: _VARIANT_IN_URL.sub(rf'-{name}.\2', avatar_url) for name in AVATAR_VARIANTS}
+    return {name: avatar_url for name in AVATAR_VARIANTS}
+
+
+class AvatarPipeline:
+    """Resizes uploaded avatars on a worker pool into content-hashed files.
+
+    The request only streams the upload to a temp file while hashing it; the
+    final file names derive from that hash plus the pipeline settings, so the
+    URLs are known before the resize runs and never change content, which is
+    what makes them safe to serve as ``immutable``. A request for a variant
+    that is still being produced waits for its job.
+
+    Uploads are handled in two steps: ``stage`` in the request, ``process``
+    once the new URL is committed (or ``discard`` if the request fails).
+    """
+
+    def __init__(self, root: Optional[str] = None, workers: int = 2, image_format: str = 'webp',
+                 quality: int = 85, max_bytes: int = 5 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.image_format = image_format
+        self.quality = quality
+        self._app = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self._app = app
+        self.root = app.config.get('AVATAR_ROOT') or os.path.join(app.instance_path, 'avatars')
+        self.workers = app.config.get('AVATAR_WORKERS', self.workers)
+        self.quality = app.config.get('AVATAR_QUALITY', self.quality)
+        self.max_bytes = app.config.get('AVATAR_MAX_BYTES', self.max_bytes)
+        image_format = app.config.get('AVATAR_FORMAT', self.image_format)
+        if image_format not in AVATAR_FORMATS:
+            raise ValueError(f'Unsupported AVATAR_FORMAT {image_format!r}; use webp or jpeg')
+        if image_format == 'webp' and (Image is None or not features.check('webp')):
+            image_format = 'jpeg'
+        self.image_format = image_format
+        os.makedirs(self.root, exist_ok=True)
+        if Image is None:
+            logger.warning('avatar_pipeline_without_pillow: avatars are stored without resizing')
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._executor = ThreadPoolExecutor(max_workers=max(self.workers, 1), thread_name_prefix='avatar')
+
+    @property
+    def resizing(self) -> bool:
+        return Image is not None
+
+    def _signature(self) -> bytes:
+        # 处理参数变化时文件名随之变化，旧 URL 的内容保持不变
+        sizes = ','.join(f'{k}={v}' for k, v in sorted(AVATAR_VARIANTS.items()))
+        return f'{sizes};{self.image_format};{self.quality}'.encode()
+
+    def _extension(self) -> str:
+        return AVATAR_FORMATS[self.image_format]
+
+    def path_for(self, filename: str) -> Optional[str]:
+        if not _FILENAME.match(filename or ''):
+            return None
+        return os.path.join(self.root, filename)
+
+    def stage(self, stream: BinaryIO, original_ext: str) -> StagedAvatar:
+        """Stream an upload to a temp file, check it and derive its final URL."""
+        hasher = hashlib.sha256(self._signature())
+        size = 0
+        fd, source = tempfile.mkstemp(prefix='.upload-', dir=self.root)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise AvatarError('File too large', 413)
+                    hasher.update(chunk)
+                    out.write(chunk)
+            if size == 0:
+                raise AvatarError('Empty upload')
+            if self.resizing:
+                # 只解析文件头，完整解码留给后台任务
+                try:
+                    with Image.open(source) as image:
+                        image.verify()
+                except Exception as exc:
+                    raise AvatarError('Uploaded file is not a valid image') from exc
+        except BaseException:
+            os.remove(source)
+            raise
+
+        key = hasher.hexdigest()[:20]
+        if self.resizing:
+            filename = f'{key}-{DEFAULT_VARIANT}.{self._extension()}'
+        else:
+            filename = f'{key}-orig.{original_ext}'
+
+        return StagedAvatar(key, source, original_ext, AVATAR_URL_PREFIX + filename)
+
+    def process(self, staged: StagedAvatar, on_failure=None):
+        """Queue the resize of a staged upload.
+
+        ``on_failure(url)`` is called inside an app context if the image turns
+        out to be undecodable, so the caller can roll the user back.
+        """
+        filename = staged.url[len(AVATAR_URL_PREFIX):]
+        with self._lock:
+            if staged.key in self._pending or os.path.exists(os.path.join(self.root, filename)):
+                self.discard(staged)
+            else:
+                self._pending[staged.key] = self._executor.submit(self._process, staged, on_failure)
+
+    def discard(self, staged: StagedAvatar):
+        if os.path.exists(staged.source):
+            os.remove(staged.source)
+
+    def _process(self, staged: StagedAvatar, on_failure):
+        try:
+            if self.resizing:
+                self._resize(staged.key, staged.source)
+            else:
+                self._publish(staged.source, f'{staged.key}-orig.{staged.ext}', copy=True)
+        except Exception:
+            logger.exception('avatar_processing_failed', extra={'key': staged.key})
+            if on_failure is not None:
+                with self._app.app_context():
+                    on_failure(staged.url)
+        finally:
+            self.discard(staged)
+            with self._lock:
+                self._pending.pop(staged.key, None)
+
+    def _resize(self, key: str, source: str):
+        with Image.open(source) as image:
+            image = ImageOps.exif_transpose(image)
+            image = image.convert('RGBA' if self.image_format == 'webp' else 'RGB')
+            for name, size in AVATAR_VARIANTS.items():
+                variant = ImageOps.fit(image, (size, size), Image.LANCZOS)
+                fd, tmp = tempfile.mkstemp(prefix='.variant-', dir=self.root)
+                with os.fdopen(fd, 'wb') as out:
+                    variant.save(out, format=self.image_format.upper(), quality=self.quality)
+                self._publish(tmp, f'{key}-{name}.{self._extension()}')
+
+    def _publish(self, path: str, filename: str, copy: bool = False):
+        final = os.path.join(self.root, filename)
+        if copy:
+            fd, tmp = tempfile.mkstemp(prefix='.variant-', dir=self.root)
+            os.close(fd)
+            shutil.copyfile(path, tmp)
+            path = tmp
+        os.replace(path, final)
+
+    def wait(self, filename: str, timeout: float = 10.0):
+        """Block until the job producing ``filename`` (if any) has finished."""
+        with self._lock:
+            future = self._pending.get(filename[:20])
+        if future is not None:
+            future.result(timeout=timeout)
+
+    def discard_legacy(self, static_root: str, avatar_url: Optional[str]):
+        """Delete a pre-pipeline ``/static/avatars`` file in the background.
+
+        Content-hashed files may be shared by several users and are kept.
+        """
+        if not avatar_url or not avatar_url.startswith('/static/avatars/'):
+            return
+        path = os.path.join(static_root, avatar_url[len('/static/'):])
+
+        def remove():
+            if os.path.exists(path):
+                os.remove(path)
+        self._executor.submit(remove)
+
+    def shutdown(self, wait: bool = True):
+        """Finish the queued resize jobs (``wait``) and stop the thread pool."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+
+avatar_pipeline = AvatarPipeline()
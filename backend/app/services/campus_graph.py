@@ -0,0 +1,234 @@
+import heapq
+import json
+import math
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+EARTH_RADIUS_M = 6371008.8
+
+# 步行图中排除的道路类型（OSM highway 标签）
+EXCLUDED_HIGHWAYS = {'motorway', 'motorway_link', 'trunk', 'trunk_link', 'construction', 'proposed'}
+
+SNAP_CELL_M = 50.0
+
+
+class CampusGraph:
+    """Compact array-backed walking graph answering shortest-path queries.
+
+    Node coordinates are projected once onto a local equirectangular plane
+    (metres) so edge weights and the A* heuristic are plain Euclidean
+    distances; the heuristic is therefore exact-admissible. Adjacency is
+    stored in CSR form: the edges of node ``u`` are
+    ``targets[offsets[u]:offsets[u + 1]]``.
+    """
+
+    def __init__(self, lats, lons, edges: List[Tuple[int, int, int]], names: List[str]):
+        self.lats = array('d', lats)
+        self.lons = array('d', lons)
+        self.names = names
+
+        self._ref_lat = math.radians(sum(self.lats) / len(self.lats)) if self.lats else 0.0
+        self._ref_lon = sum(self.lons) / len(self.lons) if self.lons else 0.0
+        scale = math.pi / 180 * EARTH_RADIUS_M
+        cos_ref = math.cos(self._ref_lat)
+        self.xs = array('d', ((lon - self._ref_lon) * scale * cos_ref for lon in self.lons))
+        self.ys = array('d', (lat * scale for lat in self.lats))
+
+        node_count = len(self.lats)
+        degree = [0] * (node_count + 1)
+        for u, v, _ in edges:
+            degree[u + 1] += 1
+            degree[v + 1] += 1
+        for i in range(node_count):
+            degree[i + 1] += degree[i]
+        self.offsets = array('l', degree)
+
+        edge_count = degree[node_count]
+        self.targets = array('l', bytes(array('l').itemsize * edge_count))
+        self.weights = array('d', bytes(array('d').itemsize * edge_count))
+        self.edge_names = array('l', bytes(array('l').itemsize * edge_count))
+        fill = list(degree[:node_count])
+        for u, v, name_id in edges:
+            weight = math.hypot(self.xs[u] - self.xs[v], self.ys[u] - self.ys[v])
+            for a, b in ((u, v), (v, u)):
+                slot = fill[a]
+                self.targets[slot] = b
+                self.weights[slot] = weight
+                self.edge_names[slot] = name_id
+                fill[a] += 1
+
+        self._snap_cells: Dict[Tuple[int, int], List[int]] = {}
+        for node in range(node_count):
+            self._snap_cells.setdefault(self._snap_cell(self.xs[node], self.ys[node]), []).append(node)
+
+    def __len__(self):
+        return len(self.lats)
+
+    @classmethod
+    def from_geojson(cls, path: str) -> "CampusGraph":
+        """Build a walking graph from the LineString ways of a GeoJSON extract.
+
+        Works with ``osmium export``/overpass style extracts: ``highway``,
+        ``foot``, ``access`` and ``name`` properties are honoured when present.
+        """
+        with open(path, encoding='utf-8') as fh:
+            data = json.load(fh)
+
+        node_ids: Dict[Tuple[float, float], int] = {}
+        lats: List[float] = []
+        lons: List[float] = []
+        names: List[str] = ['']
+        name_ids: Dict[str, int] = {'': 0}
+        edges: List[Tuple[int, int, int]] = []
+
+        def node_for(coord):
+            key = (round(coord[0], 7), round(coord[1], 7))
+            node = node_ids.get(key)
+            if node is None:
+                node = node_ids[key] = len(lats)
+                lons.append(key[0])
+                lats.append(key[1])
+            return node
+
+        for feature in data.get('features', []):
+            geometry = feature.get('geometry') or {}
+            props = feature.get('properties') or {}
+            if not _walkable(props):
+                continue
+            if geometry.get('type') == 'LineString':
+                lines = [geometry.get('coordinates', [])]
+            elif geometry.get('type') == 'MultiLineString':
+                lines = geometry.get('coordinates', [])
+            else:
+                continue
+
+            name = props.get('name') or ''
+            if name not in name_ids:
+                name_ids[name] = len(names)
+                names.append(name)
+            name_id = name_ids[name]
+
+            for line in lines:
+                previous = None
+                for coord in line:
+                    node = node_for(coord)
+                    if previous is not None and previous != node:
+                        edges.append((previous, node, name_id))
+                    previous = node
+
+        if not lats:
+            raise ValueError(f'No walkable ways found in {path}')
+        return cls(lats, lons, edges, names)
+
+    def _snap_cell(self, x: float, y: float) -> Tuple[int, int]:
+        return (math.floor(x / SNAP_CELL_M), math.floor(y / SNAP_CELL_M))
+
+    def project(self, lat: float, lon: float) -> Tuple[float, float]:
+        scale = math.pi / 180 * EARTH_RADIUS_M
+        return (lon - self._ref_lon) * scale * math.cos(self._ref_lat), lat * scale
+
+    def nearest_node(self, lat: float, lon: float, max_distance_m: float) -> Optional[int]:
+        """Nearest graph node within ``max_distance_m``, searched in growing rings."""
+        x, y = self.project(lat, lon)
+        cx, cy = self._snap_cell(x, y)
+        best, best_dist = None, max_distance_m
+        max_ring = int(max_distance_m // SNAP_CELL_M) + 1
+        for ring in range(max_ring + 1):
+            # 当前环之外的点距离至少为 (ring - 1) 个格子
+            if best is not None and (ring - 1) * SNAP_CELL_M > best_dist:
+                break
+            for gx in range(cx - ring, cx + ring + 1):
+                for gy in range(cy - ring, cy + ring + 1):
+                    if max(abs(gx - cx), abs(gy - cy)) != ring:
+                        continue
+                    for node in self._snap_cells.get((gx, gy), ()):
+                        dist = math.hypot(self.xs[node] - x, self.ys[node] - y)
+                        if dist <= best_dist:
+                            best, best_dist = node, dist
+        return best
+
+    def shortest_path(self, source: int, target: int) -> Optional[Tuple[List[int], float]]:
+        """A* search; returns the node sequence and its length in metres."""
+        if source == target:
+            return [source], 0.0
+
+        xs, ys = self.xs, self.ys
+        offsets, targets, weights = self.offsets, self.targets, self.weights
+        tx, ty = xs[target], ys[target]
+
+        dist = {source: 0.0}
+        parent = {source: -1}
+        closed = set()
+        # f 相同时优先展开离终点更近（g 更大）的节点，减少等代价平台上的无效搜索
+        heap = [(math.hypot(xs[source] - tx, ys[source] - ty), 0.0, source)]
+        heappush, heappop, hypot = heapq.heappush, heapq.heappop, math.hypot
+        inf = math.inf
+
+        while heap:
+            _, _, u = heappop(heap)
+            if u == target:
+                break
+            if u in closed:
+                continue
+            closed.add(u)
+            du = dist[u]
+            for slot in range(offsets[u], offsets[u + 1]):
+                v = targets[slot]
+                if v in closed:
+                    continue
+                dv = du + weights[slot]
+                if dv < dist.get(v, inf):
+                    dist[v] = dv
+                    parent[v] = u
+                    heappush(heap, (dv + hypot(xs[v] - tx, ys[v] - ty), -dv, v))
+        else:
+            return None
+
+        path = [target]
+        while parent[path[-1]] != -1:
+            path.append(parent[path[-1]])
+        path.reverse()
+        return path, dist[target]
+
+    def distances_from(self, source: int, targets: List[int]) -> List[Optional[float]]:
+        """One-to-many Dijkstra, stopping once every target is settled."""
+        offsets, targets_arr, weights = self.offsets, self.targets, self.weights
+        remaining = set(targets)
+        dist = {source: 0.0}
+        settled = set()
+        heap = [(0.0, source)]
+        heappush, heappop = heapq.heappush, heapq.heappop
+        inf = math.inf
+
+        while heap and remaining:
+            du, u = heappop(heap)
+            if u in settled:
+                continue
+            settled.add(u)
+            remaining.discard(u)
+            for slot in range(offsets[u], offsets[u + 1]):
+                v = targets_arr[slot]
+                dv = du + weights[slot]
+                if dv < dist.get(v, inf):
+                    dist[v] = dv
+                    heappush(heap, (dv, v))
+
+        return [dist[t] if t in settled else None for t in targets]
+
+    def edge_between(self, u: int, v: int) -> Tuple[float, int]:
+        """Weight and name id of the edge ``u -> v``."""
+        for slot in range(self.offsets[u], self.offsets[u + 1]):
+            if self.targets[slot] == v:
+                return self.weights[slot], self.edge_names[slot]
+        raise KeyError((u, v))
+
+    def bearing(self, u: int, v: int) -> float:
+        return math.degrees(math.atan2(self.xs[v] - self.xs[u], self.ys[v] - self.ys[u])) % 360
+
+
+def _walkable(props: dict) -> bool:
+    if props.get('foot') in ('no', 'private'):
+        return False
+    if props.get('access') in ('no', 'private') and props.get('foot') not in ('yes', 'designated', 'permissive'):
+        return False
+    return props.get('highway') not in EXCLUDED_HIGHWAYS
@@ -0,0 +1,81 @@
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+
+class ChatHistoryBuffer:
+    """Ring buffer holding the latest ``size`` serialized chat messages.
+
+    Handlers append every message as it is broadcast, so replaying recent
+    history on ``join`` needs no database access. The buffer is warmed from the
+    database once (at startup or on first use).
+
+    With a Socket.IO message queue other workers accept messages this process
+    never sees, so the buffer is bypassed (``shared``) and ``recent`` reads the
+    database instead.
+    """
+
+    def __init__(self, size: int = 50):
+        self.size = size
+        self.shared = False
+        self._messages: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._warm = False
+
+    def init_app(self, app):
+        self.size = app.config.get('CHAT_HISTORY_BUFFER', self.size)
+        self.shared = bool(app.config.get('SOCKETIO_MESSAGE_QUEUE'))
+        with self._lock:
+            self._messages = deque(maxlen=self.size)
+            self._warm = False
+
+    def warm(self):
+        """Load the newest messages from the database if not done yet."""
+        if self._warm or self.shared:
+            return
+        from app import db
+        from app.models.chat_message import ChatMessage
+        from app.serialization import chat_message_dicts, chat_message_select
+
+        with self._lock:
+            if self._warm:
+                return
+            rows = db.session.execute(chat_message_select().order_by(ChatMessage.id.desc()).limit(self.size)).all()
+            self._messages.extend(chat_message_dicts(reversed(rows)))
+            self._warm = True
+
+    def append(self, message: Dict):
+        if self.shared:
+            return
+        self.warm()
+        with self._lock:
+            self._messages.append(message)
+
+    def recent(self) -> List[Dict]:
+        if self.shared:
+            from app.services.chat_writer import chat_writer
+
+            chat_writer.flush()
+            return history_page(None, self.size)['messages']
+        self.warm()
+        with self._lock:
+            return list(self._messages)
+
+
+def history_page(before_id: Optional[int], limit: int) -> Dict:
+    """Keyset-paginated history, newest page first, messages oldest-first within a page."""
+    from app import db
+    from app.models.chat_message import ChatMessage
+    from app.serialization import chat_message_dicts, chat_message_select
+
+    statement = chat_message_select()
+    if before_id is not None:
+        statement = statement.where(ChatMessage.id < before_id)
+    rows = db.session.execute(statement.order_by(ChatMessage.id.desc()).limit(limit)).all()
+    return {
+        'messages': chat_message_dicts(reversed(rows)),
+        'next_before_id': rows[-1][0] if len(rows) == limit else None,
+    }
+
+
+chat_history = ChatHistoryBuffer()
@@ -0,0 +1,266 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+
+from app import db, socketio
+from app.metrics import CHAT_MESSAGES_DROPPED
+
+logger = logging.getLogger(__name__)
+
+FLUSH_RETRIES = 3
+
+
+class ChatWriteBehind:
+    """Write-behind persistence stage for chat messages.
+
+    Handlers broadcast first and enqueue the row; a background task drains the
+    bounded queue and inserts rows in one transaction per batch, flushing when
+    ``batch_size`` rows are waiting or ``flush_interval`` seconds have passed.
+    When the queue is full the producer waits up to ``put_timeout`` and then
+    writes its own row inline, so memory stays bounded. A batch that still
+    fails after ``FLUSH_RETRIES`` attempts is written again one row per
+    transaction; only rows that fail on their own are dropped, each logged at
+    error level and counted in ``dropped`` and the ``chat_messages_dropped``
+    metric.
+    """
+
+    def __init__(self, max_queue: int = 10000, batch_size: int = 200, flush_interval: float = 0.05,
+                 put_timeout: float = 0.5, enabled: bool = True):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.enabled = enabled
+        self._app = None
+        self._queue: "queue.Queue[dict]" = queue.Queue(maxsize=max_queue)
+        self._started = False
+        self._stopping = False
+        self._start_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._written = threading.Condition(self._stats_lock)
+        self._unwritten = 0
+        self._worker = None
+        self._counters = self._empty_counters()
+        atexit.register(self.stop)
+
+    @staticmethod
+    def _empty_counters() -> Dict[str, float]:
+        return {
+            'enqueued': 0,
+            'written': 0,
+            'batches': 0,
+            'inline_writes': 0,
+            'backpressure_waits': 0,
+            'failed_batches': 0,
+            'row_fallbacks': 0,
+            'dropped': 0,
+            'max_depth': 0,
+            'flush_ms_last': 0.0,
+            'flush_ms_max': 0.0,
+            'flush_ms_total': 0.0,
+        }
+
+    def init_app(self, app):
+        self._app = app
+        self.enabled = app.config.get('CHAT_WRITE_BEHIND', self.enabled)
+        self.batch_size = app.config.get('CHAT_FLUSH_BATCH', self.batch_size)
+        self.flush_interval = app.config.get('CHAT_FLUSH_INTERVAL_MS', self.flush_interval * 1000) / 1000
+        self.put_timeout = app.config.get('CHAT_QUEUE_PUT_TIMEOUT_MS', self.put_timeout * 1000) / 1000
+        max_queue = app.config.get('CHAT_QUEUE_MAX', self.max_queue)
+        if max_queue != self.max_queue and not self._started:
+            self.max_queue = max_queue
+            self._queue = queue.Queue(maxsize=max_queue)
+
+    def _ensure_started(self):
+        if self._started:
+            return
+        with self._start_lock:
+            if not self._started:
+                self._worker = socketio.start_background_task(self._run)
+                self._started = True
+
+    def enqueue(self, row: dict, message: Optional[dict] = None):
+        """Queue one ``ChatMessage`` row (column name -> value) for persistence.
+
+        ``message`` is the already broadcast serialized form; its ``id`` is
+        filled in once the row has been inserted.
+        """
+        item = (row, message)
+        if not self.enabled or self._stopping:
+            self._write([item], inline=True)
+            return
+
+        self._ensure_started()
+        with self._stats_lock:
+            self._unwritten += 1
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._stats_lock:
+                self._counters['backpressure_waits'] += 1
+            try:
+                self._queue.put(item, timeout=self.put_timeout)
+            except queue.Full:
+                with self._written:
+                    self._unwritten -= 1
+                self._write([item], inline=True)
+                return
+
+        with self._stats_lock:
+            self._counters['enqueued'] += 1
+            self._counters['max_depth'] = max(self._counters['max_depth'], self._queue.qsize())
+
+    def _drain(self, limit: int) -> List[Tuple[dict, Optional[dict]]]:
+        rows = []
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _run(self):
+        while not self._stopping:
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            # 攒批：等到批量上限或时间窗口结束
+            rows = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(rows) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    rows.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(rows)
+
+    def flush(self, timeout: float = 5.0):
+        """Write everything queued so far and wait until it is committed.
+
+        Rows already taken by the background task are waited for, so callers
+        can rely on the database being up to date when this returns.
+        """
+        while True:
+            rows = self._drain(self.batch_size)
+            if not rows:
+                break
+            self._write(rows)
+        with self._written:
+            self._written.wait_for(lambda: self._unwritten <= 0, timeout)
+
+    def _write(self, items: List[Tuple[dict, Optional[dict]]], inline: bool = False):
+        try:
+            self._insert(items, inline)
+        finally:
+            if not inline:
+                with self._written:
+                    self._unwritten -= len(items)
+                    self._written.notify_all()
+
+    def _commit(self, rows: List[dict]) -> Optional[List[int]]:
+        """Insert ``rows`` in one transaction; returns their ids when the dialect reports them in order."""
+        from app.models.chat_message import ChatMessage
+
+        with self._flush_lock, self._app.app_context():
+            if db.engine.dialect.insert_executemany_returning_sort_by_parameter_order:
+                stmt = insert(ChatMessage).returning(ChatMessage.id, sort_by_parameter_order=True)
+                ids = db.session.scalars(stmt, rows).all()
+            else:
+                db.session.execute(insert(ChatMessage), rows)
+                ids = None
+            db.session.commit()
+        return ids
+
+    def _insert(self, items: List[Tuple[dict, Optional[dict]]], inline: bool):
+        rows = [row for row, _ in items]
+        started = time.perf_counter()
+        for attempt in range(FLUSH_RETRIES):
+            try:
+                ids = self._commit(rows)
+                break
+            except Exception:
+                logger.exception('chat_flush_failed', extra={'rows': len(rows), 'attempt': attempt + 1})
+                with self._stats_lock:
+                    self._counters['failed_batches'] += 1
+                time.sleep(0.05 * (attempt + 1))
+        else:
+            # 整批仍然失败（例如某一行违反约束）：逐条写入，只丢弃单独写也失败的消息
+            self._insert_each(items, inline)
+            return
+        self._written_rows(items, ids, started, inline)
+
+    def _insert_each(self, items: List[Tuple[dict, Optional[dict]]], inline: bool):
+        with self._stats_lock:
+            self._counters['row_fallbacks'] += 1
+        for item in items:
+            row = item[0]
+            started = time.perf_counter()
+            try:
+                ids = self._commit([row])
+            except Exception:
+                # 已广播给客户端的消息无法落库，逐条记录以便人工补救
+                logger.error('chat_message_dropped', exc_info=True, extra={
+                    'username': row.get('username'), 'msg_type': row.get('msg_type'),
+                    'timestamp': str(row.get('timestamp')), 'content': str(row.get('content'))[:200],
+                })
+                with self._stats_lock:
+                    self._counters['dropped'] += 1
+                CHAT_MESSAGES_DROPPED.inc()
+                continue
+            self._written_rows([item], ids, started, inline)
+
+    def _written_rows(self, items: List[Tuple[dict, Optional[dict]]], ids: Optional[List[int]], started: float,
+                      inline: bool):
+        if ids is not None:
+            for (_, message), new_id in zip(items, ids):
+                if message is not None:
+                    message['id'] = new_id
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self._counters['written'] += len(items)
+            self._counters['batches'] += 1
+            if inline:
+                self._counters['inline_writes'] += 1
+            self._counters['flush_ms_last'] = elapsed_ms
+            self._counters['flush_ms_max'] = max(self._counters['flush_ms_max'], elapsed_ms)
+            self._counters['flush_ms_total'] += elapsed_ms
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the background task and persist whatever is still queued.
+
+        ``flush`` also waits for rows the task has already taken, so the task
+        itself is not joined (eventlet's task handle has no join timeout).
+        """
+        if self._app is None:
+            return
+        self._stopping = True
+        self.flush(timeout)
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self._counters)
+        total_ms = stats.pop('flush_ms_total')
+        stats['flush_ms_avg'] = round(total_ms / stats['batches'], 3) if stats['batches'] else None
+        stats['flush_ms_last'] = round(stats['flush_ms_last'], 3)
+        stats['flush_ms_max'] = round(stats['flush_ms_max'], 3)
+        stats['depth'] = self.depth()
+        stats['capacity'] = self.max_queue
+        stats['enabled'] = self.enabled
+        return stats
+
+
+chat_writer = ChatWriteBehind()
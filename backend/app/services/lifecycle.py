@@ -0,0 +1,53 @@
+import logging
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Lifecycle:
+    """Drain state of this worker process.
+
+    The production server (``serve.py``) calls ``begin_drain`` on SIGTERM.
+    From then on ``/readyz`` answers 503 so the load balancer sends new
+    clients elsewhere, and Socket.IO disconnects are not announced as users
+    leaving because the clients reconnect to another worker.
+    """
+
+    def __init__(self):
+        self.draining = False
+        self.drain_started_at: Optional[float] = None
+
+    def init_app(self, app):
+        self.draining = False
+        self.drain_started_at = None
+
+    def begin_drain(self):
+        if self.draining:
+            return
+        self.drain_started_at = time.time()
+        self.draining = True
+        logger.info('drain_started')
+
+    def shutdown_services(self):
+        """Persist queued chat rows and stop the worker pools; call after the server has stopped."""
+        from app.services.avatar_pipeline import avatar_pipeline
+        from app.services.chat_writer import chat_writer
+        from app.services.password_hasher import password_hasher
+
+        for name, stop in (
+            ('chat_writer', chat_writer.stop),
+            ('avatar_pipeline', avatar_pipeline.shutdown),
+            ('password_hasher', lambda: password_hasher.shutdown(wait=True)),
+        ):
+            try:
+                stop()
+            except Exception:
+                logger.exception('service_shutdown_failed', extra={'service': name})
+        logger.info('services_stopped', extra={'chat_written': chat_writer.stats()['written']})
+
+    def status(self):
+        return {'draining': self.draining, 'drain_started_at': self.drain_started_at}
+
+
+lifecycle = Lifecycle()
@@ -0,0 +1,307 @@
+import io
+import logging
+from itertools import islice
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import delete, insert, select
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from app import db
+from app.services.marker_clusters import marker_clusters
+from app.services.marker_index import marker_index
+from app.services.marker_sync import marker_sync
+
+logger = logging.getLogger(__name__)
+
+# 每个响应最多列出的逐项错误
+MAX_ERRORS = 100
+MAX_LINE_BYTES = 64 * 1024
+READ_BUFFER = 64 * 1024
+
+# (序号, 解析后的对象, 解析错误)
+Item = Tuple[int, object, Optional[str]]
+
+
+class MarkerImportError(ValueError):
+    """Bulk request rejected as a whole: unreadable body, too large or a database failure."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def valid_coordinate(value, bound):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and -bound <= value <= bound
+
+
+def _feature_fields(feature: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+    geometry = feature.get('geometry')
+    properties = feature.get('properties') or {}
+    if not isinstance(geometry, dict) or geometry.get('type') != 'Point':
+        return None, 'Unsupported geometry, expected Point'
+    coordinates = geometry.get('coordinates')
+    if not isinstance(properties, dict) or not isinstance(coordinates, list) or len(coordinates) < 2:
+        return None, 'Invalid feature'
+    # GeoJSON 坐标顺序为 [经度, 纬度]
+    return {
+        'title': properties.get('title'),
+        'description': properties.get('description', ''),
+        'latitude': coordinates[1],
+        'longitude': coordinates[0],
+    }, None
+
+
+def marker_row(data, user_id: int) -> Tuple[Optional[Dict], Optional[str]]:
+    """Validate one marker (plain object or GeoJSON Point feature) and return its ``MapMarker`` row."""
+    if isinstance(data, dict) and data.get('type') == 'Feature':
+        data, error = _feature_fields(data)
+        if error:
+            return None, error
+    if (
+        not isinstance(data, dict)
+        or not isinstance(data.get('title'), str)
+        or not data['title'].strip()
+        or data.get('latitude') is None
+        or data.get('longitude') is None
+    ):
+        return None, 'Missing required fields'
+    if not valid_coordinate(data['latitude'], 90) or not valid_coordinate(data['longitude'], 180):
+        return None, 'Invalid coordinates'
+    description = data.get('description', '')
+    if description is not None and not isinstance(description, str):
+        return None, 'Invalid description'
+    return {
+        'title': data['title'],
+        'description': description,
+        'latitude': data['latitude'],
+        'longitude': data['longitude'],
+        'user_id': user_id,
+    }, None
+
+
+def marker_feature(marker: Dict) -> Dict:
+    """GeoJSON Point feature for a marker dict in ``MARKER_FIELDS`` form."""
+    return {
+        'type': 'Feature',
+        'id': marker['id'],
+        'geometry': {'type': 'Point', 'coordinates': [marker['longitude'], marker['latitude']]},
+        'properties': {
+            'title': marker['title'],
+            'description': marker['description'],
+            'user_id': marker['user_id'],
+            'created_at': marker['created_at'],
+            'revision': marker['revision'],
+        },
+    }
+
+
+def iter_items(values: Iterable) -> Iterator[Item]:
+    for index, value in enumerate(values):
+        yield index, value, None
+
+
+def iter_lines(stream: BinaryIO, max_line: int = MAX_LINE_BYTES) -> Iterator[Item]:
+    """Parse an NDJSON or GeoJSON text sequence (RFC 8142) body one line at a time.
+
+    Items are numbered by line. Blank lines are skipped; unparsable or
+    overlong lines are reported as errors instead of aborting the import.
+    """
+    if isinstance(stream, io.RawIOBase):
+        # LimitedStream 没有缓冲，逐行读取会退化成逐字节读取
+        stream = io.BufferedReader(stream, READ_BUFFER)
+    loads = current_app.json.loads
+    number = 0
+    while True:
+        line = stream.readline(max_line + 1)
+        if not line:
+            break
+        number += 1
+        if len(line) > max_line and not line.endswith(b'\n'):
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(max_line)
+            yield number, None, 'Line too long'
+            continue
+        line = line.strip(b'\x1e \t\r\n')
+        if not line:
+            continue
+        try:
+            yield number, loads(line), None
+        except ValueError:
+            yield number, None, 'Invalid JSON'
+
+
+def load_document(stream: BinaryIO) -> Iterator[Item]:
+    """Items of a GeoJSON FeatureCollection or a JSON array of markers.
+
+    The document is parsed as a whole; use NDJSON for imports that should
+    not be held in memory.
+    """
+    try:
+        document = current_app.json.loads(stream.read())
+    except ValueError:
+        raise MarkerImportError('Invalid JSON')
+    if isinstance(document, dict) and document.get('type') == 'FeatureCollection':
+        document = document.get('features')
+    elif isinstance(document, dict) and 'markers' in document:
+        document = document['markers']
+    if not isinstance(document, list):
+        raise MarkerImportError('Expected a FeatureCollection or an array of markers')
+    return iter_items(document)
+
+
+class MarkerBulk:
+    """Bulk create and delete for map markers.
+
+    Items are validated one by one, then written ``chunk_size`` at a time
+    with one ``INSERT``/``DELETE`` statement per chunk. Each chunk is its own
+    transaction with its own marker revision, so a long import never holds
+    the write lock for more than one chunk and other writers interleave. A
+    failed chunk is rolled back and ends the request; earlier chunks stay
+    committed and are reported.
+    """
+
+    def __init__(self, chunk_size: int = 1000, max_items: int = 5000, import_max_bytes: int = 200 * 1024 * 1024):
+        self.chunk_size = chunk_size
+        self.max_items = max_items
+        self.import_max_bytes = import_max_bytes
+
+    def init_app(self, app):
+        self.chunk_size = max(app.config.get('MARKER_BULK_CHUNK', self.chunk_size), 1)
+        self.max_items = app.config.get('MARKER_BULK_MAX', self.max_items)
+        self.import_max_bytes = app.config.get('MARKER_IMPORT_MAX_BYTES', self.import_max_bytes)
+
+    @staticmethod
+    def _chunks(values: Iterable, size: int) -> Iterator[List]:
+        iterator = iter(values)
+        while True:
+            chunk = list(islice(iterator, size))
+            if not chunk:
+                return
+            yield chunk
+
+    def _insert_chunk(self, rows: List[Dict]) -> Tuple[int, List[Dict]]:
+        from app.models.map_marker import MapMarker
+        from app.serialization import MARKER_FIELDS, fetch_dicts, marker_select
+
+        try:
+            revision = marker_sync.next_revision()
+            for row in rows:
+                row['revision'] = revision
+            # 直接用 Core 表写入，跳过 ORM 批量写入的逐行处理。带 RETURNING 时 SQLAlchemy
+            # 按多行 VALUES 分批执行；逐行 executemany 会让全文索引触发器每行单独落盘一个段
+            table = MapMarker.__table__
+            if db.engine.dialect.insert_executemany_returning:
+                db.session.execute(insert(table).returning(table.c.id), rows)
+            else:
+                db.session.execute(insert(table), rows)
+            # 一个事务只占用一个修订号，按修订号即可取回本批新建的标记
+            markers = fetch_dicts(
+                MARKER_FIELDS, marker_select().where(MapMarker.revision == revision).order_by(MapMarker.id)
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception('marker_bulk_insert_failed', extra={'rows': len(rows)})
+            raise MarkerImportError('Failed to save markers', 500)
+
+        for marker in markers:
+            # 推送经 Socket.IO 的标准库 json 编码，时间与 to_dict() 一样先转成字符串
+            marker['created_at'] = marker['created_at'].isoformat()
+        positions = [(marker['id'], marker['latitude'], marker['longitude']) for marker in markers]
+        marker_index.add_many(positions, revision)
+        marker_clusters.add_many(positions, revision)
+        marker_sync.publish(revision, markers=markers)
+        return revision, markers
+
+    def create(self, items: Iterable[Item], user_id: int, collect: bool = False) -> Dict:
+        """Insert the valid markers among ``items``, owned by ``user_id``.
+
+        Returns the counts, the first ``MAX_ERRORS`` item errors and the
+        last revision written; with ``collect`` also the created markers.
+        A ``MarkerImportError`` (from reading ``items`` or from the database)
+        is recorded under ``error``/``status_code``.
+        """
+        result = {'created': 0, 'failed': 0, 'errors': [], 'revision': None}
+        if collect:
+            result['markers'] = []
+
+        rows = []
+
+        def flush():
+            revision, markers = self._insert_chunk(rows)
+            result['created'] += len(markers)
+            result['revision'] = revision
+            if collect:
+                result['markers'].extend(markers)
+            rows.clear()
+
+        try:
+            for index, data, error in items:
+                row = None
+                if error is None:
+                    row, error = marker_row(data, user_id)
+                if error:
+                    result['failed'] += 1
+                    if len(result['errors']) < MAX_ERRORS:
+                        result['errors'].append({'index': index, 'error': error})
+                    continue
+                rows.append(row)
+                if len(rows) >= self.chunk_size:
+                    flush()
+            if rows:
+                flush()
+        except RequestEntityTooLarge:
+            result.update(error='File too large', status_code=413)
+        except MarkerImportError as exc:
+            result.update(error=str(exc), status_code=exc.status_code)
+        return result
+
+    def delete(self, marker_ids: List[int], user_id: int) -> Dict:
+        """Delete the markers of ``marker_ids`` that belong to ``user_id``.
+
+        Ids owned by someone else are returned as ``forbidden`` and missing
+        ids as ``not_found``; neither stops the rest of the batch.
+        """
+        from app.models.map_marker import MapMarker
+
+        result = {'deleted': [], 'forbidden': [], 'not_found': [], 'revision': None}
+        for chunk in self._chunks(dict.fromkeys(marker_ids), self.chunk_size):
+            owners = dict(db.session.execute(
+                select(MapMarker.id, MapMarker.user_id).where(MapMarker.id.in_(chunk))
+            ).all())
+            owned = []
+            for marker_id in chunk:
+                if marker_id not in owners:
+                    result['not_found'].append(marker_id)
+                elif owners[marker_id] != user_id:
+                    result['forbidden'].append(marker_id)
+                else:
+                    owned.append(marker_id)
+            # 先结束读事务：WAL 下读快照过期后无法再升级为写事务；没有可删除的标记时也不占用修订号
+            db.session.rollback()
+            if not owned:
+                continue
+
+            try:
+                revision = marker_sync.next_revision()
+                marker_sync.record_deletes(owned, revision)
+                db.session.execute(
+                    delete(MapMarker.__table__).where(MapMarker.id.in_(owned), MapMarker.user_id == user_id)
+                )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                logger.exception('marker_bulk_delete_failed', extra={'rows': len(owned)})
+                result.update(error='Failed to delete markers', status_code=500)
+                return result
+
+            marker_index.remove_many(owned, revision)
+            marker_clusters.remove_many(owned, revision)
+            marker_sync.publish(revision, deleted=owned)
+            result['deleted'].extend(owned)
+            result['revision'] = revision
+        return result
+
+
+marker_bulk = MarkerBulk()
@@ -0,0 +1,281 @@
+import math
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.services.marker_sync import SyncedMarkerIndex
+
+# 每个 256px 瓦片划分为 4x4 个聚合格子，约等于 64px 的聚合半径
+CELLS_PER_TILE_LOG2 = 2
+
+
+class _Cell:
+    __slots__ = (
+        "count", "sum_lat", "sum_lon",
+        "min_lat", "min_lon", "max_lat", "max_lon",
+        "sample_id", "children", "members",
+    )
+
+    def __init__(self, leaf: bool):
+        self.count = 0
+        self.sum_lat = 0.0
+        self.sum_lon = 0.0
+        self.min_lat = self.min_lon = math.inf
+        self.max_lat = self.max_lon = -math.inf
+        self.sample_id = None
+        self.children = None if leaf else set()
+        self.members = {} if leaf else None
+
+    def extend(self, marker_id: int, lat: float, lon: float):
+        self.count += 1
+        self.sum_lat += lat
+        self.sum_lon += lon
+        self.min_lat = min(self.min_lat, lat)
+        self.min_lon = min(self.min_lon, lon)
+        self.max_lat = max(self.max_lat, lat)
+        self.max_lon = max(self.max_lon, lon)
+        if self.sample_id is None:
+            self.sample_id = marker_id
+
+    def reset(self):
+        self.count = 0
+        self.sum_lat = self.sum_lon = 0.0
+        self.min_lat = self.min_lon = math.inf
+        self.max_lat = self.max_lon = -math.inf
+        self.sample_id = None
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "centroid": [self.sum_lat / self.count, self.sum_lon / self.count],
+            "bounds": [self.min_lat, self.min_lon, self.max_lat, self.max_lon],
+            "sample_marker_id": self.sample_id,
+        }
+
+
+def _project(lat: float, lon: float) -> Tuple[float, float]:
+    """经纬度转 Web Mercator 归一化坐标，与前端 Leaflet 瓦片对齐"""
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    x = (lon + 180.0) / 360.0
+    sin_lat = math.sin(math.radians(lat))
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(x, 0.0), 1.0 - 1e-12), min(max(y, 0.0), 1.0 - 1e-12)
+
+
+class MarkerClusterIndex(SyncedMarkerIndex):
+    """Per-zoom grid clusters arranged as a quadtree.
+
+    The cell at zoom ``z`` covering ``(x, y)`` is the parent of the four cells
+    ``(2x.., 2y..)`` at ``z + 1``, so inserting a marker updates one cell per
+    level and removing one only re-aggregates the touched ancestors from their
+    children. Queries read the precomputed cells of a single zoom level.
+    """
+
+    def __init__(self, max_zoom: int = 18):
+        super().__init__()
+        self.max_zoom = max_zoom
+        self._levels: List[Dict[Tuple[int, int], _Cell]] = []
+        self._positions: Dict[int, Tuple[float, float]] = {}
+        self._clear()
+
+    def init_app(self, app):
+        self.max_zoom = app.config.get("CLUSTER_MAX_ZOOM", self.max_zoom)
+        super().init_app(app)
+
+    def _clear(self):
+        self._levels = [{} for _ in range(self.max_zoom + 1)]
+        self._positions.clear()
+
+    def _leaf_key(self, lat: float, lon: float) -> Tuple[int, int]:
+        x, y = _project(lat, lon)
+        scale = 1 << (self.max_zoom + CELLS_PER_TILE_LOG2)
+        return int(x * scale), int(y * scale)
+
+    def _insert(self, marker_id: int, lat: float, lon: float):
+        if marker_id in self._positions:
+            self._remove(marker_id)
+        self._positions[marker_id] = (lat, lon)
+
+        x, y = self._leaf_key(lat, lon)
+        leaf = self._levels[self.max_zoom].get((x, y))
+        if leaf is None:
+            leaf = self._levels[self.max_zoom][(x, y)] = _Cell(leaf=True)
+        leaf.members[marker_id] = (lat, lon)
+        leaf.extend(marker_id, lat, lon)
+
+        for zoom in range(self.max_zoom - 1, -1, -1):
+            child_key = (x, y)
+            x, y = x >> 1, y >> 1
+            cell = self._levels[zoom].get((x, y))
+            if cell is None:
+                cell = self._levels[zoom][(x, y)] = _Cell(leaf=False)
+            cell.children.add(child_key)
+            cell.extend(marker_id, lat, lon)
+
+    def _remove(self, marker_id: int):
+        position = self._positions.pop(marker_id, None)
+        if position is None:
+            return
+
+        x, y = self._leaf_key(*position)
+        leaf = self._levels[self.max_zoom][(x, y)]
+        del leaf.members[marker_id]
+        leaf.reset()
+        for member_id, (lat, lon) in leaf.members.items():
+            leaf.extend(member_id, lat, lon)
+        removed = leaf.count == 0
+        if removed:
+            del self._levels[self.max_zoom][(x, y)]
+
+        for zoom in range(self.max_zoom - 1, -1, -1):
+            child_key = (x, y)
+            x, y = x >> 1, y >> 1
+            cell = self._levels[zoom][(x, y)]
+            if removed:
+                cell.children.discard(child_key)
+            self._reaggregate(cell, self._levels[zoom + 1])
+            removed = cell.count == 0
+            if removed:
+                del self._levels[zoom][(x, y)]
+
+    def _insert_many(self, markers: Iterable[Tuple[int, float, float]]):
+        leaves = self._levels[self.max_zoom]
+        touched = set()
+        for marker_id, lat, lon in markers:
+            lat, lon = float(lat), float(lon)
+            if marker_id in self._positions:
+                self._remove(marker_id)
+            self._positions[marker_id] = (lat, lon)
+            key = self._leaf_key(lat, lon)
+            leaf = leaves.get(key)
+            if leaf is None:
+                leaf = leaves[key] = _Cell(leaf=True)
+            leaf.members[marker_id] = (lat, lon)
+            leaf.extend(marker_id, lat, lon)
+            touched.add(key)
+        self._rebuild_ancestors(touched)
+
+    def _remove_many(self, marker_ids: Iterable[int]):
+        leaves = self._levels[self.max_zoom]
+        touched = set()
+        for marker_id in marker_ids:
+            position = self._positions.pop(marker_id, None)
+            if position is not None:
+                key = self._leaf_key(*position)
+                del leaves[key].members[marker_id]
+                touched.add(key)
+        for key in touched:
+            leaf = leaves[key]
+            leaf.reset()
+            for member_id, (lat, lon) in leaf.members.items():
+                leaf.extend(member_id, lat, lon)
+            if leaf.count == 0:
+                del leaves[key]
+        self._rebuild_ancestors(touched)
+
+    def _rebuild_ancestors(self, touched: Set[Tuple[int, int]]):
+        """Re-aggregate each ancestor of the ``touched`` leaves once, level by level.
+
+        A batch of ``n`` markers costs one pass per distinct cell instead of
+        ``n`` updates on every level.
+        """
+        for zoom in range(self.max_zoom - 1, -1, -1):
+            child_level, level = self._levels[zoom + 1], self._levels[zoom]
+            parents = set()
+            for child_key in touched:
+                key = (child_key[0] >> 1, child_key[1] >> 1)
+                cell = level.get(key)
+                if cell is None:
+                    cell = level[key] = _Cell(leaf=False)
+                if child_key in child_level:
+                    cell.children.add(child_key)
+                else:
+                    cell.children.discard(child_key)
+                parents.add(key)
+            for key in parents:
+                cell = level[key]
+                self._reaggregate(cell, child_level)
+                if cell.count == 0:
+                    del level[key]
+            touched = parents
+
+    @staticmethod
+    def _reaggregate(cell: _Cell, child_level: Dict[Tuple[int, int], _Cell]):
+        # 批量更新时每层都要重新聚合，用局部变量累加以减少属性读写
+        count, sum_lat, sum_lon = 0, 0.0, 0.0
+        min_lat = min_lon = math.inf
+        max_lat = max_lon = -math.inf
+        sample_id = None
+        for key in cell.children:
+            child = child_level[key]
+            count += child.count
+            sum_lat += child.sum_lat
+            sum_lon += child.sum_lon
+            if child.min_lat < min_lat:
+                min_lat = child.min_lat
+            if child.min_lon < min_lon:
+                min_lon = child.min_lon
+            if child.max_lat > max_lat:
+                max_lat = child.max_lat
+            if child.max_lon > max_lon:
+                max_lon = child.max_lon
+            if sample_id is None:
+                sample_id = child.sample_id
+        cell.count, cell.sum_lat, cell.sum_lon = count, sum_lat, sum_lon
+        cell.min_lat, cell.min_lon, cell.max_lat, cell.max_lon = min_lat, min_lon, max_lat, max_lon
+        cell.sample_id = sample_id
+
+    def add(self, marker_id: int, lat: float, lon: float, revision: Optional[int] = None):
+        with self._lock:
+            if self._loaded:
+                self._insert(marker_id, float(lat), float(lon))
+                self._advance(revision)
+
+    def remove(self, marker_id: int, revision: Optional[int] = None):
+        with self._lock:
+            if self._loaded:
+                self._remove(marker_id)
+                self._advance(revision)
+
+    def add_many(self, markers: Iterable[Tuple[int, float, float]], revision: Optional[int] = None):
+        with self._lock:
+            if self._loaded:
+                self._insert_many(markers)
+                self._advance(revision)
+
+    def remove_many(self, marker_ids: Iterable[int], revision: Optional[int] = None):
+        with self._lock:
+            if self._loaded:
+                self._remove_many(marker_ids)
+                self._advance(revision)
+
+    def query(self, zoom: int, bbox: Optional[Tuple[float, float, float, float]] = None) -> List[dict]:
+        """Return the clusters of ``zoom`` (clamped to the index range) within ``bbox``."""
+        self.sync()
+        zoom = max(0, min(zoom, self.max_zoom))
+        shift = self.max_zoom - zoom
+
+        with self._lock:
+            level = self._levels[zoom]
+            if bbox is None:
+                return [cell.to_dict() for cell in level.values()]
+
+            min_lat, min_lon, max_lat, max_lon = bbox
+            # 纬度越大 Mercator y 越小
+            min_x, min_y = (v >> shift for v in self._leaf_key(max_lat, min_lon))
+            max_x, max_y = (v >> shift for v in self._leaf_key(min_lat, max_lon))
+
+            if (max_x - min_x + 1) * (max_y - min_y + 1) > len(level):
+                cells = [
+                    cell for (x, y), cell in level.items()
+                    if min_x <= x <= max_x and min_y <= y <= max_y
+                ]
+            else:
+                cells = [
+                    level[(x, y)]
+                    for x in range(min_x, max_x + 1)
+                    for y in range(min_y, max_y + 1)
+                    if (x, y) in level
+                ]
+            return [cell.to_dict() for cell in cells]
+
+
+marker_clusters = MarkerClusterIndex()
@@ -0,0 +1,142 @@
+import heapq
+import math
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.services.marker_sync import SyncedMarkerIndex
+
+
+class MarkerGridIndex(SyncedMarkerIndex):
+    """In-memory uniform grid over marker coordinates.
+
+    Markers are bucketed into square lat/lon cells so a bounding-box query only
+    touches the cells overlapping the viewport instead of the whole table.
+    Each cell keeps its ids sorted, so a cursor page merges the cells lazily
+    from ``after_id`` and stops after ``limit`` ids. The index is built lazily
+    from the database on first use and then caught up with the marker change
+    feed before every query.
+    """
+
+    def __init__(self, cell_deg: float = 0.002):
+        super().__init__()
+        self.cell_deg = cell_deg
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        self._positions: Dict[int, Tuple[float, float]] = {}
+
+    def init_app(self, app):
+        self.cell_deg = app.config.get("MARKER_INDEX_CELL_DEG", self.cell_deg)
+        super().init_app(app)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def _clear(self):
+        self._cells.clear()
+        self._positions.clear()
+
+    def _insert_many(self, markers: Iterable[Tuple[int, float, float]]):
+        for marker_id, lat, lon in markers:
+            self._insert(marker_id, lat, lon)
+
+    def _remove_many(self, marker_ids: Iterable[int]):
+        for marker_id in marker_ids:
+            self._remove(marker_id)
+
+    def _insert(self, marker_id: int, lat: float, lon: float):
+        lat, lon = float(lat), float(lon)
+        self._remove(marker_id)
+        insort(self._cells.setdefault(self._cell(lat, lon), []), marker_id)
+        self._positions[marker_id] = (lat, lon)
+
+    def _remove(self, marker_id: int):
+        position = self._positions.pop(marker_id, None)
+        if position is None:
+            return
+        key = self._cell(*position)
+        bucket = self._cells.get(key)
+        if bucket is not None:
+            i = bisect_left(bucket, marker_id)
+            if i < len(bucket) and bucket[i] == marker_id:
+                del bucket[i]
+            if not bucket:
+                del self._cells[key]
+
+    def add(self, marker_id: int, lat: float, lon: float, revision: Optional[int] = None):
+        with self._lock:
+            if self._loaded:
+                self._insert(marker_id, lat, lon)
+                self._advance(revision)
+
+    def remove(self, marker_id: int, revision: Optional[int] = None):
+        with self._lock:
+            if self._loaded:
+                self._remove(marker_id)
+                self._advance(revision)
+
+    def add_many(self, markers: Iterable[Tuple[int, float, float]], revision: Optional[int] = None):
+        with self._lock:
+            if self._loaded:
+                self._insert_many(markers)
+                self._advance(revision)
+
+    def remove_many(self, marker_ids: Iterable[int], revision: Optional[int] = None):
+        with self._lock:
+            if self._loaded:
+                self._remove_many(marker_ids)
+                self._advance(revision)
+
+    def __len__(self):
+        return len(self._positions)
+
+    def _inside(self, bucket: List[int], start: int, min_lat: float, min_lon: float,
+                max_lat: float, max_lon: float) -> Iterator[int]:
+        positions = self._positions
+        for i in range(start, len(bucket)):
+            marker_id = bucket[i]
+            lat, lon = positions[marker_id]
+            if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                yield marker_id
+
+    def query(
+        self,
+        min_lat: float,
+        min_lon: float,
+        max_lat: float,
+        max_lon: float,
+        *,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[int]:
+        """Return marker ids inside the box, ordered by id for cursor paging."""
+        self.sync()
+        min_row, min_col = self._cell(min_lat, min_lon)
+        max_row, max_col = self._cell(max_lat, max_lon)
+
+        with self._lock:
+            span = (max_row - min_row + 1) * (max_col - min_col + 1)
+            if span > len(self._cells):
+                # 视野比已占用的格子还大时，直接遍历非空格子
+                buckets: Iterable = (
+                    bucket
+                    for (row, col), bucket in self._cells.items()
+                    if min_row <= row <= max_row and min_col <= col <= max_col
+                )
+            else:
+                buckets = (
+                    self._cells[(row, col)]
+                    for row in range(min_row, max_row + 1)
+                    for col in range(min_col, max_col + 1)
+                    if (row, col) in self._cells
+                )
+
+            # 各格子内 id 有序：从游标处二分定位，归并到 limit 条即停
+            merged = heapq.merge(*(
+                self._inside(bucket, 0 if after_id is None else bisect_right(bucket, after_id),
+                             min_lat, min_lon, max_lat, max_lon)
+                for bucket in buckets
+            ))
+            return list(islice(merged, limit))
+
+
+marker_index = MarkerGridIndex()
@@ -0,0 +1,232 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, update
+
+from app import db, socketio
+
+logger = logging.getLogger(__name__)
+
+MAP_NAMESPACE = '/map'
+MAP_ROOM = 'map'
+# 超过该数量的变更只推送修订号，客户端自行拉取增量
+MAX_PUSH_ITEMS = 500
+
+
+class MarkerSync:
+    """Revision counter, tombstones and change feed for map markers.
+
+    Writers call ``next_revision`` once per transaction; the counter row
+    stays locked until commit, so revisions become visible in order and a
+    client holding revision ``r`` can ask for everything after it. All rows
+    written in one transaction share its revision. Deletes leave a
+    ``MarkerTombstone``. After commit, ``publish`` pushes the same
+    delta to the ``map`` room so subscribed clients stay current without
+    refetching. Tombstones older than ``tombstone_days`` are pruned; a client
+    further behind than that (or than ``max_delta`` changes) gets ``reset``
+    and reloads the full list.
+    """
+
+    def __init__(self, tombstone_days: float = 30.0, max_delta: int = 5000):
+        self.tombstone_days = tombstone_days
+        self.max_delta = max_delta
+
+    def init_app(self, app):
+        self.tombstone_days = app.config.get('MARKER_TOMBSTONE_DAYS', self.tombstone_days)
+        self.max_delta = app.config.get('MARKER_DELTA_MAX', self.max_delta)
+
+    def next_revision(self) -> int:
+        """Take the next revision for the current transaction."""
+        from app.models.map_marker import MapMarker
+        from app.models.marker_revision import MarkerRevision
+
+        result = db.session.execute(
+            update(MarkerRevision).where(MarkerRevision.id == 1).values(revision=MarkerRevision.revision + 1)
+        )
+        if result.rowcount == 0:
+            # 只执行过 create_all、没跑迁移的数据库：按现有最大值建立计数器
+            revision = db.session.scalar(select(func.coalesce(func.max(MapMarker.revision), 0))) + 1
+            db.session.add(MarkerRevision(id=1, revision=revision, pruned_revision=0))
+            db.session.flush()
+            return revision
+        return db.session.scalar(select(MarkerRevision.revision).where(MarkerRevision.id == 1))
+
+    def record_deletes(self, marker_ids: List[int], revision: int):
+        from app.models.marker_revision import MarkerTombstone
+
+        if not marker_ids:
+            return
+        now = datetime.now()
+        # 标记 id 可能被复用，同一 id 只保留最新的删除记录
+        table = MarkerTombstone.__table__
+        db.session.execute(delete(table).where(table.c.marker_id.in_(marker_ids)))
+        db.session.execute(insert(table), [
+            {'marker_id': marker_id, 'revision': revision, 'deleted_at': now} for marker_id in marker_ids
+        ])
+
+    def _state(self):
+        from app.models.marker_revision import MarkerRevision
+
+        row = db.session.execute(
+            select(MarkerRevision.revision, MarkerRevision.pruned_revision).where(MarkerRevision.id == 1)
+        ).first()
+        return (row.revision, row.pruned_revision) if row else (0, 0)
+
+    def current_revision(self) -> int:
+        return self._state()[0]
+
+    def changes_since(self, since: int) -> Dict:
+        """Markers inserted and ids deleted after ``since``.
+
+        Deletes must be applied before upserts: an id freed by a delete can
+        be reused by a later insert.
+        """
+        from app.models.map_marker import MapMarker
+        from app.models.marker_revision import MarkerTombstone
+        from app.serialization import MARKER_FIELDS, fetch_dicts, marker_select
+
+        # 先读当前修订号；之后提交的变更可能重复出现在下一次增量中，客户端按 id 覆盖即可
+        revision, pruned = self._state()
+        if since < pruned or since > revision:
+            return {'since': since, 'revision': revision, 'reset': True}
+        if since == revision:
+            return {'since': since, 'revision': revision, 'reset': False, 'markers': [], 'deleted': []}
+
+        markers = fetch_dicts(
+            MARKER_FIELDS,
+            marker_select().where(MapMarker.revision > since).order_by(MapMarker.revision).limit(self.max_delta + 1),
+        )
+        deleted = db.session.scalars(
+            select(MarkerTombstone.marker_id).where(MarkerTombstone.revision > since)
+            .order_by(MarkerTombstone.revision).limit(self.max_delta + 1)
+        ).all()
+        if len(markers) + len(deleted) > self.max_delta:
+            return {'since': since, 'revision': revision, 'reset': True}
+        return {'since': since, 'revision': revision, 'reset': False, 'markers': markers, 'deleted': deleted}
+
+    def publish(self, revision: int, markers: Optional[List[Dict]] = None, deleted: Optional[List[int]] = None):
+        """Push the change committed at ``revision`` to the map room.
+
+        Large changes (bulk imports) are announced without payload and
+        ``since`` set to ``None``, so clients fetch them as a delta instead.
+        """
+        markers, deleted = markers or [], deleted or []
+        if len(markers) + len(deleted) > MAX_PUSH_ITEMS:
+            payload = {'since': None, 'revision': revision, 'markers': [], 'deleted': []}
+        else:
+            payload = {'since': revision - 1, 'revision': revision, 'markers': markers, 'deleted': deleted}
+        socketio.emit('markers_changed', payload, namespace=MAP_NAMESPACE, to=MAP_ROOM)
+
+    def prune(self, days: Optional[float] = None) -> int:
+        """Delete tombstones older than ``days``; returns how many were removed."""
+        from app.models.marker_revision import MarkerRevision, MarkerTombstone
+
+        cutoff = datetime.now() - timedelta(days=self.tombstone_days if days is None else days)
+        newest = db.session.scalar(select(func.max(MarkerTombstone.revision)).where(MarkerTombstone.deleted_at < cutoff))
+        if newest is None:
+            return 0
+        removed = db.session.execute(
+            MarkerTombstone.__table__.delete().where(MarkerTombstone.revision <= newest)
+        ).rowcount
+        # 更早的增量已无法回答，落后于此的客户端需要全量重载
+        db.session.execute(
+            update(MarkerRevision).where(MarkerRevision.id == 1, MarkerRevision.pruned_revision < newest)
+            .values(pruned_revision=newest)
+        )
+        db.session.commit()
+        logger.info('marker_tombstones_pruned', extra={'removed': removed, 'pruned_revision': newest})
+        return removed
+
+
+marker_sync = MarkerSync()
+
+
+class SyncedMarkerIndex:
+    """Base for the in-memory marker indexes, kept at the latest marker revision.
+
+    Every worker process holds its own copy, and only the worker that served
+    a write applies it directly. ``sync`` runs before each query: at most
+    every ``sync_interval`` seconds it reads the change feed after the
+    revision the index last applied, so writes made by other workers (or the
+    CLI) show up within that interval. When the feed answers ``reset``
+    (pruned tombstones, too many changes) the index reloads from the table.
+    Subclasses implement ``_clear``, ``_insert_many`` and ``_remove_many``;
+    callers hold ``_lock``.
+    """
+
+    def __init__(self, sync_interval: float = 0.5):
+        self.sync_interval = sync_interval
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._revision = 0
+        self._synced_at = 0.0
+
+    def init_app(self, app):
+        self.sync_interval = app.config.get('MARKER_INDEX_SYNC_SECONDS', self.sync_interval)
+        self.reset()
+
+    def _clear(self):
+        raise NotImplementedError
+
+    def _insert_many(self, markers: Iterable[Tuple[int, float, float]]):
+        raise NotImplementedError
+
+    def _remove_many(self, marker_ids: Iterable[int]):
+        raise NotImplementedError
+
+    def reset(self):
+        with self._lock:
+            self._clear()
+            self._loaded = False
+            self._revision = 0
+
+    def _load(self):
+        from app.models.map_marker import MapMarker
+
+        # 先读修订号再读全表：期间提交的变更会在下一次增量中重复应用，插入和删除都是幂等的
+        revision = marker_sync.current_revision()
+        rows = db.session.query(MapMarker.id, MapMarker.latitude, MapMarker.longitude).all()
+        self._clear()
+        self._insert_many(rows)
+        self._revision = revision
+        self._synced_at = time.monotonic()
+        self._loaded = True
+
+    def ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if not self._loaded:
+                self._load()
+
+    def sync(self):
+        """Load the index, or apply the marker changes committed since its revision."""
+        if not self._loaded:
+            self.ensure_loaded()
+            return
+        now = time.monotonic()
+        if now - self._synced_at < self.sync_interval:
+            return
+        self._synced_at = now
+        since = self._revision
+        delta = marker_sync.changes_since(since)
+        if delta['revision'] == since:
+            return
+        with self._lock:
+            if self._revision != since:
+                # 其他线程已经追上
+                return
+            if delta['reset']:
+                self._load()
+                return
+            self._remove_many(delta['deleted'])
+            self._insert_many((m['id'], m['latitude'], m['longitude']) for m in delta['markers'])
+            self._revision = delta['revision']
+
+    def _advance(self, revision: Optional[int]):
+        # 本进程刚提交的变更紧接当前修订号时直接前移，下次查询无需再拉这段增量
+        if revision is not None and revision == self._revision + 1:
+            self._revision = revision
@@ -0,0 +1,149 @@
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+from typing import BinaryIO, Optional, Tuple
+
+from app import db
+
+CHUNK_SIZE = 64 * 1024
+
+ALLOWED_MEDIA_TYPES = {
+    'image/png', 'image/jpeg', 'image/gif', 'image/webp',
+    'audio/webm', 'audio/ogg', 'audio/mpeg', 'audio/mp4', 'audio/wav', 'audio/x-wav',
+}
+
+_DATA_URL = re.compile(r'^data:([\w.+-]+/[\w.+-]+)(?:;[^,;]*)*;base64,', re.IGNORECASE)
+_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+
+class MediaError(ValueError):
+    """Upload rejected: unsupported type, too large or malformed."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def normalize_mime(mime_type: Optional[str]) -> str:
+    # 去掉 codecs 等参数，如 audio/webm;codecs=opus
+    return (mime_type or '').split(';', 1)[0].strip().lower()
+
+
+def parse_data_url(value: str) -> Optional[Tuple[str, bytes]]:
+    """``(mime_type, bytes)`` for a base64 ``data:`` URL, otherwise ``None``."""
+    if not isinstance(value, str):
+        return None
+    match = _DATA_URL.match(value)
+    if not match:
+        return None
+    try:
+        data = base64.b64decode(value[match.end():], validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return normalize_mime(match.group(1)), data
+
+
+class MediaStore:
+    """Content-addressed file store for chat images and voice messages.
+
+    Files live under ``root/ab/cd/<sha256>`` and are written once: an upload
+    is streamed to a temp file while hashing, then renamed into place unless
+    a file with the same digest already exists. Metadata (type, size) is kept
+    in the ``media_object`` table.
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: int = 5 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def init_app(self, app):
+        self.root = app.config.get('MEDIA_ROOT') or os.path.join(app.instance_path, 'media')
+        self.max_bytes = app.config.get('MEDIA_MAX_BYTES', self.max_bytes)
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def is_digest(value: str) -> bool:
+        return bool(_SHA256.match(value or ''))
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def save_stream(self, stream: BinaryIO, mime_type: Optional[str]):
+        """Store the bytes read from ``stream``; returns the ``MediaObject``."""
+        mime_type = normalize_mime(mime_type)
+        if mime_type not in ALLOWED_MEDIA_TYPES:
+            raise MediaError(f'Unsupported media type: {mime_type or "unknown"}', 415)
+
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(prefix='.upload-', dir=self.root)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise MediaError('File too large', 413)
+                    hasher.update(chunk)
+                    out.write(chunk)
+            if size == 0:
+                raise MediaError('Empty upload')
+
+            digest = hasher.hexdigest()
+            final_path = self.path_for(digest)
+            if os.path.exists(final_path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(tmp_path, final_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return self._record(digest, mime_type, size)
+
+    def save_bytes(self, data: bytes, mime_type: Optional[str]):
+        from io import BytesIO
+
+        return self.save_stream(BytesIO(data), mime_type)
+
+    def save_data_url(self, value: str):
+        """Store an inline ``data:`` URL; ``None`` if ``value`` is not one."""
+        parsed = parse_data_url(value)
+        if parsed is None:
+            return None
+        mime_type, data = parsed
+        return self.save_bytes(data, mime_type)
+
+    def _record(self, digest: str, mime_type: str, size: int):
+        from app.models.media_object import MediaObject
+
+        media = db.session.get(MediaObject, digest)
+        if media is None:
+            media = MediaObject(sha256=digest, mime_type=mime_type, size=size)
+            db.session.add(media)
+            try:
+                db.session.commit()
+            except Exception:
+                # 并发上传同一文件时另一请求已插入
+                db.session.rollback()
+                media = db.session.get(MediaObject, digest)
+                if media is None:
+                    raise
+        return media
+
+    def get(self, digest: str):
+        from app.models.media_object import MediaObject
+
+        if not self.is_digest(digest):
+            return None
+        return db.session.get(MediaObject, digest)
+
+
+media_store = MediaStore()
@@ -0,0 +1,141 @@
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from flask import jsonify
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = 'pbkdf2:sha256:600000'
+BUSY_RETRY_AFTER = 2
+
+
+class PasswordHasherBusy(Exception):
+    """The hashing pool did not answer in time or its workers died; the client should retry."""
+
+    def __init__(self, message: str, retry_after: int = BUSY_RETRY_AFTER):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = retry_after
+
+
+def _busy_response(err: PasswordHasherBusy):
+    response = jsonify({'error': 'Password service busy', 'retry_after': err.retry_after})
+    response.headers['Retry-After'] = str(err.retry_after)
+    return response, 503
+
+
+def _hash(password: str, method: str) -> str:
+    return generate_password_hash(password, method=method)
+
+
+def _verify(password_hash: str, password: str) -> bool:
+    return check_password_hash(password_hash, password)
+
+
+class PasswordHasher:
+    """Runs password hashing and verification on a small process pool.
+
+    Hashing is deliberately CPU-heavy (50-300 ms); in a worker process it no
+    longer holds the GIL of the server process, so chat events keep flowing
+    during a login burst. ``workers=0`` hashes inline.
+    """
+
+    def __init__(self, method: str = DEFAULT_METHOD, workers: int = 2, timeout: float = 10.0):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._prefix: Optional[str] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD', self.method)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT_SECONDS', self.timeout)
+        # 提前校验方法名，避免首次注册时才报错；同时记下补全默认参数后的前缀
+        self._prefix = self._method_prefix(self.method)
+        self.shutdown()
+        app.register_error_handler(PasswordHasherBusy, _busy_response)
+
+    @staticmethod
+    def _method_prefix(method: str) -> str:
+        """The prefix Werkzeug stores for ``method``, with its defaults filled in.
+
+        Parsed from the string rather than by hashing, which would cost a full
+        key derivation on every app start.
+        """
+        name, *args = method.split(':')
+        try:
+            if name == 'scrypt' and len(args) in (0, 3):
+                n, r, p = map(int, args) if args else (2 ** 15, 8, 1)
+                return f'scrypt:{n}:{r}:{p}'
+            if name == 'pbkdf2' and len(args) <= 2:
+                hash_name = args[0] if args else 'sha256'
+                iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+                hashlib.new(hash_name)
+                return f'pbkdf2:{hash_name}:{iterations}'
+        except ValueError:
+            pass
+        raise ValueError(f'Unsupported PASSWORD_HASH_METHOD {method!r}; use scrypt[:n:r:p] or pbkdf2[:hash[:iterations]]')
+
+    def _executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers <= 0:
+            return None
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _run(self, fn, *args):
+        pool = self._executor()
+        if pool is None:
+            return fn(*args)
+        try:
+            future = pool.submit(fn, *args)
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise PasswordHasherBusy('Password hashing timed out') from None
+        except BrokenProcessPool:
+            # 工作进程被杀（如 OOM）后整个池不可用，丢弃后下次调用重建
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise PasswordHasherBusy('Password hashing pool restarted') from None
+
+    def hash(self, password: str) -> str:
+        return self._run(_hash, password, self.method)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        return self._run(_verify, password_hash, password)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """True if the stored hash was made with other parameters than ``method``."""
+        if self._prefix is None:
+            self._prefix = self._method_prefix(self.method)
+        return password_hash.split('$', 1)[0] != self._prefix
+
+    def warm(self):
+        """Start the worker processes now instead of on the first login.
+
+        Call it at startup before the server spawns its background threads,
+        so the workers are forked from a still single-threaded process.
+        """
+        pool = self._executor()
+        if pool is not None:
+            list(pool.map(_hash, [''] * self.workers, ['pbkdf2:sha256:1'] * self.workers))
+
+    def shutdown(self, wait: bool = False):
+        # eventlet 下进程池必须 wait=True 关闭，否则解释器退出时会卡住
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+
+password_hasher = PasswordHasher()
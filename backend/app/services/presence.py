@@ -0,0 +1,301 @@
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SQLITE_SCHEME = 'sqlite:///'
+
+
+class MemoryPresenceStore:
+    """Single-process store: plain dicts keyed both ways."""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._by_sid: Dict[str, str] = {}
+        self._by_user: Dict[str, str] = {}
+        self._seen: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def join(self, sid: str, username: str, now: float) -> Optional[str]:
+        with self._lock:
+            previous = self._by_user.get(username)
+            if previous is not None and previous != sid:
+                self._by_sid.pop(previous, None)
+                self._seen.pop(previous, None)
+            old_name = self._by_sid.get(sid)
+            if old_name is not None and old_name != username:
+                self._by_user.pop(old_name, None)
+            self._by_sid[sid] = username
+            self._by_user[username] = sid
+            self._seen[sid] = now
+            return previous if previous != sid else None
+
+    def leave(self, sid: str) -> Optional[str]:
+        with self._lock:
+            username = self._by_sid.pop(sid, None)
+            self._seen.pop(sid, None)
+            if username is not None and self._by_user.get(username) == sid:
+                del self._by_user[username]
+            return username
+
+    def username_for(self, sid: str) -> Optional[str]:
+        return self._by_sid.get(sid)
+
+    def touch(self, sids: Iterable[str], now: float):
+        with self._lock:
+            for sid in sids:
+                if sid in self._seen:
+                    self._seen[sid] = now
+
+    def count(self, cutoff: float) -> int:
+        with self._lock:
+            return sum(1 for seen in self._seen.values() if seen >= cutoff)
+
+    def expire(self, cutoff: float) -> List[str]:
+        with self._lock:
+            stale = [sid for sid, seen in self._seen.items() if seen < cutoff]
+        return [name for name in (self.leave(sid) for sid in stale) if name]
+
+
+class SQLitePresenceStore:
+    """Presence shared by worker processes on one host through a SQLite file."""
+
+    name = 'sqlite'
+
+    def __init__(self, path: str):
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS chat_presence ('
+                'sid TEXT PRIMARY KEY, username TEXT NOT NULL UNIQUE, last_seen REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_chat_presence_last_seen ON chat_presence (last_seen)')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _transaction(self, fn):
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = fn(conn)
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+            return result
+
+    def join(self, sid: str, username: str, now: float) -> Optional[str]:
+        def run(conn):
+            row = conn.execute('SELECT sid FROM chat_presence WHERE username = ?', (username,)).fetchone()
+            # REPLACE 同时清掉 sid 或 username 冲突的旧行
+            conn.execute('INSERT OR REPLACE INTO chat_presence (sid, username, last_seen) VALUES (?, ?, ?)',
+                         (sid, username, now))
+            return row[0] if row and row[0] != sid else None
+        return self._transaction(run)
+
+    def leave(self, sid: str) -> Optional[str]:
+        def run(conn):
+            row = conn.execute('SELECT username FROM chat_presence WHERE sid = ?', (sid,)).fetchone()
+            if row is None:
+                return None
+            conn.execute('DELETE FROM chat_presence WHERE sid = ?', (sid,))
+            return row[0]
+        return self._transaction(run)
+
+    def username_for(self, sid: str) -> Optional[str]:
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT username FROM chat_presence WHERE sid = ?', (sid,)).fetchone()
+        return row[0] if row else None
+
+    def touch(self, sids: Iterable[str], now: float):
+        params = [(now, sid) for sid in sids]
+        if params:
+            self._transaction(lambda conn: conn.executemany(
+                'UPDATE chat_presence SET last_seen = ? WHERE sid = ?', params))
+
+    def count(self, cutoff: float) -> int:
+        with closing(self._connect()) as conn:
+            return conn.execute('SELECT COUNT(*) FROM chat_presence WHERE last_seen >= ?', (cutoff,)).fetchone()[0]
+
+    def expire(self, cutoff: float) -> List[str]:
+        def run(conn):
+            names = [r[0] for r in conn.execute(
+                'SELECT username FROM chat_presence WHERE last_seen < ?', (cutoff,))]
+            if names:
+                conn.execute('DELETE FROM chat_presence WHERE last_seen < ?', (cutoff,))
+            return names
+        return self._transaction(run)
+
+
+class RedisPresenceStore:
+    """Presence shared across hosts: two hashes for sid<->username and a
+    sorted set of last-seen timestamps used for expiry and counting."""
+
+    name = 'redis'
+
+    def __init__(self, url: str, prefix: str = 'socketio'):
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError('The redis package is required for a redis:// presence store') from exc
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._sids = f'{prefix}:presence:sid'
+        self._users = f'{prefix}:presence:user'
+        self._seen = f'{prefix}:presence:seen'
+
+    def join(self, sid: str, username: str, now: float) -> Optional[str]:
+        previous = self._redis.hget(self._users, username)
+        old_name = self._redis.hget(self._sids, sid)
+        pipe = self._redis.pipeline()
+        if previous and previous != sid:
+            pipe.hdel(self._sids, previous)
+            pipe.zrem(self._seen, previous)
+        if old_name and old_name != username:
+            pipe.hdel(self._users, old_name)
+        pipe.hset(self._sids, sid, username)
+        pipe.hset(self._users, username, sid)
+        pipe.zadd(self._seen, {sid: now})
+        pipe.execute()
+        return previous if previous and previous != sid else None
+
+    def leave(self, sid: str) -> Optional[str]:
+        # ZREM 的返回值保证并发时只有一个进程认领这条记录
+        if not self._redis.zrem(self._seen, sid):
+            return None
+        username = self._redis.hget(self._sids, sid)
+        self._redis.hdel(self._sids, sid)
+        if username and self._redis.hget(self._users, username) == sid:
+            self._redis.hdel(self._users, username)
+        return username
+
+    def username_for(self, sid: str) -> Optional[str]:
+        return self._redis.hget(self._sids, sid)
+
+    def touch(self, sids: Iterable[str], now: float):
+        mapping = {sid: now for sid in sids}
+        if mapping:
+            self._redis.zadd(self._seen, mapping, xx=True)
+
+    def count(self, cutoff: float) -> int:
+        return self._redis.zcount(self._seen, cutoff, '+inf')
+
+    def expire(self, cutoff: float) -> List[str]:
+        stale = self._redis.zrangebyscore(self._seen, '-inf', f'({cutoff}')
+        return [name for name in (self.leave(sid) for sid in stale) if name]
+
+
+class PresenceRegistry:
+    """Who is online in chat, shared by every worker process.
+
+    Each worker refreshes the heartbeat of the sockets it owns every
+    ``ttl / 3`` seconds; entries whose worker died stop being refreshed and
+    are expired after ``ttl`` seconds, at which point ``on_expire`` callbacks
+    receive the usernames so a ``user_left`` can be announced.
+    """
+
+    def __init__(self, ttl_seconds: float = 60.0):
+        self.ttl_seconds = ttl_seconds
+        self.worker_id = uuid.uuid4().hex
+        self.store = MemoryPresenceStore()
+        self._app = None
+        self._local: Dict[str, str] = {}
+        self._local_lock = threading.Lock()
+        self._callbacks: List[Callable[[List[str]], None]] = []
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def init_app(self, app):
+        self._app = app
+        self.ttl_seconds = app.config.get('PRESENCE_TTL_SECONDS', self.ttl_seconds)
+        url = app.config.get('PRESENCE_URL')
+        if not url:
+            self.store = MemoryPresenceStore()
+        elif url.startswith(SQLITE_SCHEME):
+            self.store = SQLitePresenceStore(url[len(SQLITE_SCHEME):])
+        elif url.startswith(('redis://', 'rediss://')):
+            self.store = RedisPresenceStore(url, prefix=app.config.get('SOCKETIO_CHANNEL', 'socketio'))
+        else:
+            raise RuntimeError(f'Unsupported PRESENCE_URL: {url}')
+        with self._local_lock:
+            self._local.clear()
+
+    def on_expire(self, callback: Callable[[List[str]], None]):
+        self._callbacks.append(callback)
+        return callback
+
+    def _ensure_started(self):
+        if self._started:
+            return
+        from app import socketio
+
+        with self._start_lock:
+            if not self._started:
+                socketio.start_background_task(self._heartbeat)
+                self._started = True
+
+    def join(self, sid: str, username: str) -> Optional[str]:
+        """Bind ``username`` to ``sid``; returns the sid it was bound to before, if any."""
+        self._ensure_started()
+        previous = self.store.join(sid, username, time.time())
+        with self._local_lock:
+            if previous is not None:
+                self._local.pop(previous, None)
+            self._local[sid] = username
+        return previous
+
+    def leave(self, sid: str) -> Optional[str]:
+        with self._local_lock:
+            self._local.pop(sid, None)
+        return self.store.leave(sid)
+
+    def username_for(self, sid: str) -> Optional[str]:
+        return self.store.username_for(sid)
+
+    def count(self) -> int:
+        return self.store.count(time.time() - self.ttl_seconds)
+
+    def _tick(self) -> List[str]:
+        now = time.time()
+        with self._local_lock:
+            sids = list(self._local)
+        self.store.touch(sids, now)
+        expired = self.store.expire(now - self.ttl_seconds)
+        if expired and self._callbacks:
+            with self._app.app_context():
+                for callback in self._callbacks:
+                    callback(expired)
+        return expired
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(max(self.ttl_seconds / 3, 1.0))
+            try:
+                self._tick()
+            except Exception:
+                logger.exception('presence_heartbeat_failed')
+
+    def local_count(self) -> int:
+        with self._local_lock:
+            return len(self._local)
+
+    def stats(self) -> Dict:
+        local = self.local_count()
+        return {
+            'backend': self.store.name,
+            'worker_id': self.worker_id,
+            'local_connections': local,
+            'online': self.count(),
+            'ttl_seconds': self.ttl_seconds,
+        }
+
+
+presence = PresenceRegistry()
@@ -0,0 +1,269 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from typing import Any, Callable, Dict, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# 上游每次尝试的读超时之外，再留出排队取槽、建连和退避的时间
+WAIT_MARGIN_SECONDS = 5.0
+# 磁盘层清理过期条目、裁剪到上限的最长间隔
+DISK_PURGE_INTERVAL = 300.0
+
+
+class _Flight:
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class RouteCache:
+    """LRU + TTL cache for computed routes with single-flight loading.
+
+    Keys are built from the routing profile and the start/end coordinates
+    rounded to ``precision`` decimals, so requests a few metres apart share one
+    entry. Concurrent misses for the same key wait for a single upstream call,
+    but no longer than ``wait_timeout`` seconds; after that they compute the
+    route themselves.
+    An optional SQLite file acts as a second tier that survives restarts. It
+    holds at most ``disk_max_entries`` rows: expired rows are purged and the
+    rows closest to expiry evicted every ``DISK_PURGE_INTERVAL`` seconds, or
+    sooner once a tenth of the limit has been written since the last purge.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: int = 21600, precision: int = 4,
+                 disk_path: Optional[str] = None, disk_max_entries: int = 50000):
+        self.max_entries = max_entries
+        self.disk_max_entries = disk_max_entries
+        self.ttl_seconds = ttl_seconds
+        self.precision = precision
+        self.disk_path = disk_path
+        self.wait_timeout = 10.0 * 2 + WAIT_MARGIN_SECONDS
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+        self._disk_purged_at = 0.0
+        self._counters = self._empty_counters()
+
+    @staticmethod
+    def _empty_counters() -> Dict[str, int]:
+        return {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "wait_timeouts": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "load_errors": 0,
+            "disk_evictions": 0,
+        }
+
+    def init_app(self, app):
+        self.max_entries = app.config.get("ROUTE_CACHE_MAX_ENTRIES", self.max_entries)
+        self.ttl_seconds = app.config.get("ROUTE_CACHE_TTL_SECONDS", self.ttl_seconds)
+        self.precision = app.config.get("ROUTE_CACHE_PRECISION", self.precision)
+        self.disk_path = app.config.get("ROUTE_CACHE_PATH") or None
+        self.disk_max_entries = max(app.config.get("ROUTE_CACHE_DISK_MAX_ENTRIES", self.disk_max_entries), 1)
+        # 领头请求最多耗时：每次尝试的超时 × (重试次数 + 1)
+        attempts = app.config.get("ORS_RETRIES", 1) + 1
+        self.wait_timeout = app.config.get("ORS_TIMEOUT_SECONDS", 10.0) * attempts + WAIT_MARGIN_SECONDS
+        with self._lock:
+            self._entries.clear()
+            self._counters = self._empty_counters()
+        if self.disk_path:
+            try:
+                self._init_disk()
+            except (OSError, sqlite3.Error):
+                logger.warning("route_cache_disk_unavailable", exc_info=True, extra={"path": self.disk_path})
+                self.disk_path = None
+
+    def make_key(self, namespace: str, *points: Sequence[float]) -> str:
+        quantized = ";".join(
+            ",".join(f"{round(float(v), self.precision):.{self.precision}f}" for v in point)
+            for point in points
+        )
+        return f"{namespace}|{quantized}"
+
+    def get_or_compute(self, key: str, loader: Callable[[], Any]) -> Any:
+        """Return the cached value for ``key`` or compute it exactly once.
+
+        Exceptions raised by ``loader`` are propagated to every waiting caller
+        and are not cached. A caller that waited ``wait_timeout`` seconds on a
+        stuck leader calls ``loader`` itself instead of blocking forever.
+        """
+        with self._lock:
+            value = self._get_memory(key)
+            if value is not None:
+                self._counters["hits"] += 1
+                return value
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            else:
+                self._counters["coalesced"] += 1
+
+        if not leader:
+            if flight.event.wait(self.wait_timeout):
+                if flight.error is not None:
+                    raise flight.error
+                return flight.value
+            with self._lock:
+                self._counters["wait_timeouts"] += 1
+            logger.warning("route_cache_wait_timeout", extra={"key": key, "timeout_s": self.wait_timeout})
+            value = loader()
+            self.set(key, value)
+            return value
+
+        try:
+            cached = self._get_disk(key)
+            if cached is not None:
+                value, expires_at = cached
+                with self._lock:
+                    self._counters["disk_hits"] += 1
+                    self._put_memory(key, value, expires_at)
+            else:
+                with self._lock:
+                    self._counters["misses"] += 1
+                value = loader()
+                self.set(key, value)
+            flight.value = value
+            return value
+        except Exception as err:
+            with self._lock:
+                self._counters["load_errors"] += 1
+            flight.error = err
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def set(self, key: str, value: Any):
+        expires_at = self._expiry()
+        with self._lock:
+            self._put_memory(key, value, expires_at)
+        self._put_disk(key, value, expires_at)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.disk_path:
+            self._execute("DELETE FROM route_cache")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._entries)
+            stats["inflight"] = len(self._inflight)
+        stats["max_entries"] = self.max_entries
+        stats["ttl_seconds"] = self.ttl_seconds
+        stats["disk_enabled"] = bool(self.disk_path)
+        stats["disk_max_entries"] = self.disk_max_entries if self.disk_path else None
+        return stats
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expiry(self) -> float:
+        return time.time() + self.ttl_seconds
+
+    # 以下内存层方法需在持有 self._lock 时调用
+    def _get_memory(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self._counters["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _put_memory(self, key: str, value: Any, expires_at: float):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with closing(sqlite3.connect(self.disk_path, timeout=5)) as conn, conn:
+            return conn.execute(sql, params).fetchone()
+
+    def _purge_disk(self):
+        """Drop expired rows, then the rows closest to expiry beyond ``disk_max_entries``."""
+        with closing(sqlite3.connect(self.disk_path, timeout=5)) as conn, conn:
+            conn.execute("DELETE FROM route_cache WHERE expires_at <= ?", (time.time(),))
+            evicted = conn.execute(
+                "DELETE FROM route_cache WHERE key IN "
+                "(SELECT key FROM route_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_max_entries,),
+            ).rowcount
+        if evicted:
+            with self._lock:
+                self._counters["disk_evictions"] += evicted
+
+    # 磁盘层只是加速手段，读写失败时退化为纯内存缓存
+
+    def _init_disk(self):
+        directory = os.path.dirname(self.disk_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS route_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._execute("CREATE INDEX IF NOT EXISTS ix_route_cache_expires_at ON route_cache (expires_at)")
+        self._purge_disk()
+        self._disk_writes = 0
+        self._disk_purged_at = time.monotonic()
+
+    def _get_disk(self, key: str):
+        if not self.disk_path:
+            return None
+        try:
+            row = self._execute(
+                "SELECT value, expires_at FROM route_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            )
+        except sqlite3.Error:
+            return None
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def _put_disk(self, key: str, value: Any, expires_at: float):
+        if not self.disk_path:
+            return
+        try:
+            self._execute(
+                "INSERT OR REPLACE INTO route_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+        except sqlite3.Error:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._disk_writes += 1
+            due = (self._disk_writes * 10 >= self.disk_max_entries
+                   or now - self._disk_purged_at >= DISK_PURGE_INTERVAL)
+            if due:
+                self._disk_writes = 0
+                self._disk_purged_at = now
+        if due:
+            try:
+                self._purge_disk()
+            except sqlite3.Error:
+                pass
+
+
+route_cache = RouteCache()
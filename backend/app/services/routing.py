@@ -0,0 +1,408 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import requests
+from flask import current_app
+
+from app import db
+from app.models.map_marker import MapMarker
+from app.services.campus_graph import CampusGraph
+from app.services.route_cache import route_cache
+from app.services.tour_planner import plan_tour, path_cost
+from app.services.upstream import UpstreamClient, register_upstream
+
+# ORS 指令类型编号，保持与 OpenRouteService 返回的 steps 一致
+STEP_LEFT = 0
+STEP_RIGHT = 1
+STEP_SHARP_LEFT = 2
+STEP_SHARP_RIGHT = 3
+STEP_SLIGHT_LEFT = 4
+STEP_SLIGHT_RIGHT = 5
+STEP_STRAIGHT = 6
+STEP_ARRIVE = 10
+STEP_DEPART = 11
+
+# 与 ORS 保持一致的各出行方式速度 (m/s)
+PROFILE_SPEEDS = {
+    'foot-walking': 5 / 3.6,
+    'wheelchair': 4 / 3.6,
+    'cycling-regular': 15 / 3.6,
+    'driving-car': 30 / 3.6,
+}
+
+
+class RouteServiceError(Exception):
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class OrsBackend:
+    """Routes through the OpenRouteService directions API."""
+
+    name = 'ors'
+
+    def __init__(self, api_key: Optional[str] = None, client: Optional[UpstreamClient] = None):
+        self.api_key = api_key
+        self.client = client or UpstreamClient('ors', 'https://api.openrouteservice.org')
+
+    @property
+    def available(self) -> bool:
+        return bool(self.api_key)
+
+    def supports(self, profile: str) -> bool:
+        return True
+
+    def _post(self, path, payload):
+        headers = {
+            'Authorization': self.api_key,
+            'Content-Type': 'application/json'
+        }
+
+        request_started = time.time()
+        response = self.client.post(path, headers=headers, json=payload)
+
+        elapsed_ms = round((time.time() - request_started) * 1000, 2)
+        current_app.logger.info("ors_response", extra={"status": response.status_code, "duration_ms": elapsed_ms})
+
+        if response.status_code != 200:
+            raise RouteServiceError('Failed to calculate route', response.status_code)
+        return response.json()
+
+    def route(self, start, end, profile):
+        """调用 OpenRouteService 计算路径，返回精简后的路径信息"""
+        payload = {
+            'coordinates': [[start[1], start[0]], [end[1], end[0]]],  # ORS使用[longitude, latitude]格式
+            'format': 'geojson',
+            'geometry': 'true',
+            'instructions': 'true'
+        }
+        route_data = self._post(f'/v2/directions/{profile}/geojson', payload)
+
+        # 提取路径信息
+        return {
+            'coordinates': route_data['features'][0]['geometry']['coordinates'],
+            'distance': route_data['features'][0]['properties']['segments'][0]['distance'],
+            'duration': route_data['features'][0]['properties']['segments'][0]['duration'],
+            'instructions': route_data['features'][0]['properties']['segments'][0]['steps']
+        }
+
+    def matrix(self, locations, profile):
+        """一次 ORS matrix 请求得到全部两两之间的距离和时间"""
+        payload = {
+            'locations': [[lon, lat] for lat, lon in locations],
+            'metrics': ['distance', 'duration'],
+        }
+        data = self._post(f'/v2/matrix/{profile}', payload)
+        return {'distances': data['distances'], 'durations': data['durations']}
+
+
+class LocalGraphBackend:
+    """Routes on a preloaded campus walking graph without any network call."""
+
+    name = 'local'
+
+    def __init__(self, graph: Optional[CampusGraph] = None, max_snap_m: float = 300.0):
+        self.graph = graph
+        self.max_snap_m = max_snap_m
+
+    @property
+    def available(self) -> bool:
+        return self.graph is not None
+
+    def supports(self, profile: str) -> bool:
+        return profile in ('foot-walking', 'wheelchair')
+
+    def _snap(self, point):
+        node = self.graph.nearest_node(point[0], point[1], self.max_snap_m)
+        if node is None:
+            raise RouteServiceError('Location is outside the campus routing graph', 400)
+        return node
+
+    def route(self, start, end, profile):
+        graph = self.graph
+        source = self._snap(start)
+        target = self._snap(end)
+
+        result = graph.shortest_path(source, target)
+        if result is None:
+            raise RouteServiceError('No route found', 404)
+        path, distance = result
+
+        speed = PROFILE_SPEEDS.get(profile, PROFILE_SPEEDS['foot-walking'])
+        return {
+            'coordinates': [[graph.lons[node], graph.lats[node]] for node in path],
+            'distance': round(distance, 1),
+            'duration': round(distance / speed, 1),
+            'instructions': self._instructions(path, speed),
+        }
+
+    def matrix(self, locations, profile):
+        nodes = [self._snap(point) for point in locations]
+        speed = PROFILE_SPEEDS.get(profile, PROFILE_SPEEDS['foot-walking'])
+        distances = []
+        durations = []
+        for source in nodes:
+            row = self.graph.distances_from(source, nodes)
+            distances.append([None if d is None else round(d, 1) for d in row])
+            durations.append([None if d is None else round(d / speed, 1) for d in row])
+        return {'distances': distances, 'durations': durations}
+
+    def _instructions(self, path, speed):
+        """按道路名称切分路段，生成与 ORS steps 相同结构的导航指令"""
+        graph = self.graph
+        steps = []
+        if len(path) < 2:
+            return [_step(STEP_ARRIVE, 'Arrive at your destination', '', 0.0, speed, 0, 0)]
+
+        step_start = 0
+        step_distance = 0.0
+        _, current_name = graph.edge_between(path[0], path[1])
+        step_type = STEP_DEPART
+        for i in range(len(path) - 1):
+            weight, name_id = graph.edge_between(path[i], path[i + 1])
+            if i > step_start and name_id != current_name:
+                steps.append(_step(step_type, None, graph.names[current_name], step_distance, speed, step_start, i))
+                turn = (graph.bearing(path[i], path[i + 1]) - graph.bearing(path[i - 1], path[i]) + 540) % 360 - 180
+                step_type = _turn_type(turn)
+                step_start, step_distance, current_name = i, 0.0, name_id
+            step_distance += weight
+        last = len(path) - 1
+        steps.append(_step(step_type, None, graph.names[current_name], step_distance, speed, step_start, last))
+        steps.append(_step(STEP_ARRIVE, 'Arrive at your destination', '', 0.0, speed, last, last))
+        return steps
+
+
+_TURN_TEXT = {
+    STEP_LEFT: 'Turn left',
+    STEP_RIGHT: 'Turn right',
+    STEP_SHARP_LEFT: 'Turn sharp left',
+    STEP_SHARP_RIGHT: 'Turn sharp right',
+    STEP_SLIGHT_LEFT: 'Turn slight left',
+    STEP_SLIGHT_RIGHT: 'Turn slight right',
+    STEP_STRAIGHT: 'Continue straight',
+    STEP_DEPART: 'Head',
+}
+
+
+def _turn_type(angle: float) -> int:
+    if abs(angle) < 20:
+        return STEP_STRAIGHT
+    if abs(angle) < 60:
+        return STEP_SLIGHT_RIGHT if angle > 0 else STEP_SLIGHT_LEFT
+    if abs(angle) < 135:
+        return STEP_RIGHT if angle > 0 else STEP_LEFT
+    return STEP_SHARP_RIGHT if angle > 0 else STEP_SHARP_LEFT
+
+
+def _step(step_type, instruction, name, distance, speed, first, last):
+    if instruction is None:
+        instruction = _TURN_TEXT[step_type]
+        if name:
+            instruction += (' on ' if step_type == STEP_DEPART else ' onto ') + name
+    return {
+        'distance': round(distance, 1),
+        'duration': round(distance / speed, 1),
+        'type': step_type,
+        'instruction': instruction,
+        'name': name or '-',
+        'way_points': [first, last],
+    }
+
+
+class RoutingService:
+    """Chooses the routing backend for a request.
+
+    ``ROUTING_BACKEND`` may be ``ors``, ``local`` or ``auto``. In ``auto`` mode
+    the campus graph answers walking profiles and other profiles go to ORS.
+    The campus graph only holds footpaths, so a profile it cannot route is
+    refused rather than answered with walking geometry.
+    """
+
+    def __init__(self):
+        self.mode = 'auto'
+        self.ors = OrsBackend()
+        self.local = LocalGraphBackend()
+        self._executor = None
+
+    def init_app(self, app):
+        self.mode = app.config.get('ROUTING_BACKEND', 'auto')
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._executor = ThreadPoolExecutor(
+            max_workers=app.config.get('ROUTE_PARALLELISM', 4), thread_name_prefix='route'
+        )
+        ors_client = register_upstream(UpstreamClient(
+            'ors',
+            app.config.get('ORS_BASE_URL', 'https://api.openrouteservice.org'),
+            pool_size=app.config.get('ORS_POOL_SIZE', 10),
+            max_concurrency=app.config.get('ORS_MAX_CONCURRENCY', 10),
+            read_timeout=app.config.get('ORS_TIMEOUT_SECONDS', 10.0),
+            retries=app.config.get('ORS_RETRIES', 1),
+            failure_threshold=app.config.get('ORS_BREAKER_FAILURES', 5),
+            reset_timeout=app.config.get('ORS_BREAKER_RESET_SECONDS', 30.0),
+        ))
+        self.ors = OrsBackend(app.config.get('ORS_API_KEY'), ors_client)
+        self.local = LocalGraphBackend(max_snap_m=app.config.get('CAMPUS_GRAPH_MAX_SNAP_M', 300.0))
+
+        graph_path = app.config.get('CAMPUS_GRAPH_PATH')
+        if graph_path and os.path.exists(graph_path):
+            started = time.time()
+            self.local.graph = CampusGraph.from_geojson(graph_path)
+            app.logger.info(
+                "campus_graph_loaded",
+                extra={
+                    "nodes": len(self.local.graph),
+                    "edges": len(self.local.graph.targets) // 2,
+                    "duration_ms": round((time.time() - started) * 1000, 2),
+                },
+            )
+        elif graph_path:
+            app.logger.warning("campus_graph_missing", extra={"path": graph_path})
+
+    def _configured(self):
+        if self.mode == 'ors':
+            backends = (self.ors,)
+        elif self.mode == 'local':
+            backends = (self.local,)
+        else:
+            backends = (self.local, self.ors)
+        return [backend for backend in backends if backend.available]
+
+    def backend_for(self, profile: str):
+        """The first configured backend that can route ``profile``, or ``None``."""
+        for backend in self._configured():
+            if backend.supports(profile):
+                return backend
+        return None
+
+    def backend_error(self, profile: str) -> Optional[RouteServiceError]:
+        """Why ``profile`` cannot be routed here, or ``None`` when a backend can route it."""
+        if self.backend_for(profile) is not None:
+            return None
+        if self._configured():
+            # 例如只有校园步行路网时请求驾车路线
+            return RouteServiceError('Unsupported route profile', 400)
+        return RouteServiceError('Route service not configured', 503)
+
+    def _require_backend(self, profile):
+        backend = self.backend_for(profile)
+        if backend is None:
+            raise self.backend_error(profile)
+        return backend
+
+    def route(self, start, end, profile):
+        """Single route through the cache; concurrent identical requests share one computation."""
+        backend = self._require_backend(profile)
+        cache_key = route_cache.make_key(f'{backend.name}:{profile}', start, end)
+        return route_cache.get_or_compute(cache_key, lambda: backend.route(start, end, profile))
+
+    def matrix(self, locations, profile):
+        """Full distance/duration matrix between ``locations`` in one backend call."""
+        backend = self._require_backend(profile)
+        cache_key = route_cache.make_key(f'{backend.name}:{profile}:matrix', *locations)
+        return route_cache.get_or_compute(cache_key, lambda: backend.matrix(locations, profile))
+
+    def route_marker_pairs(self, pairs, profile):
+        """Route several ``(start_marker_id, end_marker_id)`` pairs with one marker query.
+
+        Returns one entry per pair holding either ``route`` or ``error`` and
+        ``status_code``; legs are computed in parallel on the routing pool.
+        """
+        locations = marker_locations({marker_id for pair in pairs for marker_id in pair})
+
+        def run(pair):
+            start_id, end_id = pair
+            entry = {'start_marker_id': start_id, 'end_marker_id': end_id}
+            if start_id not in locations or end_id not in locations:
+                entry.update(error='One or both markers not found', status_code=404)
+                return entry
+            try:
+                entry['route'] = self.route(locations[start_id], locations[end_id], profile)
+            except RouteServiceError as e:
+                entry.update(error=e.message, status_code=e.status_code)
+            except requests.exceptions.RequestException:
+                entry.update(error='Service unavailable', status_code=503)
+            return entry
+
+        if len(pairs) == 1:
+            return [run(pairs[0])]
+        return self.map_parallel(run, pairs)
+
+    def map_parallel(self, fn, items):
+        """Run ``fn`` over ``items`` on the routing pool, each call inside the app context."""
+        app = current_app._get_current_object()
+
+        def run(item):
+            with app.app_context():
+                return fn(item)
+
+        return list(self._executor.map(run, items))
+
+    def tour(self, locations, profile, roundtrip=False, optimize=True):
+        """Visit all ``locations`` starting from the first one.
+
+        The order comes from the duration matrix, then every leg is routed in
+        parallel and stitched into one route.
+        """
+        matrix = self.matrix(locations, profile)
+        if optimize:
+            order = plan_tour(matrix['durations'], roundtrip=roundtrip)
+        else:
+            order = list(range(len(locations))) + ([0] if roundtrip else [])
+
+        legs = self.map_parallel(
+            lambda pair: self.route(locations[pair[0]], locations[pair[1]], profile),
+            list(zip(order, order[1:])),
+        )
+        return {
+            'order': order,
+            'matrix': matrix,
+            'estimated_duration': path_cost(matrix['durations'], order),
+            'route': merge_legs(legs),
+        }
+
+
+def marker_locations(marker_ids):
+    """一次查询取出多个标记的坐标，返回 {id: [lat, lon]}"""
+    if not marker_ids:
+        return {}
+    rows = (
+        db.session.query(MapMarker.id, MapMarker.latitude, MapMarker.longitude)
+        .filter(MapMarker.id.in_(list(marker_ids)))
+        .all()
+    )
+    return {marker_id: [lat, lon] for marker_id, lat, lon in rows}
+
+
+def merge_legs(legs):
+    """把多段路径拼接为与单段路径相同结构的结果"""
+    coordinates = []
+    instructions = []
+    distance = 0.0
+    duration = 0.0
+    for index, leg in enumerate(legs):
+        offset = max(len(coordinates) - 1, 0)
+        leg_coordinates = leg['coordinates'] if not coordinates else leg['coordinates'][1:]
+        coordinates.extend(leg_coordinates)
+        for step in leg['instructions']:
+            step = dict(step)
+            if 'way_points' in step:
+                step['way_points'] = [point + offset for point in step['way_points']]
+            if step.get('type') == STEP_ARRIVE and index < len(legs) - 1:
+                step['instruction'] = f'Arrive at stop {index + 1}'
+            instructions.append(step)
+        distance += leg['distance']
+        duration += leg['duration']
+    return {
+        'coordinates': coordinates,
+        'distance': round(distance, 1),
+        'duration': round(duration, 1),
+        'instructions': instructions,
+    }
+
+
+routing_service = RoutingService()
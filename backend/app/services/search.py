@@ -0,0 +1,199 @@
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, case, inspect, or_, select, text
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+SEARCH_ORDERS = ('rank', 'recent')
+DEFAULT_SEARCH_PAGE = 20
+MAX_SEARCH_PAGE = 100
+MAX_QUERY_LENGTH = 200
+MAX_TERMS = 8
+FTS_TABLES = ('marker_fts', 'chat_message_fts')
+TRIGRAM = 3
+
+_TERM = re.compile(r'\w+')
+
+
+def search_terms(query: str) -> List[str]:
+    return _TERM.findall(query.lower())[:MAX_TERMS]
+
+
+def match_expression(terms: List[str]) -> Optional[str]:
+    """FTS5 query over the trigram index: every term of three or more characters must occur as a substring.
+
+    Terms are quoted, so user input is never parsed as FTS5 syntax. Shorter
+    terms have no trigram and are left to ``LIKE`` (see ``_fts_ids``).
+    """
+    terms = [f'"{term}"' for term in terms if len(term) >= TRIGRAM]
+    return ' '.join(terms) or None
+
+
+def like_pattern(term: str) -> str:
+    return '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def search_args(args, max_offset: int) -> Tuple[Optional[Dict], Optional[str]]:
+    """校验搜索参数，返回 (参数, 错误信息)"""
+    query = (args.get('q') or '').strip()
+    if not query or len(query) > MAX_QUERY_LENGTH:
+        return None, 'Missing or too long search query'
+    terms = search_terms(query)
+    if not terms:
+        return None, 'Search query has no searchable words'
+    order = args.get('order', 'rank')
+    if order not in SEARCH_ORDERS:
+        return None, 'Invalid order, expected rank or recent'
+    try:
+        limit = int(args.get('limit') or DEFAULT_SEARCH_PAGE)
+        offset = int(args.get('offset') or 0)
+        before_id = int(args['before_id']) if args.get('before_id') else None
+    except ValueError:
+        return None, 'Invalid limit, offset or before_id'
+    if limit <= 0 or offset < 0 or offset >= max_offset:
+        return None, 'Invalid limit, offset or before_id'
+    return {'terms': terms, 'order': order, 'limit': min(limit, MAX_SEARCH_PAGE),
+            'offset': offset, 'before_id': before_id}, None
+
+
+class SearchIndex:
+    """Full-text search over marker titles/descriptions and chat text messages.
+
+    On SQLite the ``m0002`` migration creates trigram FTS5 tables that
+    triggers keep in sync with every insert, update and delete, including
+    bulk writes and the chat write-behind queue. Every term matches as a
+    substring, as in Chinese text without word breaks; terms shorter than a
+    trigram are filtered with ``LIKE`` on the FTS table. Other engines, or
+    ``SEARCH_BACKEND=like``, fall back to ``LIKE`` scans with the same
+    substring semantics and results shape.
+
+    ``recent`` walks the index newest first and stops after one page, so it
+    stays fast however many rows match. ``rank`` orders by BM25 (marker
+    titles weigh more than descriptions) among the newest ``rank_window``
+    matches, which bounds the cost of very common terms; ranked pages are
+    addressed by ``offset``, recent pages by ``before_id``.
+    """
+
+    def __init__(self, backend: str = 'auto', rank_window: int = 1000):
+        self.backend = backend
+        self.rank_window = rank_window
+        self._fts = None
+
+    def init_app(self, app):
+        self.backend = app.config.get('SEARCH_BACKEND', self.backend)
+        self.rank_window = max(app.config.get('SEARCH_RANK_WINDOW', self.rank_window), 1)
+        self._fts = None
+
+    def uses_fts(self) -> bool:
+        # 首次搜索时再检查：应用创建时迁移可能还没执行
+        if self._fts is None:
+            available = False
+            if self.backend != 'like':
+                available = set(FTS_TABLES) <= set(inspect(db.engine).get_table_names())
+                if not available and self.backend == 'fts5':
+                    logger.warning('search_fts_unavailable: run the schema migrations on SQLite with FTS5')
+            self._fts = available
+        return self._fts
+
+    def _fts_ids(self, table: str, columns: Tuple[str, ...], score: str, params: Dict) -> Tuple[List[int], Dict]:
+        binds = {'limit': params['limit'] + 1}
+        conditions = []
+        match = match_expression(params['terms'])
+        if match is not None:
+            conditions.append(f'{table} MATCH :match')
+            binds['match'] = match
+        # 一两个字的词没有三元组可查，在 FTS 表上用 LIKE 按子串过滤
+        for i, term in enumerate(t for t in params['terms'] if len(t) < TRIGRAM):
+            conditions.append('(' + ' OR '.join(f"{column} LIKE :like{i} ESCAPE '\\'" for column in columns) + ')')
+            binds[f'like{i}'] = like_pattern(term)
+        if match is None:
+            # 没有 MATCH 时无法计算 BM25，按时间倒序
+            score = '0'
+        where = ' AND '.join(conditions)
+        if params['order'] == 'recent':
+            if params['before_id'] is not None:
+                where += ' AND rowid < :before_id'
+                binds['before_id'] = params['before_id']
+            sql = f'SELECT rowid FROM {table} WHERE {where} ORDER BY rowid DESC LIMIT :limit'
+        else:
+            binds.update(window=self.rank_window, offset=params['offset'])
+            sql = (
+                f'SELECT rowid FROM (SELECT rowid, {score} AS score FROM {table} WHERE {where} '
+                f'ORDER BY rowid DESC LIMIT :window) ORDER BY score, rowid DESC LIMIT :limit OFFSET :offset'
+            )
+        return self._page(db.session.scalars(text(sql), binds).all(), params)
+
+    def _like_ids(self, id_column, columns, extra, params: Dict) -> Tuple[List[int], Dict]:
+        matches = [or_(*(column.icontains(term, autoescape=True) for column in columns)) for term in params['terms']]
+        statement = select(id_column).where(*extra, *matches)
+        if params['order'] == 'recent':
+            if params['before_id'] is not None:
+                statement = statement.where(id_column < params['before_id'])
+            statement = statement.order_by(id_column.desc())
+        else:
+            # 没有相关度评分：首列（标题）命中全部词的排在前面
+            first = and_(*(columns[0].icontains(term, autoescape=True) for term in params['terms']))
+            statement = statement.order_by(case((first, 0), else_=1), id_column.desc()).offset(params['offset'])
+        return self._page(db.session.scalars(statement.limit(params['limit'] + 1)).all(), params)
+
+    def _page(self, ids: List[int], params: Dict) -> Tuple[List[int], Dict]:
+        limit = params['limit']
+        more = len(ids) > limit
+        ids = ids[:limit]
+        if params['order'] == 'recent':
+            return ids, {'next_before_id': ids[-1] if more else None}
+        next_offset = params['offset'] + limit
+        # 排名只覆盖最新的 rank_window 条命中
+        return ids, {'next_offset': next_offset if more and next_offset < self.rank_window else None}
+
+    @staticmethod
+    def _in_order(rows: List[Dict], ids: List[int]) -> List[Dict]:
+        by_id = {row['id']: row for row in rows}
+        return [by_id[i] for i in ids if i in by_id]
+
+    def markers(self, params: Dict) -> Dict:
+        from app.models.map_marker import MapMarker
+        from app.serialization import MARKER_FIELDS, fetch_dicts, marker_select
+
+        if self.uses_fts():
+            ids, cursor = self._fts_ids('marker_fts', ('title', 'description'), 'bm25(marker_fts, 10.0, 1.0)', params)
+        else:
+            ids, cursor = self._like_ids(MapMarker.id, (MapMarker.title, MapMarker.description), (), params)
+        rows = fetch_dicts(MARKER_FIELDS, marker_select().where(MapMarker.id.in_(ids))) if ids else []
+        return {'markers': self._in_order(rows, ids), 'order': params['order'], **cursor}
+
+    def messages(self, params: Dict) -> Dict:
+        from app.models.chat_message import ChatMessage
+        from app.serialization import chat_message_dicts, chat_message_select
+
+        if self.uses_fts():
+            ids, cursor = self._fts_ids('chat_message_fts', ('content',), 'bm25(chat_message_fts)', params)
+        else:
+            ids, cursor = self._like_ids(ChatMessage.id, (ChatMessage.content,), (ChatMessage.msg_type == 'text',),
+                                         params)
+        rows = []
+        if ids:
+            rows = chat_message_dicts(db.session.execute(chat_message_select().where(ChatMessage.id.in_(ids))))
+        return {'messages': self._in_order(rows, ids), 'order': params['order'], **cursor}
+
+    def rebuild(self) -> bool:
+        """Re-index both tables from scratch; returns ``False`` without FTS5."""
+        self._fts = None
+        if not self.uses_fts():
+            return False
+        db.session.execute(text("INSERT INTO marker_fts (marker_fts) VALUES ('rebuild')"))
+        db.session.execute(text("INSERT INTO chat_message_fts (chat_message_fts) VALUES ('delete-all')"))
+        db.session.execute(text(
+            "INSERT INTO chat_message_fts (rowid, content) SELECT id, content FROM chat_message WHERE msg_type = 'text'"
+        ))
+        db.session.execute(text("INSERT INTO marker_fts (marker_fts) VALUES ('optimize')"))
+        db.session.execute(text("INSERT INTO chat_message_fts (chat_message_fts) VALUES ('optimize')"))
+        db.session.commit()
+        return True
+
+
+search_index = SearchIndex()
@@ -0,0 +1,97 @@
+import logging
+import pickle
+import sqlite3
+import time
+from contextlib import closing
+from typing import Dict, Optional
+
+from socketio import PubSubManager
+
+logger = logging.getLogger(__name__)
+
+SQLITE_SCHEME = 'sqlite:///'
+# 其余 URL 直接交给 python-socketio 自带的 Redis/Kafka/Kombu/ZeroMQ 管理器
+NATIVE_SCHEMES = ('redis://', 'rediss://', 'kafka://', 'zmq', 'amqp://', 'kombu://')
+
+
+class SQLitePubSubManager(PubSubManager):
+    """Socket.IO client manager that fans events out through a SQLite table.
+
+    Every published event is appended to ``socketio_messages``; each worker
+    process tails the table and delivers new rows to its own clients. It is a
+    stand-in broker for running several workers on one host (and for tests)
+    without Redis; production deployments should point
+    ``SOCKETIO_MESSAGE_QUEUE`` at ``redis://``.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path: str, channel: str = 'socketio', poll_interval: float = 0.02,
+                 retention: float = 60.0, write_only: bool = False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._last_prune = 0.0
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS socketio_messages ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, '
+                'payload BLOB NOT NULL, created_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_socketio_messages_created ON socketio_messages (created_at)')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _publish(self, data):
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                'INSERT INTO socketio_messages (channel, payload, created_at) VALUES (?, ?, ?)',
+                (self.channel, pickle.dumps(data), now),
+            )
+            if now - self._last_prune >= self.retention:
+                self._last_prune = now
+                conn.execute('DELETE FROM socketio_messages WHERE created_at < ?', (now - self.retention,))
+
+    def _listen(self):
+        with closing(self._connect()) as conn:
+            # 只投递本进程启动之后发布的事件
+            last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM socketio_messages').fetchone()[0]
+            while True:
+                try:
+                    rows = conn.execute(
+                        'SELECT id, payload FROM socketio_messages WHERE id > ? AND channel = ? ORDER BY id',
+                        (last_id, self.channel),
+                    ).fetchall()
+                except sqlite3.Error:
+                    logger.exception('socketio_queue_poll_failed')
+                    rows = []
+                for row_id, payload in rows:
+                    last_id = row_id
+                    yield payload
+                if not rows:
+                    time.sleep(self.poll_interval)
+
+
+def message_queue_options(config) -> Dict:
+    """Extra ``SocketIO.init_app`` keyword arguments for the configured queue.
+
+    Returns an empty dict when ``SOCKETIO_MESSAGE_QUEUE`` is unset, i.e. the
+    single-process mode where broadcasts stay in memory.
+    """
+    url: Optional[str] = config.get('SOCKETIO_MESSAGE_QUEUE')
+    channel = config.get('SOCKETIO_CHANNEL', 'socketio')
+    if not url:
+        return {}
+    if url.startswith(SQLITE_SCHEME):
+        poll_interval = config.get('SOCKETIO_QUEUE_POLL_MS', 20) / 1000
+        return {'client_manager': SQLitePubSubManager(url[len(SQLITE_SCHEME):], channel=channel,
+                                                      poll_interval=poll_interval)}
+    if url.startswith(NATIVE_SCHEMES):
+        return {'message_queue': url, 'channel': channel}
+    raise RuntimeError(f'Unsupported SOCKETIO_MESSAGE_QUEUE: {url}')
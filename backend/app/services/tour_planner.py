@@ -0,0 +1,52 @@
+import math
+from typing import List, Optional, Sequence
+
+MAX_IMPROVEMENT_PASSES = 50
+
+
+def _cost(matrix: Sequence[Sequence[Optional[float]]], a: int, b: int) -> float:
+    value = matrix[a][b]
+    return math.inf if value is None else value
+
+
+def path_cost(matrix: Sequence[Sequence[Optional[float]]], path: Sequence[int]) -> float:
+    return sum(_cost(matrix, path[i], path[i + 1]) for i in range(len(path) - 1))
+
+
+def plan_tour(matrix: Sequence[Sequence[Optional[float]]], roundtrip: bool = False) -> List[int]:
+    """Visiting order over ``matrix`` starting at index 0.
+
+    Nearest-neighbour construction followed by 2-opt improvement. Costs may be
+    asymmetric (one-way streets), so every candidate is re-evaluated in full
+    rather than by the symmetric 2-opt delta. For a round trip the returned
+    order ends with 0 again.
+    """
+    n = len(matrix)
+    if n <= 2:
+        order = list(range(n))
+        return order + [0] if roundtrip and n > 1 else order
+
+    unvisited = set(range(1, n))
+    path = [0]
+    while unvisited:
+        last = path[-1]
+        nearest = min(unvisited, key=lambda j: (_cost(matrix, last, j), j))
+        path.append(nearest)
+        unvisited.remove(nearest)
+    if roundtrip:
+        path.append(0)
+
+    best = path_cost(matrix, path)
+    # 起点固定；往返时终点也固定为起点
+    last_movable = len(path) - 2 if roundtrip else len(path) - 1
+    for _ in range(MAX_IMPROVEMENT_PASSES):
+        improved = False
+        for i in range(1, last_movable):
+            for j in range(i + 1, last_movable + 1):
+                candidate = path[:i] + path[i:j + 1][::-1] + path[j + 1:]
+                cost = path_cost(matrix, candidate)
+                if cost < best - 1e-9:
+                    path, best, improved = candidate, cost, True
+        if not improved:
+            break
+    return path
@@ -0,0 +1,236 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.metrics import UPSTREAM_LATENCY, UPSTREAM_REJECTED
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+LATENCY_WINDOW = 512
+
+
+class UpstreamUnavailable(requests.exceptions.RequestException):
+    """Raised without touching the network when an upstream is shedding load."""
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    pass
+
+
+class UpstreamBusyError(UpstreamUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    """Classic closed -> open -> half-open breaker.
+
+    After ``failure_threshold`` consecutive failures calls are rejected for
+    ``reset_timeout`` seconds; then a single trial call decides whether the
+    circuit closes again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = STATE_HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == STATE_HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def cancel_trial(self):
+        """Give back a half-open trial slot that was granted but never used."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = STATE_CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == STATE_HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = STATE_OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+class UpstreamClient:
+    """Shared HTTP client for one upstream service.
+
+    Keeps a pooled keep-alive ``requests.Session``, caps in-flight calls with a
+    semaphore, retries connection failures and 502/503/504 with backoff, and
+    trips a circuit breaker on repeated failures. Socket I/O and the semaphore
+    are plain stdlib primitives, so they become cooperative once the server
+    runs under eventlet/gevent monkey-patching.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str = '',
+        *,
+        pool_size: int = 10,
+        max_concurrency: int = 10,
+        acquire_timeout: float = 2.0,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 10.0,
+        retries: int = 1,
+        backoff: float = 0.2,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+    ):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.acquire_timeout = acquire_timeout
+        self.max_concurrency = max_concurrency
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+        retry = Retry(
+            total=retries,
+            read=0,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({'GET', 'POST'}),
+            raise_on_status=False,
+            respect_retry_after_header=True,
+        )
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry, pool_block=False)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._counters = {
+            'requests': 0,
+            'errors': 0,
+            'status_2xx': 0,
+            'status_4xx': 0,
+            'status_5xx': 0,
+            'short_circuited': 0,
+            'rejected_busy': 0,
+        }
+        self._in_flight = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self._counters[key] += 1
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            UPSTREAM_REJECTED.labels(self.name, 'circuit_open').inc()
+            raise CircuitOpenError(f'{self.name} circuit is open')
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            self.breaker.cancel_trial()
+            self._count('rejected_busy')
+            UPSTREAM_REJECTED.labels(self.name, 'busy').inc()
+            raise UpstreamBusyError(f'{self.name} has too many requests in flight')
+
+        kwargs.setdefault('timeout', self.timeout)
+        with self._stats_lock:
+            self._in_flight += 1
+        started = time.perf_counter()
+        response = None
+        try:
+            response = self.session.request(method, f'{self.base_url}{path}', **kwargs)
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            self._slots.release()
+            self._record(response, elapsed)
+
+    def _record(self, response: Optional[requests.Response], elapsed: float):
+        # 429 与 5xx 视为上游退化，计入熔断；其余 4xx 是调用方问题
+        failed = response is None or response.status_code >= 500 or response.status_code == 429
+        if failed:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+        if response is None:
+            outcome = 'errors'
+        elif response.status_code >= 500:
+            outcome = 'status_5xx'
+        elif response.status_code >= 400:
+            outcome = 'status_4xx'
+        else:
+            outcome = 'status_2xx'
+        UPSTREAM_LATENCY.labels(self.name, outcome).observe(elapsed)
+        with self._stats_lock:
+            self._in_flight -= 1
+            self._counters['requests'] += 1
+            self._counters[outcome] += 1
+            self._latencies.append(elapsed)
+            self._latency_total += elapsed
+            self._latency_max = max(self._latency_max, elapsed)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request('POST', path, **kwargs)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request('GET', path, **kwargs)
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self._counters)
+            window = sorted(self._latencies)
+            stats['in_flight'] = self._in_flight
+            completed = stats['requests']
+            stats['latency_avg_ms'] = round(self._latency_total / completed * 1000, 2) if completed else None
+            stats['latency_max_ms'] = round(self._latency_max * 1000, 2)
+        for label, q in (('latency_p50_ms', 0.5), ('latency_p95_ms', 0.95), ('latency_p99_ms', 0.99)):
+            stats[label] = round(window[min(int(q * len(window)), len(window) - 1)] * 1000, 2) if window else None
+        stats['circuit'] = self.breaker.state
+        stats['max_concurrency'] = self.max_concurrency
+        return stats
+
+    def close(self):
+        self.session.close()
+
+
+_clients: Dict[str, UpstreamClient] = {}
+_clients_lock = threading.Lock()
+
+
+def register_upstream(client: UpstreamClient) -> UpstreamClient:
+    """Register (or replace) the shared client for ``client.name``."""
+    with _clients_lock:
+        previous = _clients.get(client.name)
+        _clients[client.name] = client
+    if previous is not None and previous is not client:
+        previous.close()
+    return client
+
+
+def upstream_stats() -> Dict[str, Dict]:
+    with _clients_lock:
+        clients = list(_clients.values())
+    return {client.name: client.stats() for client in clients}
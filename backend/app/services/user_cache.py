@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from app import db
+
+
+class UserCache:
+    """Serialized user views keyed by id, bounded by LRU size and TTL.
+
+    Each entry holds both the private (``to_dict``) and public
+    (``to_dict_public``) view, so profile reads skip the ORM entirely. Writers
+    call ``invalidate`` after committing; with several worker processes the
+    TTL bounds how long another process may serve the previous version.
+    Returned dicts are shared and must not be mutated by callers.
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0}
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('USER_CACHE_MAX_ENTRIES', self.max_entries)
+        self.ttl_seconds = app.config.get('USER_CACHE_TTL_SECONDS', self.ttl_seconds)
+        self.clear()
+
+    def _lookup(self, user_id: int) -> Optional[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                expires_at, views = entry
+                if expires_at > now:
+                    self._entries.move_to_end(user_id)
+                    self._counters['hits'] += 1
+                    return views
+                del self._entries[user_id]
+            self._counters['misses'] += 1
+        return None
+
+    def _load(self, user_id: int) -> Optional[Dict]:
+        from app.models.user import User
+
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        return self.put(user)
+
+    def put(self, user) -> Dict:
+        """Store the views of a freshly loaded or just committed ``User``."""
+        views = {'private': user.to_dict(), 'public': user.to_dict_public()}
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.ttl_seconds, views)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+        return views
+
+    def _views(self, user_id) -> Optional[Dict]:
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        return self._lookup(user_id) or self._load(user_id)
+
+    def get_private(self, user_id) -> Optional[Dict]:
+        views = self._views(user_id)
+        return views['private'] if views else None
+
+    def get_public(self, user_id) -> Optional[Dict]:
+        views = self._views(user_id)
+        return views['public'] if views else None
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(int(user_id), None)
+            self._counters['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats['size'] = len(self._entries)
+        stats['max_entries'] = self.max_entries
+        stats['ttl_seconds'] = self.ttl_seconds
+        return stats
+
+
+user_cache = UserCache()
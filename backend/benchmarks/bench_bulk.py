@@ -0,0 +1,104 @@
+"""Marker writes: single POSTs against bulk create, NDJSON/GeoJSON import and bulk delete.
+
+    python benchmarks/bench_bulk.py --import-size 100000 --json bulk.json
+    python benchmarks/bench_bulk.py --baseline bulk.json
+
+Requests go through the test client with the marker and cluster indexes
+loaded, as on a running server. ``markers_per_sec`` is the throughput in
+markers rather than requests; bulk delete removes markers created by the
+imports, so it runs last.
+"""
+import argparse
+import json
+import random
+import time
+
+from harness import (BENCH_PASSWORD, add_result_arguments, bench_env, create_bench_app, finish, random_point,
+                     summarize, time_calls)
+
+
+def _login(client):
+    client.post('/api/auth/register', json={'username': 'bulk', 'email': 'bulk@example.com',
+                                           'password': BENCH_PASSWORD})
+    token = client.post('/api/auth/login', json={'username': 'bulk', 'password': BENCH_PASSWORD}).get_json()
+    return {'Authorization': f"Bearer {token['access_token']}"}
+
+
+def _markers(rng: random.Random, count: int):
+    for i in range(count):
+        lat, lon = random_point(rng)
+        yield {'title': f'bulk {i}', 'description': 'benchmark', 'latitude': lat, 'longitude': lon}
+
+
+def _feature(marker):
+    return {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [marker['longitude'], marker['latitude']]},
+            'properties': {'title': marker['title'], 'description': marker['description']}}
+
+
+def _checked(response, status):
+    if response.status_code != status:
+        raise RuntimeError(f'{response.status_code}: {response.get_data(as_text=True)[:200]}')
+    return response.get_json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bulk', type=int, default=1000, help='markers or ids per bulk request')
+    parser.add_argument('--import-size', type=int, default=100000, help='markers per import request')
+    parser.add_argument('--seconds', type=float, default=3.0, help='time per benchmark')
+    add_result_arguments(parser)
+    args = parser.parse_args()
+
+    bench_env(PASSWORD_HASH_WORKERS=0, MARKER_BULK_MAX=max(args.bulk, 5000))
+    app = create_bench_app()
+    client = app.test_client()
+    headers = _login(client)
+    rng = random.Random(42)
+    client.get('/api/map/markers?bbox=-90,-180,90,180&limit=1')
+    client.get('/api/map/clusters?z=0')
+
+    single = list(_markers(rng, 1))[0]
+    bulk_body = {'markers': list(_markers(rng, args.bulk))}
+    features = [_feature(marker) for marker in _markers(rng, args.import_size)]
+    ndjson = b''.join(json.dumps(feature).encode() + b'\n' for feature in features)
+    geojson = json.dumps({'type': 'FeatureCollection', 'features': features}).encode()
+
+    def import_body(body, content_type):
+        return lambda: _checked(client.post('/api/map/markers/import', data=body, content_type=content_type,
+                                            headers=headers), 201)
+
+    benchmarks = [
+        ('create_single', 1, 10, lambda: _checked(client.post('/api/map/markers', json=single, headers=headers), 201)),
+        (f'create_bulk_{args.bulk}', args.bulk, 3,
+         lambda: _checked(client.post('/api/map/markers/bulk', json=bulk_body, headers=headers), 201)),
+        (f'import_ndjson_{args.import_size}', args.import_size, 1, import_body(ndjson, 'application/x-ndjson')),
+        (f'import_geojson_{args.import_size}', args.import_size, 1, import_body(geojson, 'application/geo+json')),
+    ]
+    results = {}
+    for name, size, min_calls, call in benchmarks:
+        results[name] = time_calls(call, args.seconds, min_calls=min_calls)
+        results[name]['markers_per_sec'] = round(results[name]['ops_per_sec'] * size, 1)
+
+    exported = client.get('/api/map/markers/export?format=ndjson').get_data().splitlines()
+    ids = [json.loads(line)['id'] for line in exported]
+
+    # 删除的 id 用完即止，不能交给 time_calls 按时长循环
+    latencies = []
+    started = time.perf_counter()
+    while len(ids) >= args.bulk and time.perf_counter() - started < args.seconds:
+        batch, ids = ids[:args.bulk], ids[args.bulk:]
+        t0 = time.perf_counter()
+        _checked(client.post('/api/map/markers/bulk-delete', json={'ids': batch}, headers=headers), 200)
+        latencies.append(time.perf_counter() - t0)
+    name = f'delete_bulk_{args.bulk}'
+    results[name] = summarize(latencies, sum(latencies))
+    results[name]['markers_per_sec'] = round(results[name]['ops_per_sec'] * args.bulk, 1)
+
+    for name, result in results.items():
+        print(f'{name:<34} {result["markers_per_sec"]:>11.1f} markers/s')
+    params = {key: getattr(args, key) for key in ('bulk', 'import_size', 'seconds')}
+    raise SystemExit(finish(args, results, params))
+
+
+if __name__ == '__main__':
+    main()
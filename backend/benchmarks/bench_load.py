@@ -0,0 +1,283 @@
+"""Load driver: concurrent Socket.IO clients and REST calls against a local server.
+
+    python benchmarks/bench_load.py --clients 50 --messages 20 --rest-threads 8 --json load.json
+    python benchmarks/bench_load.py --baseline load.json
+
+Starts the app in a subprocess on a free port (ORS stubbed, data from
+datagen), then runs two phases:
+
+* socket: each client connects, joins, sends ``--messages`` chat messages
+  and disconnects; round-trip latency is measured until the client sees its
+  own broadcast. Own messages not seen within ``--drain-seconds`` are
+  counted as ``socket_messages_lost``.
+* rest: ``--rest-threads`` threads run a weighted mix of marker viewport,
+  cluster, profile and route calls for ``--seconds``.
+
+Install ``websocket-client`` for the driver; without it the Socket.IO
+clients fall back to long-polling, which saturates far earlier.
+"""
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+from harness import (BENCH_PASSWORD, add_result_arguments, bench_env, create_bench_app, finish, random_bbox,
+                     random_point, start_ors_stub, summarize)
+
+REST_MIX = (
+    ('rest_markers_bbox', 50),
+    ('rest_clusters', 20),
+    ('rest_profile', 15),
+    ('rest_route', 15),
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def serve(args):
+    """Subprocess entry point: fill the database and run the Socket.IO server."""
+    bench_env(args.workdir, ORS_BASE_URL=start_ors_stub(args.ors_latency_ms),
+              PASSWORD_HASH_METHOD=args.password_method)
+    from datagen import generate
+    from app import socketio
+    from app.services.password_hasher import password_hasher
+
+    app = create_bench_app()
+    generate(app, args.users, args.markers, args.history)
+    password_hasher.warm()
+    socketio.run(app, host='127.0.0.1', port=args.port, debug=False, use_reloader=False,
+                 log_output=False, allow_unsafe_werkzeug=True)
+
+
+class Server:
+    def __init__(self, args):
+        self.port = _free_port()
+        self.base_url = f'http://127.0.0.1:{self.port}'
+        self.workdir = tempfile.mkdtemp(prefix='campus-bench-')
+        command = [
+            sys.executable, os.path.abspath(__file__), '--serve', '--port', str(self.port),
+            '--workdir', self.workdir, '--users', str(args.users), '--markers', str(args.markers),
+            '--history', str(args.history), '--ors-latency-ms', str(args.ors_latency_ms),
+            '--password-method', args.password_method,
+        ]
+        self.log = open(os.path.join(self.workdir, 'server.log'), 'w')
+        self.process = subprocess.Popen(command, stdout=self.log, stderr=subprocess.STDOUT,
+                                        cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    def wait_ready(self, timeout: float = 120.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'server exited, see {self.log.name}')
+            try:
+                if requests.get(f'{self.base_url}/readyz', timeout=1).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError('server did not become ready')
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+
+
+def _login(base_url: str, username: str) -> dict:
+    response = requests.post(f'{base_url}/api/auth/login', json={'username': username, 'password': BENCH_PASSWORD},
+                             timeout=30)
+    response.raise_for_status()
+    return {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+
+def socket_phase(base_url: str, clients: int, messages: int, interval: float, users: int,
+                 drain_seconds: float = 10.0):
+    import socketio
+
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    delivered = [0]
+    lost = [0]
+    start_gate = threading.Barrier(clients)
+
+    def run_client(index: int):
+        username = f'bench{index % users + 1}'
+        client = socketio.Client(reconnection=False)
+        pending = {}
+        sent_count = [0]
+        joined = threading.Event()
+        done = threading.Event()
+
+        @client.on('previous_messages')
+        def _history(_):
+            joined.set()
+
+        @client.on('message')
+        def _message(data):
+            with lock:
+                delivered[0] += 1
+            sent = pending.pop(data.get('content'), None)
+            if sent is not None:
+                with lock:
+                    samples['socket_message_rtt'].append(time.perf_counter() - sent)
+                if not pending and sent_count[0] == messages:
+                    done.set()
+
+        try:
+            start_gate.wait(timeout=60)
+            t0 = time.perf_counter()
+            client.connect(base_url, wait_timeout=30)
+            t1 = time.perf_counter()
+            client.emit('join', {'username': username})
+            if not joined.wait(30):
+                raise TimeoutError('join')
+            t2 = time.perf_counter()
+            with lock:
+                samples['socket_connect'].append(t1 - t0)
+                samples['socket_join'].append(t2 - t1)
+            for seq in range(messages):
+                content = f'load {index}:{seq}'
+                pending[content] = time.perf_counter()
+                sent_count[0] += 1
+                client.emit('message', {'username': username, 'content': content, 'type': 'text'})
+                time.sleep(interval)
+            if not done.wait(drain_seconds):
+                with lock:
+                    lost[0] += len(pending)
+            t3 = time.perf_counter()
+            client.disconnect()
+            with lock:
+                samples['socket_disconnect'].append(time.perf_counter() - t3)
+        except Exception:
+            with lock:
+                errors['socket_session'] += 1
+            try:
+                client.disconnect()
+            except Exception:
+                pass
+
+    threads = [threading.Thread(target=run_client, args=(i,), daemon=True) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = {name: summarize(samples[name], elapsed, errors.get(name, 0))
+               for name in sorted(set(samples) | set(errors))}
+    results['socket_broadcast_deliveries'] = summarize([], elapsed)
+    results['socket_broadcast_deliveries'].update(n=delivered[0], ops_per_sec=round(delivered[0] / elapsed, 2))
+    results['socket_messages_lost'] = summarize([], elapsed, errors=lost[0])
+    return results
+
+
+def rest_phase(base_url: str, threads: int, seconds: float, users: int):
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    names = [name for name, _ in REST_MIX]
+    weights = [weight for _, weight in REST_MIX]
+    headers = [_login(base_url, f'bench{i % users + 1}') for i in range(threads)]
+
+    def run(index: int):
+        rng = random.Random(index)
+        session = requests.Session()
+        session.headers.update(headers[index])
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            name = rng.choices(names, weights)[0]
+            t0 = time.perf_counter()
+            try:
+                if name == 'rest_markers_bbox':
+                    response = session.get(f'{base_url}/api/map/markers', params={'bbox': random_bbox(rng)})
+                elif name == 'rest_clusters':
+                    response = session.get(f'{base_url}/api/map/clusters', params={'z': rng.randint(12, 17)})
+                elif name == 'rest_profile':
+                    response = session.get(f'{base_url}/api/profile/profile')
+                else:
+                    response = session.post(f'{base_url}/api/map/route', json={
+                        'start': list(random_point(rng)), 'end': list(random_point(rng)), 'profile': 'foot-walking'})
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - t0
+            with lock:
+                if ok:
+                    samples[name].append(elapsed)
+                else:
+                    errors[name] += 1
+
+    workers = [threading.Thread(target=run, args=(i,), daemon=True) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    results = {name: summarize(samples[name], elapsed, errors.get(name, 0)) for name in names}
+    results['rest_total'] = summarize([s for name in names for s in samples[name]], elapsed, sum(errors.values()))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=20, help='concurrent Socket.IO clients')
+    parser.add_argument('--messages', type=int, default=10, help='messages per client')
+    parser.add_argument('--message-interval-ms', type=float, default=200.0)
+    parser.add_argument('--drain-seconds', type=float, default=10.0,
+                        help='how long a client waits for its own last messages')
+    parser.add_argument('--rest-threads', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10.0, help='duration of the REST phase')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--markers', type=int, default=5000)
+    parser.add_argument('--history', type=int, default=2000, help='chat messages generated up front')
+    parser.add_argument('--ors-latency-ms', type=float, default=20.0)
+    parser.add_argument('--password-method', default='pbkdf2:sha256:600000')
+    parser.add_argument('--skip', choices=('socket', 'rest'), help='skip one phase')
+    add_result_arguments(parser)
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    server = Server(args)
+    try:
+        server.wait_ready()
+        results = {}
+        if args.skip != 'socket':
+            results.update(socket_phase(server.base_url, args.clients, args.messages, args.message_interval_ms / 1000,
+                                         args.users, args.drain_seconds))
+        if args.skip != 'rest':
+            results.update(rest_phase(server.base_url, args.rest_threads, args.seconds, args.users))
+    finally:
+        server.stop()
+
+    params = {key: getattr(args, key) for key in (
+        'clients', 'messages', 'message_interval_ms', 'drain_seconds', 'rest_threads', 'seconds', 'users',
+        'markers', 'history', 'ors_latency_ms', 'password_method')}
+    raise SystemExit(finish(args, results, params))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Micro-benchmarks for serialization, password hashing and marker queries.
+
+    python benchmarks/bench_micro.py --markers 20000 --json micro.json
+    python benchmarks/bench_micro.py --baseline micro.json --max-regression 0.15
+
+Each benchmark runs single-threaded for ``--seconds`` against a fresh
+database filled by datagen; results are per call.
+"""
+import argparse
+import random
+
+from harness import BENCH_PASSWORD, add_result_arguments, bench_env, create_bench_app, finish, random_bbox, time_calls
+
+PAGE_SIZE = 200
+
+
+def _benchmarks(app, client, rng):
+    from app import db
+    from app.models.map_marker import MapMarker
+    from app.models.user import User
+    from app.services.chat_history import chat_history, history_page
+    from app.services.marker_clusters import marker_clusters
+    from app.services.marker_index import marker_index
+
+    user = User.query.first()
+    markers = MapMarker.query.limit(PAGE_SIZE).all()
+    newest_id = db.session.query(db.func.max(MapMarker.id)).scalar() or 0
+    marker_index.ensure_loaded()
+    marker_clusters.ensure_loaded()
+    chat_history.warm()
+
+    def sql_bbox():
+        min_lat, min_lon, max_lat, max_lon = map(float, random_bbox(rng).split(','))
+        return MapMarker.query.filter(
+            MapMarker.latitude.between(min_lat, max_lat),
+            MapMarker.longitude.between(min_lon, max_lon),
+        ).limit(PAGE_SIZE).all()
+
+    def index_bbox():
+        min_lat, min_lon, max_lat, max_lon = map(float, random_bbox(rng).split(','))
+        ids = marker_index.query(min_lat, min_lon, max_lat, max_lon, limit=PAGE_SIZE)
+        return MapMarker.query.filter(MapMarker.id.in_(ids)).all() if ids else []
+
+    def rest(path):
+        def call():
+            response = client.get(path() if callable(path) else path)
+            assert response.status_code == 200, response.status_code
+        return call
+
+    return {
+        'user_to_dict': user.to_dict,
+        'user_to_dict_public': user.to_dict_public,
+        'marker_to_dict': markers[0].to_dict,
+        f'markers_{PAGE_SIZE}_to_json': lambda: app.json.dumps([m.to_dict() for m in markers]),
+        'password_verify': lambda: user.check_password(BENCH_PASSWORD),
+        'marker_bbox_sql': sql_bbox,
+        'marker_bbox_index': index_bbox,
+        'marker_get_by_id': lambda: db.session.get(MapMarker, rng.randint(1, max(newest_id, 1))),
+        'clusters_z14': lambda: marker_clusters.query(14),
+        'chat_recent': chat_history.recent,
+        'chat_history_page': lambda: history_page(None, 50),
+        'rest_markers_bbox': rest(lambda: f'/api/map/markers?bbox={random_bbox(rng)}'),
+        'rest_clusters_z14': rest('/api/map/clusters?z=14'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--markers', type=int, default=5000)
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--seconds', type=float, default=2.0, help='time per benchmark')
+    parser.add_argument('--only', help='comma-separated benchmark names')
+    parser.add_argument('--password-method', help='PASSWORD_HASH_METHOD (default: the app default)')
+    add_result_arguments(parser)
+    args = parser.parse_args()
+
+    overrides = {'PASSWORD_HASH_WORKERS': 0}
+    if args.password_method:
+        overrides['PASSWORD_HASH_METHOD'] = args.password_method
+    bench_env(**overrides)
+
+    from datagen import generate
+
+    app = create_bench_app()
+    generate(app, args.users, args.markers, args.messages)
+    client = app.test_client()
+    rng = random.Random(7)
+    only = set(args.only.split(',')) if args.only else None
+
+    results = {}
+    with app.app_context():
+        for name, fn in _benchmarks(app, client, rng).items():
+            if only and name not in only:
+                continue
+            results[name] = time_calls(fn, args.seconds)
+
+    params = {key: getattr(args, key) for key in ('users', 'markers', 'messages', 'seconds')}
+    params['password_method'] = app.config['PASSWORD_HASH_METHOD']
+    raise SystemExit(finish(args, results, params))
+
+
+if __name__ == '__main__':
+    main()
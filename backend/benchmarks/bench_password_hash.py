@@ -0,0 +1,57 @@
+"""Password hashing throughput: logins (verifications) per second per core.
+
+    python benchmarks/bench_password_hash.py --method pbkdf2:sha256:600000 --workers 4
+
+Measures verification inline in this process and on the same process pool
+the app uses, so the numbers show what PASSWORD_HASH_METHOD costs and how
+far PASSWORD_HASH_WORKERS scales on this machine.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.services.password_hasher import PasswordHasher  # noqa: E402
+
+
+def _measure(hasher, stored, seconds, concurrency):
+    from concurrent.futures import ThreadPoolExecutor
+
+    done = 0
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as threads:
+        while time.perf_counter() < deadline:
+            results = list(threads.map(lambda _: hasher.verify(stored, 'correct horse'), range(concurrency)))
+            assert all(results)
+            done += len(results)
+    return done / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--method', default='pbkdf2:sha256:600000')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    inline = PasswordHasher(method=args.method, workers=0)
+    stored = inline.hash('correct horse')
+    single = _measure(inline, stored, args.seconds, 1)
+    print(f'method={args.method}')
+    print(f'inline: {single:.1f} logins/s ({1000 / single:.1f} ms per verification)')
+
+    pooled = PasswordHasher(method=args.method, workers=args.workers)
+    pooled.warm()
+    try:
+        total = _measure(pooled, stored, args.seconds, args.workers * 2)
+    finally:
+        pooled.shutdown()
+    cores = min(args.workers, os.cpu_count() or 1)
+    print(f'pool x{args.workers}: {total:.1f} logins/s, {total / cores:.1f} logins/s per core ({cores} cores used)')
+
+
+if __name__ == '__main__':
+    main()
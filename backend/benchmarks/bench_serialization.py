@@ -0,0 +1,118 @@
+"""Listing serialization: ORM + to_dict + stdlib jsonify versus projection + fast encoder.
+
+    python benchmarks/bench_serialization.py --markers 20000 --json ser.json
+    python benchmarks/bench_serialization.py --baseline ser.json
+
+For the full marker list and a chat history page, each variant builds and
+drains the complete response body the way the endpoint does. ``legacy``
+reproduces the previous code path (ORM objects, ``to_dict()``, Flask's
+stdlib provider); ``projection`` selects column tuples and encodes with the
+app's provider; ``streamed`` is the chunked response the endpoint returns
+now. Peak traced memory of one call is reported as ``peak_kib``.
+"""
+import argparse
+import tracemalloc
+
+from flask.json.provider import DefaultJSONProvider
+
+from harness import add_result_arguments, bench_env, create_bench_app, finish, time_calls
+
+HISTORY_PAGE = 200
+
+
+def _variants(app):
+    from app import db
+    from app.models.chat_message import ChatMessage
+    from app.models.map_marker import MapMarker
+    from app.serialization import (MARKER_FIELDS, chat_message_dicts, chat_message_select, fetch_dicts,
+                                   iter_batches, marker_select, stream_list)
+
+    stdlib = DefaultJSONProvider(app)
+
+    def drain(response):
+        return sum(len(chunk) for chunk in response.response)
+
+    def legacy_markers():
+        markers = MapMarker.query.all()
+        return drain(stdlib.response({'markers': [m.to_dict() for m in markers]}))
+
+    def projection_markers():
+        return drain(app.json.response({'markers': fetch_dicts(MARKER_FIELDS, marker_select())}))
+
+    def streamed_markers():
+        return drain(stream_list('markers', iter_batches(MARKER_FIELDS, marker_select().order_by(MapMarker.id))))
+
+    def legacy_history():
+        rows = ChatMessage.query.order_by(ChatMessage.id.desc()).limit(HISTORY_PAGE).all()
+        return drain(stdlib.response({'messages': [m.to_dict() for m in reversed(rows)]}))
+
+    def projection_history():
+        statement = chat_message_select().order_by(ChatMessage.id.desc()).limit(HISTORY_PAGE)
+        rows = db.session.execute(statement).all()
+        return drain(app.json.response({'messages': chat_message_dicts(reversed(rows))}))
+
+    return {
+        'markers_all_legacy': legacy_markers,
+        'markers_all_projection': projection_markers,
+        'markers_all_streamed': streamed_markers,
+        f'history_{HISTORY_PAGE}_legacy': legacy_history,
+        f'history_{HISTORY_PAGE}_projection': projection_history,
+    }
+
+
+def _per_request(app, fn):
+    """Run ``fn`` like a request: fresh request context and session each call."""
+    from app import db
+
+    def call():
+        with app.test_request_context('/api/map/markers'):
+            try:
+                fn()
+            finally:
+                db.session.remove()
+    return call
+
+
+def _peak_kib(call) -> float:
+    tracemalloc.start()
+    try:
+        call()
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--markers', type=int, default=20000)
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--seconds', type=float, default=3.0, help='time per benchmark')
+    parser.add_argument('--only', help='comma-separated benchmark names')
+    add_result_arguments(parser)
+    args = parser.parse_args()
+
+    bench_env(PASSWORD_HASH_WORKERS=0)
+    from datagen import generate
+
+    app = create_bench_app()
+    generate(app, args.users, args.markers, args.messages)
+    only = set(args.only.split(',')) if args.only else None
+
+    results = {}
+    with app.app_context():
+        for name, fn in _variants(app).items():
+            if only and name not in only:
+                continue
+            call = _per_request(app, fn)
+            call()
+            results[name] = time_calls(call, args.seconds, min_calls=3)
+            results[name]['peak_kib'] = _peak_kib(call)
+
+    params = {key: getattr(args, key) for key in ('users', 'markers', 'messages', 'seconds')}
+    params['json_backend'] = app.json.backend
+    raise SystemExit(finish(args, results, params))
+
+
+if __name__ == '__main__':
+    main()
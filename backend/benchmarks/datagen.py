@@ -0,0 +1,125 @@
+"""Synthetic users, markers and chat history at a configurable scale.
+
+    python benchmarks/datagen.py --users 1000 --markers 20000 --messages 50000 \
+        --database-url sqlite:////tmp/campus-bench.db
+
+Rows are generated from a fixed seed, so the same arguments always produce
+the same data. All users share the password ``bench-password``; its hash is
+computed once with ``PASSWORD_HASH_METHOD``.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from harness import BENCH_PASSWORD, bench_env, create_bench_app, random_point
+
+BATCH_SIZE = 5000
+STICKERS = ('😀', '👍', '🎉', '❤️', '😂')
+WORDS = ('library', 'canteen', 'lecture', 'lab', 'bus', 'exam', 'coffee', 'gym', 'hall', 'meeting', 'today', 'later')
+
+
+def _batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate(app, users: int = 100, markers: int = 2000, messages: int = 5000, seed: int = 42) -> dict:
+    """Insert the rows in chunked transactions; returns the counts and timings."""
+    from app import db
+    from app.models.chat_message import ChatMessage
+    from app.models.map_marker import MapMarker
+    from app.models.user import User
+    from app.services.password_hasher import password_hasher
+
+    rng = random.Random(seed)
+    now = datetime.now()
+    report = {}
+    with app.app_context():
+        password_hash = password_hasher.hash(BENCH_PASSWORD)
+        first_user = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+
+        started = time.perf_counter()
+        user_rows = ({
+            'username': f'bench{first_user + i}',
+            'email': f'bench{first_user + i}@example.com',
+            'password_hash': password_hash,
+            'first_name': rng.choice(WORDS).title(),
+            'bio': ' '.join(rng.choices(WORDS, k=8)),
+            'created_at': now - timedelta(days=rng.randint(0, 365)),
+        } for i in range(users))
+        for batch in _batches(user_rows):
+            db.session.execute(db.insert(User), batch)
+            db.session.commit()
+        report['users'] = {'rows': users, 'seconds': round(time.perf_counter() - started, 3)}
+
+        user_ids = [row[0] for row in db.session.query(User.id).all()]
+        usernames = [row[0] for row in db.session.query(User.username).all()]
+
+        started = time.perf_counter()
+
+        def marker_rows():
+            for i in range(markers):
+                lat, lon = random_point(rng)
+                yield {
+                    'title': f'{rng.choice(WORDS).title()} {i}',
+                    'description': ' '.join(rng.choices(WORDS, k=12)),
+                    'latitude': lat,
+                    'longitude': lon,
+                    'user_id': rng.choice(user_ids),
+                    'created_at': now - timedelta(minutes=rng.randint(0, 500000)),
+                }
+        if user_ids:
+            for batch in _batches(marker_rows()):
+                db.session.execute(db.insert(MapMarker), batch)
+                db.session.commit()
+        report['markers'] = {'rows': markers if user_ids else 0, 'seconds': round(time.perf_counter() - started, 3)}
+
+        started = time.perf_counter()
+        first_ts = now - timedelta(seconds=messages * 5)
+
+        def message_rows():
+            for i in range(messages):
+                sticker = rng.random() < 0.1
+                yield {
+                    'msg_type': 'sticker' if sticker else 'text',
+                    'username': rng.choice(usernames),
+                    'content': rng.choice(STICKERS) if sticker else ' '.join(rng.choices(WORDS, k=rng.randint(3, 20))),
+                    'avatar_url': None,
+                    'timestamp': first_ts + timedelta(seconds=i * 5),
+                }
+        if usernames:
+            for batch in _batches(message_rows()):
+                db.session.execute(db.insert(ChatMessage), batch)
+                db.session.commit()
+        report['messages'] = {'rows': messages if usernames else 0, 'seconds': round(time.perf_counter() - started, 3)}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--markers', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database-url', help='target database (default: a new temp SQLite file)')
+    args = parser.parse_args()
+
+    overrides = {'DATABASE_URL': args.database_url} if args.database_url else {}
+    workdir = bench_env(**overrides)
+    app = create_bench_app()
+    report = generate(app, args.users, args.markers, args.messages, args.seed)
+    print(f"database: {app.config['SQLALCHEMY_DATABASE_URI']} (workdir {workdir})")
+    for table, stats in report.items():
+        rate = stats['rows'] / stats['seconds'] if stats['seconds'] else 0
+        print(f"{table:<9} {stats['rows']:>8} rows in {stats['seconds']:.2f}s ({rate:,.0f} rows/s)")
+
+
+if __name__ == '__main__':
+    main()
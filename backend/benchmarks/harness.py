@@ -0,0 +1,213 @@
+"""Shared helpers for the benchmark scripts.
+
+Sets up an isolated app (temp SQLite database, stubbed ORS, rate limits off),
+summarizes latency samples and compares results with a stored baseline.
+"""
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND_DIR)
+
+# 香港校园附近，与前端地图默认中心一致
+CENTER = (22.3193, 114.1694)
+SPREAD_DEG = 0.05
+BENCH_PASSWORD = 'bench-password'
+
+
+def bench_env(workdir: Optional[str] = None, **overrides) -> str:
+    """Point the app config at a scratch directory; call before ``create_app``."""
+    workdir = workdir or tempfile.mkdtemp(prefix='campus-bench-')
+    env = {
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'MEDIA_ROOT': os.path.join(workdir, 'media'),
+        'AVATAR_ROOT': os.path.join(workdir, 'avatars'),
+        'ROUTE_CACHE_PATH': '',
+        'RATE_LIMIT_ENABLED': '0',
+        'SLOW_REQUEST_MS': '0',
+        'FLASK_DEBUG': '0',
+        'SECRET_KEY': 'bench',
+        'JWT_SECRET_KEY': 'bench-jwt-secret-key-with-32-bytes!',
+        'ROUTING_BACKEND': 'ors',
+        'ORS_API_KEY': 'stub',
+    }
+    env.update({key: str(value) for key, value in overrides.items()})
+    os.environ.update(env)
+    return workdir
+
+
+def create_bench_app():
+    from app import create_app, db
+    from app.migrations import upgrade
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        upgrade(db.engine)
+    return app
+
+
+class _OrsHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        if self.latency:
+            time.sleep(self.latency)
+        if '/matrix/' in self.path:
+            n = len(payload.get('locations', []))
+            grid = [[float(abs(i - j) * 100) for j in range(n)] for i in range(n)]
+            body = {'distances': grid, 'durations': grid}
+        else:
+            coordinates = payload.get('coordinates', [[0, 0], [0, 0]])
+            body = {'features': [{
+                'geometry': {'coordinates': coordinates},
+                'properties': {'segments': [{'distance': 1000.0, 'duration': 720.0, 'steps': []}]},
+            }]}
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_ors_stub(latency_ms: float = 20.0) -> str:
+    """Serve canned ORS directions/matrix responses; returns the base URL."""
+    handler = type('OrsStubHandler', (_OrsHandler,), {'latency': latency_ms / 1000})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='ors-stub', daemon=True).start()
+    return f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def random_point(rng: random.Random):
+    return (CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+            CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG))
+
+
+def random_bbox(rng: random.Random, size_deg: float = 0.01):
+    lat, lon = random_point(rng)
+    return f'{lat:.5f},{lon:.5f},{lat + size_deg:.5f},{lon + size_deg:.5f}'
+
+
+def percentile(sorted_samples: List[float], q: float) -> Optional[float]:
+    if not sorted_samples:
+        return None
+    index = min(len(sorted_samples) - 1, max(0, math.ceil(q * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int = 0) -> Dict:
+    """Throughput and latency percentiles (ms) for one benchmark."""
+    samples = sorted(latencies)
+    result = {
+        'n': len(samples),
+        'errors': errors,
+        'ops_per_sec': round(len(samples) / elapsed, 2) if elapsed > 0 else None,
+    }
+    for label, q in (('p50_ms', 0.5), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+        value = percentile(samples, q)
+        result[label] = round(value * 1000, 4) if value is not None else None
+    return result
+
+
+def time_calls(fn, seconds: float = 2.0, min_calls: int = 5) -> Dict:
+    """Call ``fn`` repeatedly for ``seconds`` and summarize per-call latency."""
+    latencies = []
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline or len(latencies) < min_calls:
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def print_table(results: Dict[str, Dict]):
+    # 带内存峰值的基准多打印一列
+    memory = any('peak_kib' in r for r in results.values())
+    print(f"{'benchmark':<34} {'ops/s':>11} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'n':>7} {'err':>5}"
+          + (f" {'peak KiB':>10}" if memory else ''))
+    for name, r in results.items():
+        def fmt(value, spec):
+            return format(value, spec) if value is not None else '-'
+        print(f"{name:<34} {fmt(r['ops_per_sec'], '11.1f')} {fmt(r['p50_ms'], '9.3f')} "
+              f"{fmt(r['p95_ms'], '9.3f')} {fmt(r['p99_ms'], '9.3f')} {r['n']:>7} {r.get('errors', 0):>5}"
+              + (f" {fmt(r.get('peak_kib'), '10.1f')}" if memory else ''))
+
+
+def write_results(path: str, results: Dict[str, Dict], params: Dict):
+    document = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'command': ' '.join(['python', os.path.relpath(sys.argv[0])] + sys.argv[1:]),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                    'cpus': os.cpu_count()},
+        'params': params,
+        'results': results,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+
+
+def load_results(path: str) -> Dict[str, Dict]:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['results']
+
+
+def compare(current: Dict[str, Dict], baseline: Dict[str, Dict], max_regression: float = 0.15) -> List[str]:
+    """Regressions beyond ``max_regression`` (fraction) in throughput, p95/p99 or peak memory."""
+    regressions = []
+    for name, base in baseline.items():
+        now = current.get(name)
+        if now is None:
+            continue
+        if now.get('errors', 0) > base.get('errors', 0):
+            regressions.append(f'{name}: errors {base.get("errors", 0)} -> {now["errors"]}')
+        if base.get('ops_per_sec') and now.get('ops_per_sec') is not None:
+            change = now['ops_per_sec'] / base['ops_per_sec'] - 1
+            if change < -max_regression:
+                regressions.append(f'{name}: throughput {change:+.1%} ({base["ops_per_sec"]} -> {now["ops_per_sec"]} ops/s)')
+        for key, unit in (('p95_ms', 'ms'), ('p99_ms', 'ms'), ('peak_kib', 'KiB')):
+            if base.get(key) and now.get(key) is not None:
+                change = now[key] / base[key] - 1
+                if change > max_regression:
+                    regressions.append(f'{name}: {key} {change:+.1%} ({base[key]} -> {now[key]} {unit})')
+    return regressions
+
+
+def add_result_arguments(parser):
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='compare with a results file written by --json')
+    parser.add_argument('--max-regression', type=float, default=0.15,
+                        help='allowed slowdown as a fraction (default 0.15)')
+
+
+def finish(args, results: Dict[str, Dict], params: Dict) -> int:
+    """Print, save and compare results; returns the process exit code."""
+    print_table(results)
+    if args.json:
+        write_results(args.json, results, params)
+        print(f'results written to {args.json}')
+    if args.baseline:
+        regressions = compare(results, load_results(args.baseline), args.max_regression)
+        if regressions:
+            print(f'REGRESSIONS vs {args.baseline}:')
+            for line in regressions:
+                print(f'  {line}')
+            return 1
+        print(f'no regressions beyond {args.max_regression:.0%} vs {args.baseline}')
+    return 0
@@ -1,4 +1,8 @@
 from app import create_app, socketio, db
+from app.services.chat_history import chat_history
+from app.database import log_database_report
+from app.migrations import upgrade
+from app.services.password_hasher import password_hasher
 import os
 
 app = create_app()
@@ -6,6 +10,10 @@ app = create_app()
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        upgrade(db.engine)
+        chat_history.warm()
+    log_database_report(app, db)
+    password_hasher.warm()
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", "5000"))
     socketio.run(app, debug=bool(app.config.get("DEBUG")), host=host, port=port)
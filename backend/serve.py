@@ -0,0 +1,360 @@
+"""Production entry point: cooperative workers, pre-forked startup and graceful drain.
+
+    SERVER_WORKER=eventlet SERVER_WORKERS=2 python serve.py
+
+``SERVER_WORKER`` picks the worker model (``auto`` tries eventlet, then
+gevent). The standard library is monkey-patched before the app is imported,
+so ORS requests, the Socket.IO message queue and presence heartbeats yield
+instead of blocking the hub.
+
+The master process creates the app, applies migrations and warms caches
+once, then forks ``SERVER_WORKERS`` workers. With more than one worker,
+worker ``i`` listens on ``PORT + i`` for a sticky load balancer, and
+``SOCKETIO_MESSAGE_QUEUE`` must be set.
+
+On SIGTERM/SIGINT a worker drains:
+
+1. ``/readyz`` answers 503 for ``SERVER_READINESS_GRACE_SECONDS``.
+2. It stops accepting connections.
+3. It closes its Socket.IO transports. Clients reconnect to another worker.
+4. It waits up to ``SERVER_DRAIN_SECONDS`` for in-flight requests.
+5. It flushes the chat write queue and exits.
+"""
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+WORKER_MODELS = ('eventlet', 'gevent')
+
+
+def _select_worker(requested: str) -> str:
+    requested = (requested or 'auto').strip().lower()
+    candidates = WORKER_MODELS if requested == 'auto' else (requested,)
+    for name in candidates:
+        if name not in WORKER_MODELS:
+            raise SystemExit(f'Unsupported SERVER_WORKER: {name} (expected auto, eventlet or gevent)')
+        try:
+            __import__(name)
+        except ImportError:
+            continue
+        return name
+    raise SystemExit('serve.py needs eventlet or gevent: pip install eventlet')
+
+
+WORKER = _select_worker(os.getenv('SERVER_WORKER'))
+
+# 必须在导入应用和其依赖之前完成 monkey patch
+if WORKER == 'eventlet':
+    import eventlet
+
+    eventlet.monkey_patch()
+else:
+    from gevent import monkey
+
+    monkey.patch_all()
+
+os.environ['SOCKETIO_ASYNC_MODE'] = WORKER
+
+import logging  # noqa: E402
+import random  # noqa: E402
+import signal  # noqa: E402
+import socket  # noqa: E402
+import sys  # noqa: E402
+import threading  # noqa: E402
+import time  # noqa: E402
+import uuid  # noqa: E402
+
+from app import create_app, db, socketio  # noqa: E402
+from app.database import log_database_report  # noqa: E402
+from app.migrations import upgrade  # noqa: E402
+from app.services.chat_history import chat_history  # noqa: E402
+from app.services.lifecycle import lifecycle  # noqa: E402
+from app.services.password_hasher import password_hasher  # noqa: E402
+from app.services.presence import presence  # noqa: E402
+
+logger = logging.getLogger('serve')
+
+
+def _eventlet_protocol():
+    import eventlet.wsgi as wsgi
+
+    class DrainingProtocol(wsgi.HttpProtocol):
+        """Marks a connection busy while a request is handled.
+
+        eventlet 0.33 never leaves ``STATE_IDLE``, so stopping the server also
+        shut down connections with a response still pending.
+        """
+
+        def _read_request_line(self):
+            line = super()._read_request_line()
+            if line and self.conn_state[2] == wsgi.STATE_IDLE:
+                self.conn_state[2] = wsgi.STATE_REQUEST
+            return line
+
+        def handle_one_request(self):
+            try:
+                return super().handle_one_request()
+            finally:
+                if self.conn_state[2] == wsgi.STATE_REQUEST:
+                    self.conn_state[2] = wsgi.STATE_IDLE
+
+    return DrainingProtocol
+
+
+class EventletServer:
+    def __init__(self, app, host: str, port: int, max_connections: int, backlog: int):
+        import eventlet.wsgi
+
+        self._wsgi = eventlet.wsgi
+        self._protocol = _eventlet_protocol()
+        self.app = app
+        # 不共享端口：重复启动应当报错而不是与旧进程分摊连接
+        self.listener = eventlet.listen((host, port), backlog=backlog, reuse_port=False)
+        self.pool = eventlet.GreenPool(max_connections)
+        self._thread = None
+
+    def serve(self):
+        self._thread = eventlet.spawn(self._wsgi.server, self.listener, self.app, custom_pool=self.pool,
+                                      protocol=self._protocol, log_output=False)
+        self._thread.wait()
+
+    def stop_accepting(self):
+        # wsgi.server 收到 SystemExit 后退出 accept 循环，再等待已有连接结束
+        if self._thread is not None:
+            self._thread.kill(SystemExit)
+
+    def join(self, timeout: float) -> bool:
+        with eventlet.Timeout(timeout, False):
+            self.pool.waitall()
+            return True
+        return False
+
+    def abort(self):
+        for thread in list(self.pool.coroutines_running):
+            thread.kill()
+
+    @staticmethod
+    def on_signals(signums, handler):
+        # 信号处理函数在 hub 的 epoll 等待中执行，新协程要等到 epoll 超时才会运行；
+        # 改为通过 wakeup fd 唤醒 hub，由协程读取信号编号后处理
+        read_fd, write_fd = os.pipe()
+        os.set_blocking(write_fd, False)
+        signal.set_wakeup_fd(write_fd)
+        for signum in signums:
+            signal.signal(signum, lambda *_: None)
+
+        def watch():
+            while True:
+                eventlet.hubs.trampoline(read_fd, read=True)
+                if set(os.read(read_fd, 64)) & set(signums):
+                    handler()
+
+        eventlet.spawn(watch)
+
+
+def _gevent_handler(server):
+    from gevent import pywsgi
+
+    base = pywsgi.WSGIHandler
+    try:
+        from geventwebsocket.handler import WebSocketHandler
+
+        base = WebSocketHandler
+    except ImportError:
+        logger.warning('gevent-websocket is not installed, Socket.IO falls back to long-polling')
+
+    class DrainingHandler(base):
+        """Tracks keep-alive connections waiting for their next request.
+
+        pywsgi leaves them open after ``close()``; the drain shuts them down so
+        only connections with a request in progress are waited for.
+        """
+
+        served = False
+
+        def read_requestline(self):
+            if server.closing and self.served:
+                return ''
+            server.idle.add(self.socket)
+            try:
+                return super().read_requestline()
+            finally:
+                server.idle.discard(self.socket)
+                self.served = True
+
+    return DrainingHandler
+
+
+class GeventServer:
+    def __init__(self, app, host: str, port: int, max_connections: int, backlog: int):
+        from gevent import pywsgi
+        from gevent.pool import Pool
+
+        self.drain_seconds = app.config['SERVER_DRAIN_SECONDS']
+        self.closing = False
+        self.idle = set()
+        self.pool = Pool(max_connections)
+        self.server = pywsgi.WSGIServer((host, port), app, spawn=self.pool, backlog=backlog, log=None,
+                                        handler_class=_gevent_handler(self))
+
+    def serve(self):
+        # serve_forever 停止时默认只给处理中的请求 1 秒
+        self.server.serve_forever(stop_timeout=self.drain_seconds)
+
+    def stop_accepting(self):
+        self.closing = True
+        self.server.close()
+        for sock in list(self.idle):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def join(self, timeout: float) -> bool:
+        return self.pool.join(timeout=timeout)
+
+    def abort(self):
+        self.pool.kill(block=False)
+        self.server.stop(timeout=0)
+
+    @staticmethod
+    def on_signals(signums, handler):
+        import gevent
+
+        for signum in signums:
+            gevent.signal_handler(signum, lambda: gevent.spawn(handler))
+
+
+SERVERS = {'eventlet': EventletServer, 'gevent': GeventServer}
+
+
+def _drain(app, server):
+    grace = app.config['SERVER_READINESS_GRACE_SECONDS']
+    timeout = app.config['SERVER_DRAIN_SECONDS']
+    lifecycle.begin_drain()
+    # 先让负载均衡从 /readyz 感知下线，再停止接收新连接
+    time.sleep(grace)
+    server.stop_accepting()
+    # engine.io 层关闭连接，客户端按 transport close 自动重连；
+    # 断开回调会切换协程，需先复制 sid 列表
+    eio = socketio.server.eio
+    for sid in list(eio.sockets):
+        eio.disconnect(sid)
+    if not server.join(timeout):
+        logger.warning('drain_timeout', extra={'seconds': timeout})
+        server.abort()
+
+
+def run_worker(app, host: str, port: int):
+    # 先启动哈希进程池，避免子进程继承监听套接字
+    password_hasher.warm()
+    server = SERVERS[WORKER](app, host, port, app.config['SERVER_MAX_CONNECTIONS'], app.config['SERVER_BACKLOG'])
+
+    draining = []
+    drained = threading.Event()
+
+    def on_term():
+        if not draining:
+            draining.append(True)
+            try:
+                _drain(app, server)
+            finally:
+                drained.set()
+
+    server.on_signals((signal.SIGTERM, signal.SIGINT), on_term)
+
+    logger.info('worker_started', extra={'pid': os.getpid(), 'port': port, 'worker': WORKER})
+    server.serve()
+    # gevent 的 serve 在停止接收后立即返回，需等排空结束
+    if draining:
+        drained.wait()
+    lifecycle.shutdown_services()
+    logger.info('worker_stopped', extra={'pid': os.getpid(), 'port': port})
+
+
+def _after_fork(app):
+    if WORKER == 'eventlet':
+        # eventlet 的 hub 在 fork 后仍与主进程共用同一个 epoll 实例（gevent 会自动重建）
+        eventlet.hubs.use_hub()
+    # 子进程不能复用父进程的连接池和 presence 标识
+    with app.app_context():
+        db.engine.dispose(close=False)
+    presence.worker_id = uuid.uuid4().hex
+    random.seed()
+
+
+def _prefork(app, host: str, port: int, workers: int):
+    children = {}
+    stopping = []
+
+    def spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _after_fork(app)
+                run_worker(app, host, port + index)
+            except BaseException:
+                logger.exception('worker_crashed')
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = index
+
+    def forward(signum, _frame):
+        stopping.append(signum)
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for index in range(workers):
+        spawn(index)
+
+    while children:
+        try:
+            pid, status = os.waitpid(-1, 0)
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+        # 非主动停止的子进程退出后重新拉起
+        logger.warning('worker_exited', extra={'pid': pid, 'status': status, 'port': port + index})
+        time.sleep(1)
+        spawn(index)
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        upgrade(db.engine)
+        chat_history.warm()
+    log_database_report(app, db)
+
+    host = os.getenv('HOST', '0.0.0.0')
+    port = int(os.getenv('PORT', '5000'))
+    workers = max(app.config['SERVER_WORKERS'], 1)
+    if workers > 1 and not app.config.get('SOCKETIO_MESSAGE_QUEUE'):
+        raise SystemExit('SERVER_WORKERS > 1 requires SOCKETIO_MESSAGE_QUEUE')
+
+    # fork 之前关闭连接池，子进程各自建立连接
+    with app.app_context():
+        db.engine.dispose()
+    if workers == 1:
+        run_worker(app, host, port)
+    else:
+        _prefork(app, host, port, workers)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
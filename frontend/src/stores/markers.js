@@ -0,0 +1,103 @@
+import { defineStore } from 'pinia'
+import axios from 'axios'
+import { io } from 'socket.io-client'
+
+// 连接对象不放进 state，避免被包装成响应式代理
+let socket = null
+
+// 标记的本地副本：首次访问全量加载，之后按修订号拉取增量，并通过 /map 命名空间接收推送
+export const useMarkerStore = defineStore('markers', {
+  state: () => ({
+    markers: [],
+    revision: null,
+    syncing: null,
+    pending: false
+  }),
+
+  actions: {
+    async loadAll() {
+      const response = await axios.get('/api/map/markers')
+      this.markers = response.data.markers
+      this.revision = response.data.revision
+    },
+
+    // 先删除后覆盖：被删除的 id 可能已被新标记复用
+    applyDelta(delta) {
+      const deleted = new Set(delta.deleted)
+      const byId = new Map(this.markers.filter(m => !deleted.has(m.id)).map(m => [m.id, m]))
+      for (const marker of delta.markers) {
+        byId.set(marker.id, marker)
+      }
+      this.markers = Array.from(byId.values())
+      if (delta.revision !== undefined) {
+        this.revision = Math.max(this.revision ?? 0, delta.revision)
+      }
+    },
+
+    sync() {
+      // 同步进行中再次调用时，结束后再补一次，以免漏掉期间的变更
+      if (this.syncing) {
+        this.pending = true
+        return this.syncing
+      }
+      this.syncing = (async () => {
+        do {
+          this.pending = false
+          await this.fetchChanges()
+        } while (this.pending)
+      })().finally(() => {
+        this.syncing = null
+      })
+      return this.syncing
+    },
+
+    async fetchChanges() {
+      if (this.revision === null) {
+        await this.loadAll()
+        return
+      }
+      const response = await axios.get('/api/map/markers', { params: { since: this.revision } })
+      if (response.data.reset) {
+        await this.loadAll()
+      } else {
+        this.applyDelta(response.data)
+      }
+    },
+
+    subscribe() {
+      if (socket) {
+        return
+      }
+      socket = io('http://localhost:5000/map')
+      // 每次（重新）连接后订阅，再用 since 补齐断线期间错过的变更
+      socket.on('connect', () => {
+        socket.emit('subscribe')
+        this.sync().catch(error => console.error('Error syncing markers:', error))
+      })
+      socket.on('markers_changed', (delta) => {
+        if (this.revision !== null && !this.syncing && delta.since === this.revision) {
+          this.applyDelta(delta)
+        } else if (this.revision === null || delta.revision > this.revision) {
+          // 有缺口（漏收推送、加载尚未完成，或批量变更只推送了修订号）时改为拉取增量
+          this.sync().catch(error => console.error('Error syncing markers:', error))
+        }
+      })
+    },
+
+    unsubscribe() {
+      if (socket) {
+        socket.disconnect()
+        socket = null
+      }
+    },
+
+    // 本地操作立即生效；修订号仍以推送或增量为准
+    add(marker) {
+      this.applyDelta({ markers: [marker], deleted: [] })
+    },
+
+    remove(ids) {
+      this.applyDelta({ markers: [], deleted: ids })
+    }
+  }
+})